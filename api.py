@@ -0,0 +1,788 @@
+# Import necessary libraries and modules
+from src.pipelines.ingestionJobs import IngestionJob, IngestionQueue, IngestionQueueFull
+from src.pipelines.completePipeline import Pipeline
+from src.pipelines.chainRegistry import ChainRegistry
+from src.pipelines.jobStore import JobStore
+from src.components.rag.conversationMemory import Conversation, ConversationStore
+from src.utils.exceptions import CustomException
+from src.utils.tracing import metrics, tracer
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.models import isReady, warmUp
+from src.utils.functions import getConfig
+from src.utils.logging import logger
+from dataclasses import dataclass
+from langchain_core.documents import Document
+from typing import Any, AsyncIterator, Callable, Iterable
+from aiohttp import web
+import aiohttp
+import multiprocessing
+import threading
+import argparse
+import asyncio
+import socket
+import json
+import uuid
+import os
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted because its client or the server is saturated."""
+
+@dataclass
+class IngestSource:
+    key: str
+    build: Callable[[IngestionJob], Any]
+    load: Callable[[], Iterable[Document]]
+    stage: str = "documents"
+
+@dataclass
+class ClientState:
+    semaphore: asyncio.Semaphore
+    pending: int = 0
+
+class AdmissionController:
+    def __init__(self, maxConcurrency: int, maxQueued: int, perClientConcurrency: int, perClientQueued: int) -> None:
+        """
+        Initialize an admission controller bounding the requests processed and waiting, overall and per client.
+
+        Args:
+            maxConcurrency (int): The number of requests processed at once.
+            maxQueued (int): The number of requests allowed to wait for processing before new ones are rejected.
+            perClientConcurrency (int): The number of requests of one client processed at once.
+            perClientQueued (int): The number of requests of one client allowed to wait.
+        """
+        self.slots = asyncio.Semaphore(maxConcurrency)
+        self.maxQueued = maxQueued
+        self.perClientConcurrency = perClientConcurrency
+        self.perClientQueued = perClientQueued
+        self.clients: dict[str, ClientState] = {}
+        self.waiting = 0
+
+    async def admit(self, clientId: str, timeout: float) -> None:
+        """
+        Wait for a processing slot for a request, to be given back with release.
+
+        Args:
+            clientId (str): The client sending the request.
+            timeout (float): The longest time to wait, in seconds.
+
+        Raises:
+            Overloaded: If the client or the server already has the maximum of requests waiting.
+            asyncio.TimeoutError: If no slot was free in time.
+        """
+        client = self.clients.setdefault(clientId, ClientState(semaphore=asyncio.Semaphore(self.perClientConcurrency)))
+        if client.pending >= self.perClientConcurrency + self.perClientQueued:
+            raise Overloaded("Too many concurrent requests from this client")
+        if self.slots.locked() and self.waiting >= self.maxQueued:
+            raise Overloaded("The server is saturated")
+        client.pending += 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.acquire(client), timeout=timeout)
+        except BaseException:
+            self.forget(clientId, client)
+            raise
+        finally:
+            self.waiting -= 1
+
+    async def acquire(self, client: ClientState) -> None:
+        """Take a slot of the client, then a slot of the server."""
+        await client.semaphore.acquire()
+        try:
+            await self.slots.acquire()
+        except BaseException:
+            client.semaphore.release()
+            raise
+
+    def release(self, clientId: str) -> None:
+        """Give back the slots of a request admitted with admit."""
+        client = self.clients[clientId]
+        self.slots.release()
+        client.semaphore.release()
+        self.forget(clientId, client)
+
+    def forget(self, clientId: str, client: ClientState) -> None:
+        """Count a request of a client as finished, dropping the client once it has none left."""
+        client.pending -= 1
+        if client.pending == 0:
+            self.clients.pop(clientId, None)
+
+class ApiServer:
+    def __init__(self, pipeline: Pipeline = None, address: str = None) -> None:
+        """
+        Initialize the HTTP API over a pipeline, configured by the [API] section.
+
+        Args:
+            pipeline (Pipeline, optional): The pipeline to serve, e.g. with local models in tests. Built
+                from the configuration when None.
+            address (str, optional): The private "host:port" address of this worker when serving from
+                several workers, sharing its jobs with the others through the job store.
+        """
+        self.config = getConfig(path="config.ini")
+        self.pipeline = pipeline or Pipeline()
+        self.registry = ChainRegistry(
+            maxIndexMB=self.config.getfloat("REGISTRY", "maxIndexMB"),
+            ttlMinutes=self.config.getfloat("REGISTRY", "ttlMinutes"),
+            sizeOf=self.pipeline.indexBytes
+        )  # Holds the persisted indexes reopened for queries
+        self.ingestionQueue = IngestionQueue(
+            workers=self.config.getint("INGESTION", "workers"),
+            maxQueued=self.config.getint("INGESTION", "maxQueued"),
+            keepFinishedMinutes=self.config.getfloat("INGESTION", "keepFinishedMinutes")
+        )
+        self.admission = AdmissionController(
+            maxConcurrency=self.config.getint("API", "maxConcurrency"),
+            maxQueued=self.config.getint("API", "maxQueued"),
+            perClientConcurrency=self.config.getint("API", "perClientConcurrency"),
+            perClientQueued=self.config.getint("API", "perClientQueued")
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.config.getint("API", "maxConcurrency"), thread_name_prefix="api")
+        self.requestTimeout = self.config.getfloat("API", "requestTimeoutSeconds")
+        self.uploadPath = self.config.get("API", "uploadPath")
+        self.jobsBySource: dict[str, IngestionJob] = {}
+        self.collectionJobs: dict[str, IngestionJob] = {}  # The latest job adding to each collection
+        self.conversations = ConversationStore(
+            ttlMinutes=self.config.getfloat("MEMORY", "ttlMinutes"),
+            create=self.pipeline.ragChain.createConversation
+        ) if self.config.getboolean("MEMORY", "enabled") else None
+        self.address = address
+        self.jobSyncSeconds = self.config.getfloat("API", "jobSyncSeconds")
+        self.jobStore = JobStore(
+            path=self.config.get("API", "jobStorePath"),
+            staleSeconds=max(10 * self.jobSyncSeconds, 5)
+        ) if address is not None else None  # Shares the jobs of this worker with the others
+        self.session: aiohttp.ClientSession = None
+
+    def createApp(self) -> web.Application:
+        """
+        Create the aiohttp application.
+
+        Returns:
+            web.Application: The application with every route.
+        """
+        app = web.Application(
+            middlewares=[self.admissionMiddleware],
+            client_max_size=int(self.config.getfloat("API", "maxUploadMB") * 1024 * 1024)
+        )
+        app.add_routes([
+            web.post("/ingest", self.ingest),
+            web.get("/jobs/{jobId}", self.getJob),
+            web.delete("/jobs/{jobId}", self.cancelJob),
+            web.post("/query", self.query),
+            web.post("/query/stream", self.queryStream),
+            web.get("/collections", self.listCollections),
+            web.post("/collections/{name}/documents", self.addToCollection),
+            web.delete("/collections/{name}", self.deleteCollection),
+            web.get("/health", self.health),
+            web.get("/ready", self.ready),
+            web.get("/metrics", self.metrics)
+        ])
+        if self.jobStore is not None:
+            app.cleanup_ctx.append(self.shareJobs)
+        return app
+
+    async def shareJobs(self, app: web.Application) -> AsyncIterator[None]:
+        """Publish the progress of the jobs of this worker every jobSyncSeconds while the application runs."""
+        self.session = aiohttp.ClientSession()
+        task = asyncio.create_task(self.syncJobs())
+        yield
+        task.cancel()
+        await self.session.close()
+
+    async def syncJobs(self) -> None:
+        """Record the jobs of this worker in the job store and cancel those cancelled through other workers."""
+        while True:
+            await asyncio.sleep(self.jobSyncSeconds)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.publishJobs)
+            except Exception as e:
+                logger.error(CustomException(e))
+
+    def publishJobs(self) -> None:
+        """Record the progress of the active jobs of this worker, cancelling those requested by other workers."""
+        jobs = self.ingestionQueue.activeJobs()
+        for job in jobs:
+            self.jobStore.put(job, owner=self.address)
+        for jobId in self.jobStore.getCancelled([job.jobId for job in jobs]):
+            self.ingestionQueue.cancel(jobId)
+        self.jobStore.prune(olderThan=self.ingestionQueue.keepFinished)
+
+    @staticmethod
+    def error(status: int, message: str, **headers: str) -> web.Response:
+        """Build a JSON error response."""
+        return web.json_response({"error": message}, status=status, headers=headers or None)
+
+    @web.middleware
+    async def admissionMiddleware(self, request: web.Request, handler: Callable) -> web.StreamResponse:
+        """
+        Admit a request within its client's and the server's limits and its deadline, rejecting it with 429 when saturated.
+
+        The deadline is the X-Request-Timeout header in seconds, capped by [API] requestTimeoutSeconds.
+        Clients are identified by the X-Client-Id header, or by their address. A request keeps its slots
+        until the blocking work it started has finished, even once answered past its deadline, so that
+        timed-out work counts against the limits until it stops.
+        """
+        if request.path in ("/health", "/ready", "/metrics"):
+            return await handler(request)
+        clientId = request.headers.get("X-Client-Id") or request.remote or "unknown"
+        try:
+            timeout = min(float(request.headers.get("X-Request-Timeout", self.requestTimeout)), self.requestTimeout)
+        except ValueError:
+            return self.error(400, "X-Request-Timeout must be a number of seconds")
+        loop = asyncio.get_running_loop()
+        request["deadline"] = loop.time() + timeout
+        try:
+            await self.admission.admit(clientId, timeout=timeout)
+        except Overloaded as e:
+            self.record(request, 429)
+            return self.error(429, str(e), **{"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            self.record(request, 504)
+            return self.error(504, "The request deadline passed while waiting to be processed")
+        try:
+            response = await handler(request)
+        except asyncio.TimeoutError:
+            response = self.error(504, "The request deadline passed")
+        except web.HTTPException as e:
+            self.record(request, e.status)
+            raise
+        except Exception as e:
+            logger.error(CustomException(e))
+            response = self.error(500, str(e))
+        finally:
+            self.releaseWhenIdle(request, clientId)
+        self.record(request, response.status)
+        return response
+
+    def releaseWhenIdle(self, request: web.Request, clientId: str) -> None:
+        """Give back the slots of a request once the blocking work it started has finished."""
+        pending = [future for future in request.get("work", []) if not future.done()]
+        if not pending:
+            self.admission.release(clientId)
+            return
+        metrics.increment("conversai_api_overrun_total", help="Requests whose blocking work outlived their deadline.")
+        asyncio.gather(*pending, return_exceptions=True).add_done_callback(lambda _: self.admission.release(clientId))
+
+    def startBlocking(self, request: web.Request, function: Callable, *args: Any) -> asyncio.Future:
+        """Run a blocking function on the worker threads, tracking it as work of the request."""
+        future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        request.setdefault("work", []).append(future)
+        return future
+
+    @staticmethod
+    def record(request: web.Request, status: int) -> None:
+        """Count a request by route and status."""
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        metrics.increment("conversai_api_requests_total", {"route": route, "status": str(status)}, help="API requests by route and status.")
+
+    def remaining(self, request: web.Request) -> float:
+        """Return the time left before the deadline of a request, in seconds."""
+        return max(request["deadline"] - asyncio.get_running_loop().time(), 0)
+
+    async def runBlocking(self, request: web.Request, name: str, function: Callable, *args: Any) -> Any:
+        """
+        Run a blocking pipeline call on the worker threads within the deadline of a request.
+
+        The call keeps running in its thread when the deadline passes, holding the admission slots of
+        the request, but its result is dropped.
+
+        Args:
+            request (web.Request): The request.
+            name (str): The name of the span tracing the call.
+            function (Callable): The blocking function.
+            *args (Any): The arguments of the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        def call() -> Any:
+            with tracer.span(name):
+                return function(*args)
+
+        future = self.startBlocking(request, call)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.remaining(request))
+
+    async def readIngestBody(self, request: web.Request) -> dict:
+        """
+        Read the body of an ingest request, saving uploaded PDF files.
+
+        Returns:
+            dict: The JSON body, or the fields of a multipart body with the uploaded files in "paths".
+
+        Raises:
+            ValueError: If the JSON body is invalid or not an object.
+        """
+        if not request.content_type.startswith("multipart/"):
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError("Expected a JSON object")
+            return body
+        body, uploads = {}, []
+        os.makedirs(self.uploadPath, exist_ok=True)
+        try:
+            reader = await request.multipart()
+            while (part := await reader.next()) is not None:
+                if part.filename:
+                    path = os.path.join(self.uploadPath, f"{uuid.uuid4().hex}.pdf")
+                    uploads.append(path)
+                    with open(path, "wb") as file:
+                        while chunk := await part.read_chunk():
+                            file.write(chunk)
+                else:
+                    body[part.name] = await part.text()
+        except BaseException:
+            self.removeUploads(uploads)
+            raise
+        body["paths"] = uploads
+        body["uploads"] = uploads
+        return body
+
+    def getSource(self, body: dict) -> IngestSource:
+        """
+        Resolve the body of an ingest request to its source.
+
+        Args:
+            body (dict): The request body: "type" is "text" with "text", "pdf" with "paths" inside [API] uploadPath
+                and an optional "mode", "web" with "urls", or "youtube" with "urls".
+
+        Returns:
+            IngestSource: The key of the index of the source and the functions building it.
+
+        Raises:
+            ValueError: If the body is invalid.
+        """
+        kind = body.get("type")
+        if kind == "text" and isinstance(body.get("text"), str) and body["text"].strip():
+            text = body["text"]
+            return IngestSource(
+                key=self.pipeline.textSourceKey(text),
+                build=lambda job: self.pipeline.plainText(text=text, job=job),
+                load=lambda: self.pipeline.loadTextDocuments(text)
+            )
+        if kind == "pdf" and body.get("paths"):
+            paths, mode = list(body["paths"]), body.get("mode", "autoPdf")
+            if mode not in ("autoPdf", "searchablePdf", "scannablePdf"):
+                raise ValueError("mode must be autoPdf, searchablePdf or scannablePdf")
+            uploadPath = os.path.realpath(self.uploadPath)
+            outside = [path for path in paths if os.path.commonpath([uploadPath, os.path.realpath(path)]) != uploadPath]
+            if outside:
+                raise ValueError(f"PDF files must be uploaded or placed under {self.uploadPath}: {outside}")
+            missing = [path for path in paths if not os.path.isfile(path)]
+            if missing:
+                raise ValueError(f"PDF files not found: {missing}")
+            return IngestSource(
+                key=self.pipeline.pdfSourceKey(paths=paths, mode=mode),
+                build=lambda job: self.pipeline.pdfChain(paths=paths, mode=mode, job=job),
+                load=lambda: self.pipeline.loadPdfDocuments(paths=paths, mode=mode),
+                stage="pages"
+            )
+        if kind == "web" and body.get("urls"):
+            urls = list(body["urls"])
+            return IngestSource(
+                key=self.pipeline.webSourceKey(urls=urls),
+                build=lambda job: self.pipeline.webCrawl(urls=urls, job=job),
+                load=lambda: self.pipeline.loadUrlDocuments(urls=urls),
+                stage="urls"
+            )
+        if kind == "youtube" and body.get("urls"):
+            urls = list(body["urls"])
+            return IngestSource(
+                key=self.pipeline.youtubeSourceKey(urls=urls),
+                build=lambda job: self.pipeline.youtubeLinks(urls=urls, job=job),
+                load=lambda: self.pipeline.loadYoutubeDocuments(urls=urls),
+                stage="videos"
+            )
+        raise ValueError('Expected "type" text with "text", pdf with "paths", or web or youtube with "urls"')
+
+    async def submitIngestion(self, request: web.Request, name: str, run: Callable[[IngestSource, IngestionJob], Any], fingerprint: Callable[[IngestSource], str]) -> tuple[IngestSource, IngestionJob, web.Response]:
+        """
+        Read an ingest request and queue its job.
+
+        Uploaded files are deleted once the job ends, as indexes are keyed by the file content, or at
+        once when the request fails before a job is queued.
+
+        Args:
+            request (web.Request): The request.
+            name (str): The job name prefix.
+            run (Callable[[IngestSource, IngestionJob], Any]): A function ingesting the source in the job.
+            fingerprint (Callable[[IngestSource], str]): A function returning the fingerprint of the job.
+
+        Returns:
+            tuple[IngestSource, IngestionJob, web.Response]: The source and the job, or an error response.
+        """
+        body, job = {}, None
+        try:
+            try:
+                body = await self.readIngestBody(request)
+                if isinstance(body.get("urls"), str):
+                    body["urls"] = json.loads(body["urls"])
+                source = await self.runBlocking(request, "api.resolve", self.getSource, body)
+            except (ValueError, TypeError) as e:
+                return None, None, self.error(400, str(e))
+            uploads = body.get("uploads", [])
+
+            def runJob(job: IngestionJob) -> Any:
+                try:
+                    return run(source, job)
+                finally:
+                    self.removeUploads(uploads)
+
+            try:
+                job = self.ingestionQueue.submit(name=f"{name}.{body['type']}", run=runJob, fingerprint=fingerprint(source))
+            except IngestionQueueFull as e:
+                return None, None, self.error(429, str(e), **{"Retry-After": "5"})
+            if self.jobStore is not None:
+                await self.runBlocking(request, "api.share", self.jobStore.put, job, self.address)
+                job.whenFinished(lambda job: self.jobStore.put(job, owner=self.address))
+        finally:
+            if job is None:
+                self.removeUploads(body.get("uploads", []))  # No job took ownership of the files
+        self.pruneJobs()
+        return source, job, None
+
+    @staticmethod
+    def removeUploads(paths: list[str]) -> None:
+        """Delete uploaded files, ignoring those already gone."""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def pruneJobs(self) -> None:
+        """Forget the latest jobs of sources and collections once the ingestion queue has pruned them."""
+        for jobs in (self.jobsBySource, self.collectionJobs):
+            for key in [key for key, job in jobs.items() if self.ingestionQueue.get(job.jobId) is None]:
+                del jobs[key]
+
+    async def ingest(self, request: web.Request) -> web.Response:
+        """Queue the ingestion of a source, answering 202 with the job ID and the source key to query."""
+        source, job, error = await self.submitIngestion(request, "api", run=lambda source, job: source.build(job), fingerprint=lambda source: source.key)
+        if error is not None:
+            return error
+        self.jobsBySource[source.key] = job
+        return web.json_response({"jobId": job.jobId, "sourceKey": source.key, "status": job.status}, status=202)
+
+    async def addToCollection(self, request: web.Request) -> web.Response:
+        """Queue the ingestion of a source into a collection, answering 202 with the job ID."""
+        name = request.match_info["name"]
+        try:
+            self.pipeline.ragChain.store.collections.getPath(name)
+        except ValueError as e:
+            return self.error(400, str(e))
+
+        def run(source: IngestSource, job: IngestionJob) -> Any:
+            self.pipeline.addToCollection(name=name, documents=source.load(), job=job, stage=source.stage)
+            return self.pipeline.collectionChain(name)
+
+        source, job, error = await self.submitIngestion(request, "collection", run=run, fingerprint=lambda source: f"{name}/{source.key}")
+        if error is not None:
+            return error
+        self.collectionJobs[name] = job
+        return web.json_response({"jobId": job.jobId, "collection": name, "status": job.status}, status=202)
+
+    async def listCollections(self, request: web.Request) -> web.Response:
+        """List the saved collections."""
+        return web.json_response({"collections": await self.runBlocking(request, "api.collections", self.pipeline.listCollections)})
+
+    async def deleteCollection(self, request: web.Request) -> web.Response:
+        """Delete a collection."""
+        try:
+            deleted = await self.runBlocking(request, "api.collections", self.pipeline.deleteCollection, request.match_info["name"])
+        except ValueError as e:
+            return self.error(400, str(e))
+        return web.json_response({"deleted": deleted}, status=200 if deleted else 404)
+
+    @staticmethod
+    def describeJob(job: IngestionJob) -> dict:
+        """Describe the status and progress of a job."""
+        return {
+            "jobId": job.jobId,
+            "sourceKey": job.fingerprint,
+            "status": job.status,
+            "progress": dict(job.progress),
+            "totals": dict(job.totals),
+            "error": job.error
+        }
+
+    async def findSharedJob(self, request: web.Request) -> dict:
+        """Describe a job of another worker from the job store, or return None."""
+        if self.jobStore is None:
+            return None
+        return await self.runBlocking(request, "api.jobs", self.jobStore.get, request.match_info["jobId"])
+
+    async def getJob(self, request: web.Request) -> web.Response:
+        """Return the status and progress of a job of any worker."""
+        job = self.ingestionQueue.get(request.match_info["jobId"])
+        if job is not None:
+            return web.json_response(self.describeJob(job))
+        described = await self.findSharedJob(request)
+        if described is None:
+            return self.error(404, "Unknown job")
+        return web.json_response(described)
+
+    async def cancelJob(self, request: web.Request) -> web.Response:
+        """Cancel a job of any worker: the worker running it stops it when it next syncs the job store."""
+        job = self.ingestionQueue.get(request.match_info["jobId"])
+        if job is not None:
+            self.ingestionQueue.cancel(job.jobId)
+            return web.json_response(self.describeJob(job))
+        described = await self.findSharedJob(request)
+        if described is None:
+            return self.error(404, "Unknown job")
+        if described["status"] in ("queued", "running"):
+            await self.runBlocking(request, "api.jobs", self.jobStore.requestCancel, described["jobId"])
+        return web.json_response(described)
+
+    async def forwardQuery(self, request: web.Request) -> web.StreamResponse:
+        """
+        Relay a query about a source being ingested by another worker to that worker, which holds its chain.
+
+        Returns:
+            web.StreamResponse: The response of the other worker, or None when this worker answers.
+        """
+        if self.jobStore is None or "X-Forwarded-By" in request.headers:
+            return None
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        sourceKey = body.get("sourceKey") if isinstance(body, dict) else None
+        if not isinstance(sourceKey, str) or sourceKey in self.jobsBySource:
+            return None
+        owner = await self.runBlocking(request, "api.route", self.jobStore.findOwner, sourceKey)
+        if owner is None or owner == self.address:
+            return None
+        return await self.forward(request, owner)
+
+    async def forward(self, request: web.Request, owner: str) -> web.StreamResponse:
+        """
+        Relay a request to another worker and stream its response back.
+
+        Args:
+            request (web.Request): The request.
+            owner (str): The "host:port" address of the worker.
+
+        Returns:
+            web.StreamResponse: The response, or None if the worker could not be reached.
+        """
+        headers = {
+            "Content-Type": request.headers.get("Content-Type", "application/json"),
+            "X-Client-Id": request.headers.get("X-Client-Id") or request.remote or "unknown",
+            "X-Request-Timeout": str(self.remaining(request)),
+            "X-Forwarded-By": self.address
+        }
+        response = None
+        try:
+            async with self.session.request(
+                request.method, f"http://{owner}{request.path_qs}", data=await request.read(), headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.remaining(request))
+            ) as upstream:
+                response = web.StreamResponse(status=upstream.status, headers={"Content-Type": upstream.headers.get("Content-Type", "application/json")})
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+            await response.write_eof()
+            metrics.increment("conversai_api_forwarded_total", help="Queries relayed to the worker ingesting their source.")
+            return response
+        except aiohttp.ClientConnectionError as e:
+            logger.warning(f"Could not reach worker {owner}: {e}")
+            return response  # None when nothing was sent yet, so this worker answers instead
+
+    def getChain(self, sourceKey: str, timeout: float) -> tuple[Any, IngestionJob]:
+        """
+        Return the chain of a source: the one being filled by a job of this worker, or its persisted index.
+
+        Args:
+            sourceKey (str): The source key returned by the ingest endpoint.
+            timeout (float): The longest time to wait for the first chunks of a running job, in seconds.
+
+        Returns:
+            tuple[Any, IngestionJob]: The chain, or None if the source is unknown, and the job of this worker.
+        """
+        job = self.jobsBySource.get(sourceKey)
+        if job is not None and (job.active or job.status == "done"):
+            chain = job.waitUntilQueryable(timeout=timeout)
+            if chain is not None:
+                return chain, job
+        chain = self.registry.getChain(
+            sessionId="api",
+            source=sourceKey,
+            fingerprint=sourceKey,
+            builder=lambda: self.pipeline.ragChain.loadChain(sourceKey=sourceKey)
+        )
+        return chain, job
+
+    async def readQuery(self, request: web.Request) -> tuple[Any, IngestionJob, str, Conversation]:
+        """
+        Read a query request and resolve the chain of its source, or of its collection and metadata filter.
+
+        A request with a "conversationId" continues the conversation of its client with that ID about
+        the same source, or collection and filter.
+
+        Raises:
+            web.HTTPException: With status 400 for an invalid body and 404 for an unknown source or collection.
+        """
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "Expected a JSON body"}), content_type="application/json")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text=json.dumps({"error": "Expected a JSON object"}), content_type="application/json")
+        sourceKey, collection, question = body.get("sourceKey"), body.get("collection"), body.get("question")
+        if not isinstance(sourceKey or collection, str) or not isinstance(question, str) or not question.strip():
+            raise web.HTTPBadRequest(text=json.dumps({"error": 'Expected "sourceKey" or "collection", and "question"'}), content_type="application/json")
+        if collection is None:
+            chain, job = await self.runBlocking(request, "api.resolve", self.getChain, sourceKey, self.remaining(request))
+        else:
+            try:
+                chain = await self.runBlocking(request, "api.resolve", self.pipeline.collectionChain, collection, body.get("filter"))
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=json.dumps({"error": str(e)}), content_type="application/json")
+            job = self.collectionJobs.get(collection)
+        if chain is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "Unknown source or collection, ingest it first"}), content_type="application/json")
+        conversation = None
+        if self.conversations is not None and isinstance(body.get("conversationId"), str):
+            clientId = request.headers.get("X-Client-Id") or request.remote or "unknown"
+            conversation = self.conversations.get(
+                sessionId=f"{clientId}:{body['conversationId']}",
+                source=sourceKey or f"collection:{collection}",
+                fingerprint=json.dumps(body.get("filter"), sort_keys=True)
+            )
+        return chain, job, question, conversation
+
+    async def query(self, request: web.Request) -> web.Response:
+        """Answer a question about an ingested source."""
+        forwarded = await self.forwardQuery(request)
+        if forwarded is not None:
+            return forwarded
+        chain, job, question, conversation = await self.readQuery(request)
+        answer = await self.runBlocking(request, "api.query", self.pipeline.ragChain.answer, chain, question, conversation)
+        response = {"answer": answer}
+        if job is not None and job.active:
+            response["indexing"] = self.describeJob(job)
+        return web.json_response(response)
+
+    async def queryStream(self, request: web.Request) -> web.StreamResponse:
+        """
+        Stream the answer to a question about an ingested source as newline-delimited JSON.
+
+        Each line holds a {"delta": text} token, and the last one {"done": true}, or {"error": message}
+        when the generation failed or the deadline passed.
+        """
+        forwarded = await self.forwardQuery(request)
+        if forwarded is not None:
+            return forwarded
+        chain, job, question, conversation = await self.readQuery(request)
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce() -> None:
+            try:
+                with tracer.span("api.queryStream"):
+                    sent = ""
+                    for text in self.pipeline.ragChain.streamResponse(chain=chain, question=question, conversation=conversation):
+                        if stop.is_set():
+                            return
+                        loop.call_soon_threadsafe(events.put_nowait, {"delta": text[len(sent):]})
+                        sent = text
+                loop.call_soon_threadsafe(events.put_nowait, {"done": True})
+            except Exception as e:
+                logger.error(CustomException(e))
+                loop.call_soon_threadsafe(events.put_nowait, {"error": str(e)})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        self.startBlocking(request, produce)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=self.remaining(request))
+                except asyncio.TimeoutError:
+                    event = {"error": "The request deadline passed"}
+                if event.get("done") and job is not None and job.active:
+                    event["indexing"] = self.describeJob(job)
+                await response.write((json.dumps(event) + "\n").encode("utf-8"))
+                if "delta" not in event:
+                    break
+        finally:
+            stop.set()  # Stops the generation when the client went away or the deadline passed
+        await response.write_eof()
+        return response
+
+    async def health(self, request: web.Request) -> web.Response:
+        """Answer liveness probes."""
+        return web.json_response({"status": "ok"})
+
+    async def ready(self, request: web.Request) -> web.Response:
+        """Answer readiness probes with 200 once the models are loaded and 503 before."""
+        ready = isReady()
+        return web.json_response({"ready": ready}, status=200 if ready else 503)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Serve the metrics of this worker in Prometheus text format."""
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+def runWorker(sock: socket.socket, shared: bool = False) -> None:
+    """
+    Serve the API on a listening socket shared with the other worker processes.
+
+    Args:
+        sock (socket.socket): The listening socket.
+        shared (bool, optional): Whether other workers serve the socket too. The worker then also listens
+            on a private local port, which the others forward queries about its jobs to.
+    """
+    if getConfig(path="config.ini").getboolean("STARTUP", "warmUp"):
+        warmUp()
+    sockets, address = [sock], None
+    if shared:
+        private = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        private.bind(("127.0.0.1", 0))
+        private.listen(1024)
+        sockets.append(private)
+        address = "%s:%d" % private.getsockname()
+    logger.info(f"API worker {os.getpid()} serving on {sock.getsockname()}" + (f" and {address}" if address else ""))
+    web.run_app(ApiServer(address=address).createApp(), sock=sockets, print=None)
+
+def serve(host: str, port: int, workers: int) -> None:
+    """
+    Serve the API from several worker processes accepting connections on one socket.
+
+    Each worker holds its own pipeline and ingestion jobs. Indexes are shared through the index
+    store, and jobs through the job store at [API] jobStorePath: any worker reports the progress of a
+    job and cancels it, and forwards queries about a source being ingested to the worker running its
+    job, which holds the chunks indexed so far.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        workers (int): The number of worker processes.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    if workers <= 1:
+        runWorker(sock)
+        return
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=runWorker, args=(sock, True), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    config = getConfig(path="config.ini")
+    parser = argparse.ArgumentParser(description="Serve the ConversAI HTTP API.")
+    parser.add_argument("--host", default=config.get("API", "host"))
+    parser.add_argument("--port", type=int, default=config.getint("API", "port"))
+    parser.add_argument("--workers", type=int, default=config.getint("API", "workers"))
+    arguments = parser.parse_args()
+    serve(host=arguments.host, port=arguments.port, workers=arguments.workers)
@@ -1,66 +1,240 @@
 # Import necessary libraries and modules
+import time
+startTime = time.perf_counter()  # Startup timings are reported from here
 from src.pipelines.completePipeline import Pipeline
+from src.pipelines.chainRegistry import ChainRegistry
+from src.pipelines.ingestionJobs import IngestionJob, IngestionQueue, IngestionQueueFull
+from src.components.rag.conversationMemory import Conversation, ConversationStore
+from src.utils.functions import getConfig, getFingerprint
+from src.utils.tracing import metrics, tracer, startMetricsServer
+from src.utils.models import isReady, warmUp
+from src.utils.logging import logger
+from typing import Any, Callable, Iterator
 import gradio as gr
+importSeconds = time.perf_counter() - startTime
 
 # Initialize global variables
-chain = None  # Holds the current processing chain
-pipeline = Pipeline()  # Instantiate the processing pipeline
+config = getConfig(path="config.ini")
+pipeline = Pipeline()  # Instantiate the processing pipeline; models are loaded on first use
+registry = ChainRegistry(
+    maxIndexMB=config.getfloat("REGISTRY", "maxIndexMB"),
+    ttlMinutes=config.getfloat("REGISTRY", "ttlMinutes"),
+    sizeOf=pipeline.indexBytes
+)  # Holds the chains built for each session and source
+ingestionQueue = IngestionQueue(
+    workers=config.getint("INGESTION", "workers"),
+    maxQueued=config.getint("INGESTION", "maxQueued"),
+    keepFinishedMinutes=config.getfloat("INGESTION", "keepFinishedMinutes")
+)  # Ingests new sources in the background
+conversations = ConversationStore(
+    ttlMinutes=config.getfloat("MEMORY", "ttlMinutes"),
+    create=pipeline.ragChain.createConversation
+) if config.getboolean("MEMORY", "enabled") else None  # Holds the history of each session's conversation about each source
+tracer.configure(slowRequestSeconds=config.getfloat("METRICS", "slowRequestSeconds"))
+if config.getboolean("METRICS", "enabled"):
+    startMetricsServer(
+        host=config.get("METRICS", "host"),
+        port=config.getint("METRICS", "port"),
+        readiness=isReady
+    )  # Prometheus scrape target and readiness probe
+if config.getboolean("STARTUP", "warmUp"):
+    warmUp()  # Load the models in the background while the interface starts
+setupSeconds = time.perf_counter() - startTime - importSeconds
+metrics.setGauge("conversai_startup_seconds", importSeconds, {"phase": "imports"}, "Time taken by the startup phases in seconds.")
+metrics.setGauge("conversai_startup_seconds", setupSeconds, {"phase": "setup"})
+logger.info(f"Startup took {importSeconds:.2f}s for imports and {setupSeconds:.2f}s for setup")
 
-def getTextResponse(text: str, inputQuery: str) -> str:
+def respond(chain, inputQuery: str, job: IngestionJob = None, conversation: Conversation = None) -> Iterator[str]:
+    """
+    Answer a query with a chain, streaming tokens when enabled in the configuration.
+
+    Args:
+        chain: The processing chain to query.
+        inputQuery (str): The question to be answered.
+        job (IngestionJob, optional): The job ingesting the source of the chain, reported while it runs.
+        conversation (Conversation, optional): The conversation the query follows up on.
+
+    Yields:
+        str: The response generated so far.
+    """
+    if chain is None:
+        yield f"The input could not be processed: {job.error}" if job is not None and job.error else "The input could not be processed."
+        return
+    note = f"\n\n(Answered while indexing is in progress: {job.describe()})" if job is not None and job.active else ""
+    if config.getboolean("LLM", "streaming"):
+        for response in pipeline.ragChain.streamResponse(chain=chain, question=inputQuery, conversation=conversation):
+            yield response + note
+    else:
+        yield pipeline.ragChain.answer(chain=chain, question=inputQuery, conversation=conversation) + note
+
+def respondFromSource(request: gr.Request, source: str, fingerprint: str, builder: Callable[[IngestionJob], Any],
+                      updater: Callable[[Any], None], inputQuery: str) -> Iterator[str]:
+    """
+    Answer a query from the chain of a session and source, ingesting a new source in a background job.
+
+    The query is answered as soon as the first chunks of a new source are indexed, while the job
+    goes on. A job whose input changed before it finished is cancelled and replaced, and the partial
+    chain of a job that failed or was cancelled is rebuilt on the next query. Follow-up
+    queries are answered in the light of the session's conversation about the same input.
+
+    Args:
+        request (gr.Request): The Gradio request identifying the session.
+        source (str): The source of the chain, e.g. "text" or "website".
+        fingerprint (str): A fingerprint of the source input.
+        builder (Callable[[IngestionJob], Any]): A function building the chain within an ingestion job.
+        updater (Callable[[Any], None]): A function bringing an existing chain up to date with the input.
+        inputQuery (str): The question to be answered.
+
+    Yields:
+        str: The response generated so far.
+    """
+    key = (request.session_hash, source)
+    job = ingestionQueue.findByKey(key)
+    if job is not None and job.active and job.fingerprint != fingerprint:
+        ingestionQueue.cancel(job.jobId)  # The input changed while it was being ingested
+        registry.drop(sessionId=request.session_hash, source=source)
+    elif job is not None and not job.active and job.status != "done":
+        registry.drop(sessionId=request.session_hash, source=source)  # Forget the partial chain of a failed or cancelled job
+
+    def refresh(job: IngestionJob) -> None:
+        if job.status == "done":
+            registry.refresh(sessionId=request.session_hash, source=source, chain=job.chain)  # Measure the complete index
+
+    def build():
+        job = ingestionQueue.submit(name=source, run=builder, key=key, fingerprint=fingerprint)
+        job.whenFinished(refresh)
+        return job.waitUntilQueryable()
+
+    try:
+        chain = registry.getChain(
+            sessionId=request.session_hash,
+            source=source,
+            fingerprint=fingerprint,
+            builder=build,
+            updater=updater
+        )
+    except IngestionQueueFull:
+        yield "The server is busy processing other inputs, please try again in a moment."
+        return
+    conversation = conversations.get(sessionId=request.session_hash, source=source, fingerprint=fingerprint) if conversations is not None else None
+    yield from respond(chain=chain, inputQuery=inputQuery, job=ingestionQueue.findByKey(key), conversation=conversation)
+
+@tracer.traced("request.text")
+def getTextResponse(text: str, inputQuery: str, request: gr.Request) -> Iterator[str]:
     """
     Generate a response based on the input text and query.
 
     Args:
         text (str): The input text to process.
         inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
 
-    Returns:
-        str: The response generated from the input text.
+    Yields:
+        str: The response generated so far from the input text.
     """
-    global chain
-    if chain is None:
-        chain = pipeline.plainText(text=text)  # Create a new processing chain for plain text
-    response = chain.invoke({"question": inputQuery})  # Process the query
-    return response
+    yield from respondFromSource(
+        request=request,
+        source="text",
+        fingerprint=getFingerprint(text),
+        builder=lambda job: pipeline.plainText(text=text, job=job),  # Create a new processing chain for plain text
+        updater=lambda chain: pipeline.updateText(chain=chain, text=text),  # Swap the text in the live index
+        inputQuery=inputQuery
+    )  # Process the query
 
-def getSearchablePdfResponse(path: str, inputQuery: str) -> str:
+@tracer.traced("request.autoPdf")
+def getAutoPdfResponse(paths: list[str], inputQuery: str, request: gr.Request) -> Iterator[str]:
+    """
+    Generate a response based on PDFs, searchable, scanned or mixed, and query.
+
+    Args:
+        paths (list[str]): Paths to the PDFs.
+        inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
+
+    Yields:
+        str: The response generated so far from the PDFs.
+    """
+    yield from respondFromSource(
+        request=request,
+        source="autoPdf",
+        fingerprint=getFingerprint(*sorted(paths)),
+        builder=lambda job: pipeline.autoPdf(paths=paths, job=job),  # Create a new processing chain, OCR'ing only pages without text
+        updater=lambda chain: pipeline.updatePdfs(chain=chain, paths=paths, mode="autoPdf"),  # Index only added PDFs
+        inputQuery=inputQuery
+    )
+
+@tracer.traced("request.searchablePdf")
+def getSearchablePdfResponse(path: str, inputQuery: str, request: gr.Request) -> Iterator[str]:
     """
     Generate a response based on a searchable PDF and query.
 
     Args:
         path (str): Path to the searchable PDF.
         inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
 
-    Returns:
-        str: The response generated from the searchable PDF.
+    Yields:
+        str: The response generated so far from the searchable PDF.
     """
-    global chain
-    if chain is None:
-        chain = pipeline.searchablePdf(path=path)  # Create a new processing chain for the PDF
-    response = chain.invoke({"question": inputQuery})
-    return response
+    yield from respondFromSource(
+        request=request,
+        source="searchablePdf",
+        fingerprint=getFingerprint(path),
+        builder=lambda job: pipeline.searchablePdf(path=path, job=job),  # Create a new processing chain for the PDF
+        updater=lambda chain: pipeline.updatePdfs(chain=chain, paths=[path], mode="searchablePdf"),
+        inputQuery=inputQuery
+    )
 
-def getScannablePdfResponse(path: str, inputQuery: str) -> str:
+@tracer.traced("request.scannablePdf")
+def getScannablePdfResponse(path: str, inputQuery: str, request: gr.Request) -> Iterator[str]:
     """
     Generate a response based on a scannable PDF and query.
 
     Args:
         path (str): Path to the scannable PDF.
         inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
 
-    Returns:
-        str: The response generated from the scannable PDF.
+    Yields:
+        str: The response generated so far from the scannable PDF.
     """
-    global chain
-    if chain is None:
-        chain = pipeline.scannablePdf(path=path)  # Create a new processing chain for the scannable PDF
-    response = chain.invoke({"question": inputQuery})
-    return response
+    yield from respondFromSource(
+        request=request,
+        source="scannablePdf",
+        fingerprint=getFingerprint(path),
+        builder=lambda job: pipeline.scannablePdf(path=path, job=job),  # Create a new processing chain for the scannable PDF
+        updater=lambda chain: pipeline.updatePdfs(chain=chain, paths=[path], mode="scannablePdf"),
+        inputQuery=inputQuery
+    )
+
+def releaseSource(sessionId: str, source: str) -> None:
+    """
+    Cancel the ingestion job of a session and source, and release its chain and conversation.
 
-def clearFunction() -> None:
-    """Reset the processing chain to prepare for new queries."""
-    global chain
-    chain = None
+    Args:
+        sessionId (str): The Gradio session hash.
+        source (str): The source to release.
+    """
+    job = ingestionQueue.findByKey((sessionId, source))
+    if job is not None:
+        ingestionQueue.cancel(job.jobId)
+    registry.drop(sessionId=sessionId, source=source)
+    if conversations is not None:
+        conversations.drop(sessionId=sessionId, source=source)
+
+def clearFunction(source: str):
+    """
+    Build a handler releasing the chain of a source for the calling session.
+
+    Args:
+        source (str): The source whose chain is released.
+
+    Returns:
+        Callable: The clear handler for the source.
+    """
+    def clearSource(request: gr.Request) -> None:
+        releaseSource(sessionId=request.session_hash, source=source)
+    return clearSource
 
 # User interface for text input
 with gr.Blocks() as textInterface:
@@ -87,7 +261,25 @@ with gr.Blocks() as textInterface:
         )
     # Define actions for buttons
     submitButton.click(fn=getTextResponse, inputs=[inputText, question], outputs=[answer])
-    clearButton.click(fn=clearFunction)
+    clearButton.click(fn=clearFunction(source="text"))
+
+# User interface for PDF input with automatic OCR fallback
+with gr.Blocks() as autoPdf:
+    with gr.Row():
+        inputFile = gr.File(file_types=[".pdf"], file_count="multiple", label="Select PDFs")
+    with gr.Row():
+        question = gr.Textbox(label="Question", placeholder="Enter your question here")
+        answer = gr.Textbox(label="Response", interactive=False)
+    with gr.Row():
+        submitButton = gr.Button(value="Submit", variant="primary")
+        clearButton = gr.ClearButton(
+            components=[inputFile, question, answer],
+            value="Clear",
+            variant="secondary"
+        )
+    # Define actions for buttons
+    submitButton.click(fn=getAutoPdfResponse, inputs=[inputFile, question], outputs=[answer])
+    clearButton.click(fn=clearFunction(source="autoPdf"))
 
 # User interface for searchable PDF input
 with gr.Blocks() as searchablePdf:
@@ -109,7 +301,7 @@ with gr.Blocks() as searchablePdf:
         )
     # Define actions for buttons
     submitButton.click(fn=getSearchablePdfResponse, inputs=[inputFile, question], outputs=[answer])
-    clearButton.click(fn=clearFunction)
+    clearButton.click(fn=clearFunction(source="searchablePdf"))
 
 # User interface for scannable PDF input
 with gr.Blocks() as scannablePdf:
@@ -127,8 +319,9 @@ with gr.Blocks() as scannablePdf:
         )
     # Define actions for buttons
     submitButton.click(fn=getScannablePdfResponse, inputs=[inputFile, question], outputs=[answer])
-    clearButton.click(fn=clearFunction)
+    clearButton.click(fn=clearFunction(source="scannablePdf"))
 
+@tracer.traced("request.crawl")
 def getLinksButtonFn(baseUrl: str) -> tuple:
     """
     Fetch links from the specified base URL.
@@ -145,27 +338,31 @@ def getLinksButtonFn(baseUrl: str) -> tuple:
     row3 = gr.Row(visible=True)
     return checkboxes, row2, row3
 
-def getWebsiteResponse(links: list[str], inputQuery: str) -> str:
+@tracer.traced("request.website")
+def getWebsiteResponse(links: list[str], inputQuery: str, request: gr.Request) -> Iterator[str]:
     """
     Generate a response based on fetched website links and a query.
 
     Args:
         links (list[str]): List of links to process.
         inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
 
-    Returns:
-        str: The response generated from the website links.
+    Yields:
+        str: The response generated so far from the website links.
     """
-    global chain
-    if chain is None:
-        chain = pipeline.webCrawl(urls=links)  # Create a new processing chain for web crawling
-    response = chain.invoke({"question": inputQuery})
-    return response
+    yield from respondFromSource(
+        request=request,
+        source="website",
+        fingerprint=getFingerprint(*sorted(links)),
+        builder=lambda job: pipeline.webCrawl(urls=links, job=job),  # Create a new processing chain for web crawling
+        updater=lambda chain: pipeline.updateUrls(chain=chain, urls=links),  # Fetch only newly selected links
+        inputQuery=inputQuery
+    )
 
-def clearWebsiteResponse() -> gr.CheckboxGroup:
+def clearWebsiteResponse(request: gr.Request) -> gr.CheckboxGroup:
     """Clear the website response and reset the checkboxes."""
-    global chain
-    chain = None  # Reset the chain
+    releaseSource(sessionId=request.session_hash, source="website")  # Release the chain
     checkboxes = gr.CheckboxGroup(choices=[], label="Fetched Links", visible=False)
     return checkboxes
 
@@ -194,23 +391,28 @@ with gr.Blocks() as websiteCrawler:
     submitButton.click(fn=getWebsiteResponse, inputs=[checkboxes, question], outputs=[answer])
     clearButton.click(fn=clearWebsiteResponse, inputs=None, outputs=[checkboxes])
 
-def getYoutubeResponse(links: str, inputQuery: str) -> str:
+@tracer.traced("request.youtube")
+def getYoutubeResponse(links: str, inputQuery: str, request: gr.Request) -> Iterator[str]:
     """
     Generate a response based on YouTube video links and a query.
 
     Args:
         links (str): Comma-separated YouTube video links.
         inputQuery (str): The question to be answered.
+        request (gr.Request): The Gradio request identifying the session.
 
-    Returns:
-        str: The response generated from the YouTube videos.
+    Yields:
+        str: The response generated so far from the YouTube videos.
     """
-    global chain
     links = [link.strip() for link in links.split(",")]  # Split and clean the links
-    if chain is None:
-        chain = pipeline.youtubeLinks(urls=links)  # Create a new processing chain for YouTube links
-    response = chain.invoke({"question": inputQuery})
-    return response
+    yield from respondFromSource(
+        request=request,
+        source="youtube",
+        fingerprint=getFingerprint(*sorted(links)),
+        builder=lambda job: pipeline.youtubeLinks(urls=links, job=job),  # Create a new processing chain for YouTube links
+        updater=lambda chain: pipeline.updateYoutube(chain=chain, urls=links),  # Fetch only newly added videos
+        inputQuery=inputQuery
+    )
 
 # User interface for YouTube links
 with gr.Blocks() as youtubeInterface:
@@ -231,12 +433,12 @@ with gr.Blocks() as youtubeInterface:
         )
     # Define actions for buttons
     submitButton.click(fn=getYoutubeResponse, inputs=[inputLinks, question], outputs=[answer])
-    clearButton.click(fn=clearFunction)
+    clearButton.click(fn=clearFunction(source="youtube"))
 
 # Create a tabbed interface for the different functionalities
 application = gr.TabbedInterface(
-    [textInterface, searchablePdf, scannablePdf, websiteCrawler, youtubeInterface],
-    ["Text", "Searchable PDF", "Scannable PDF", "Website Text", "Youtube Transcripts"]
+    [textInterface, autoPdf, searchablePdf, scannablePdf, websiteCrawler, youtubeInterface],
+    ["Text", "PDF", "Searchable PDF", "Scannable PDF", "Website Text", "Youtube Transcripts"]
 )
 
 # Launch the Gradio application
@@ -0,0 +1,95 @@
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.language_models import BaseChatModel
+from langchain_core.embeddings import Embeddings
+from typing import Any, Iterator
+import numpy as np
+import hashlib
+import time
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dimensions: int = 384, latency: float = 0.0) -> None:
+        """
+        Initialize deterministic embeddings hashing the words of a text into a fixed number of dimensions.
+
+        Texts sharing words get similar vectors, so retrieval over them behaves like retrieval over
+        real embeddings without downloading a model.
+
+        Args:
+            dimensions (int): The size of the vectors.
+            latency (float): The time spent per embedded text, in seconds, to mimic a model.
+        """
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def embedText(self, text: str) -> list[float]:
+        """Hash the words of a text into a normalized vector."""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed a batch of texts."""
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        return [self.embedText(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query."""
+        return self.embed_documents([text])[0]
+
+class LatencyChatModel(BaseChatModel):
+    """A local chat model answering with canned text after a configurable latency."""
+
+    firstTokenLatency: float = 0.2
+    tokenLatency: float = 0.01
+    answerTokens: int = 64
+
+    @property
+    def _llm_type(self) -> str:
+        """Return the type of the model."""
+        return "latency-fake"
+
+    def answerWords(self, messages: list[BaseMessage]) -> list[str]:
+        """Build a deterministic answer of answerTokens words from the prompt."""
+        words = TOKEN_PATTERN.findall(str(messages[-1].content))[-self.answerTokens:] or ["answer"]
+        return [words[index % len(words)] for index in range(self.answerTokens)]
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        """Return the whole answer after the first token and per-token latencies."""
+        words = self.answerWords(messages)
+        time.sleep(self.firstTokenLatency + self.tokenLatency * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        """Yield the answer word by word, pacing the words by the configured latencies."""
+        time.sleep(self.firstTokenLatency)
+        for index, word in enumerate(self.answerWords(messages)):
+            if index:
+                time.sleep(self.tokenLatency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=("" if index == 0 else " ") + word))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+class FakeOcrReader:
+    def __init__(self, latency: float = 0.05) -> None:
+        """
+        Initialize a stand-in for an EasyOCR reader.
+
+        Args:
+            latency (float): The time spent per image, in seconds, to mimic OCR.
+        """
+        self.latency = latency
+
+    def readtext(self, image, paragraph: bool = False) -> list:
+        """Return one synthetic paragraph in EasyOCR's (box, text) result format."""
+        time.sleep(self.latency)
+        shape = getattr(image, "shape", (0, 0))
+        return [([[0, 0], [shape[1], 0], [shape[1], shape[0]], [0, shape[0]]], f"Scanned page text of size {shape[0]} by {shape[1]} pixels.")]
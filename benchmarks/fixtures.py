@@ -0,0 +1,312 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import hashlib
+import random
+import json
+import math
+import time
+import pymupdf
+import os
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "pa", "do", "gu", "be", "fi", "ho", "ja"]
+
+def makeVocabulary(size: int = 2000, seed: int = 0) -> list[str]:
+    """
+    Build a deterministic vocabulary of pseudo-words.
+
+    Args:
+        size (int): The number of words.
+        seed (int): The random seed.
+
+    Returns:
+        list[str]: The words.
+    """
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def makeParagraphs(index: int, paragraphs: int, vocabulary: list[str]) -> list[str]:
+    """
+    Build the synthetic paragraphs of a page, the first one stating the code of the page's item.
+
+    Args:
+        index (int): The index of the page, which seeds its text.
+        paragraphs (int): The number of paragraphs.
+        vocabulary (list[str]): The words to draw from.
+
+    Returns:
+        list[str]: The paragraphs.
+    """
+    rng = random.Random(index)
+    texts = [f"The code of item {index} is K{index:05d} and it is filed under {rng.choice(vocabulary)}."]
+    for _ in range(paragraphs - 1):
+        texts.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(60, 120))).capitalize() + ".")
+    return texts
+
+def makeQuestions(count: int, items: int, seed: int = 0) -> list[str]:
+    """
+    Build questions about the items of the synthetic corpus.
+
+    Args:
+        count (int): The number of questions.
+        items (int): The number of items in the corpus.
+        seed (int): The random seed.
+
+    Returns:
+        list[str]: The questions.
+    """
+    rng = random.Random(seed)
+    templates = ["What is the code of item {}?", "Under what is item {} filed?", "Tell me about item {}."]
+    return [rng.choice(templates).format(rng.randrange(items)) for _ in range(count)]
+
+class SyntheticSite:
+    def __init__(self, pages: int, fanout: int = 10, paragraphs: int = 8) -> None:
+        """
+        Initialize a synthetic website served from a local HTTP server.
+
+        Page i links to pages i * fanout + 1 to i * fanout + fanout, and is served with an ETag and a
+        Cache-Control max-age so that the crawler's HTTP cache can be exercised.
+
+        Args:
+            pages (int): The number of pages.
+            fanout (int): The number of links per page.
+            paragraphs (int): The number of paragraphs per page.
+        """
+        self.pages = pages
+        self.fanout = fanout
+        self.paragraphs = paragraphs
+        self.vocabulary = makeVocabulary()
+        self.server = None
+        self.requests = 0
+
+    def renderPage(self, index: int) -> bytes:
+        """Render the HTML of a page."""
+        links = "".join(
+            f'<li><a href="/page/{child}">Item {child}</a></li>'
+            for child in range(index * self.fanout + 1, min(index * self.fanout + self.fanout, self.pages - 1) + 1)
+        )
+        body = "".join(f"<p>{text}</p>" for text in makeParagraphs(index, self.paragraphs, self.vocabulary))
+        return f"<html><head><title>Item {index}</title></head><body><h1>Item {index}</h1>{body}<ul>{links}</ul></body></html>".encode("utf-8")
+
+    def start(self) -> str:
+        """
+        Start serving the site on a free local port.
+
+        Returns:
+            str: The URL of the first page.
+        """
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                site.requests += 1
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] != "page" or not parts[1].isdigit() or int(parts[1]) >= site.pages:
+                    self.send_error(404)
+                    return
+                body = site.renderPage(int(parts[1]))
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "max-age=300")
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}/page/0"
+
+    def urls(self) -> list[str]:
+        """Return the URLs of every page."""
+        return [f"http://127.0.0.1:{self.server.server_port}/page/{index}" for index in range(self.pages)]
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+class MockLlmServer:
+    def __init__(self, tokensPerMinute: float = 6000, firstTokenLatency: float = 0.2, tokenLatency: float = 0.005,
+                 answerTokens: int = 64, failureRate: float = 0.0, seed: int = 0) -> None:
+        """
+        Initialize a local stand-in for the Groq chat completions API, simulating latency and rate limits.
+
+        Each model gets its own token bucket of tokensPerMinute, charged with the prompt tokens, at
+        four characters per token, and the max_tokens of each request, as Groq does. Requests over the
+        limit are refused with a 429, a Retry-After and x-ratelimit-* headers; others wait the latencies
+        and answer with canned words, streamed as server-sent events when asked.
+
+        Args:
+            tokensPerMinute (float): The tokens allowed per minute and model.
+            firstTokenLatency (float): Seconds to the first token.
+            tokenLatency (float): Seconds per further token.
+            answerTokens (int): The words per answer.
+            failureRate (float): The share of requests failing with a 503.
+            seed (int): The random seed of the failures.
+        """
+        self.tokensPerMinute = tokensPerMinute
+        self.firstTokenLatency = firstTokenLatency
+        self.tokenLatency = tokenLatency
+        self.answerTokens = answerTokens
+        self.failureRate = failureRate
+        self.random = random.Random(seed)
+        self.buckets: dict[str, tuple[float, float]] = {}  # Tokens left and time of the last refill per model
+        self.lock = threading.Lock()
+        self.server = None
+        self.requests: dict[str, int] = {}
+        self.rateLimited = 0
+        self.failures = 0
+
+    def charge(self, model: str, tokens: float) -> tuple[int, float, float]:
+        """
+        Take tokens from the bucket of a model and decide the status of the request.
+
+        Returns:
+            tuple[int, float, float]: The status, 200, 429 or 503, the tokens left, and the seconds until the
+                tokens would accrue when refused.
+        """
+        rate = self.tokensPerMinute / 60
+        tokens = min(tokens, self.tokensPerMinute)
+        with self.lock:
+            now = time.monotonic()
+            left, updatedAt = self.buckets.get(model, (self.tokensPerMinute, now))
+            left = min(self.tokensPerMinute, left + (now - updatedAt) * rate)
+            if left < tokens:
+                self.buckets[model] = (left, now)
+                self.rateLimited += 1
+                return 429, left, (tokens - left) / rate
+            if self.failureRate and self.random.random() < self.failureRate:
+                self.buckets[model] = (left, now)
+                self.failures += 1
+                return 503, left, 0.0
+            left -= tokens
+            self.buckets[model] = (left, now)
+            self.requests[model] = self.requests.get(model, 0) + 1
+            return 200, left, 0.0
+
+    def start(self) -> str:
+        """
+        Start serving on a free local port.
+
+        Returns:
+            str: The base URL of the API.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def sendJson(self, status: int, payload: dict, headers: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def sendChunk(self, payload: dict) -> None:
+                data = f"data: {json.dumps(payload) if payload is not None else '[DONE]'}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path != "/openai/v1/chat/completions":
+                    self.sendJson(404, {"error": {"message": "Not found"}}, {})
+                    return
+                model = request.get("model", "")
+                prompt = " ".join(str(message.get("content", "")) for message in request.get("messages", []))
+                status, left, seconds = server.charge(model, len(prompt) // 4 + 1 + request.get("max_tokens", server.answerTokens))
+                headers = {
+                    "x-ratelimit-limit-tokens": str(int(server.tokensPerMinute)),
+                    "x-ratelimit-remaining-tokens": str(int(left)),
+                    "x-ratelimit-reset-tokens": f"{(server.tokensPerMinute - left) / server.tokensPerMinute * 60:.3f}s"
+                }
+                if status == 429:
+                    headers["retry-after"] = str(math.ceil(seconds))
+                    self.sendJson(429, {"error": {"message": "Rate limit reached", "type": "tokens"}}, headers)
+                    return
+                if status == 503:
+                    self.sendJson(503, {"error": {"message": "Service unavailable"}}, headers)
+                    return
+                words = prompt.split()[-server.answerTokens:] or ["answer"]
+                words = [words[index % len(words)] for index in range(server.answerTokens)]
+                base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": model}
+                time.sleep(server.firstTokenLatency)
+                if not request.get("stream"):
+                    time.sleep(server.tokenLatency * (len(words) - 1))
+                    usage = {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": len(words), "total_tokens": len(prompt) // 4 + 1 + len(words)}
+                    self.sendJson(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": " ".join(words)}}]}, headers)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                for index, word in enumerate(words):
+                    if index:
+                        time.sleep(server.tokenLatency)
+                    self.sendChunk({**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "finish_reason": None, "delta": {"role": "assistant", "content": ("" if index == 0 else " ") + word}}]})
+                self.sendChunk({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]})
+                self.sendChunk(None)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self) -> None:
+        """Stop the server."""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+def makePdf(path: str, pages: int, scannedEvery: int = 0, paragraphs: int = 6, offset: int = 0) -> str:
+    """
+    Generate a PDF of synthetic pages.
+
+    Args:
+        path (str): The file path to write the PDF to.
+        pages (int): The number of pages.
+        scannedEvery (int): Leave every n-th page without a text layer so that it is OCR'd. Never when 0.
+        paragraphs (int): The number of paragraphs per page.
+        offset (int): The item index of the first page.
+
+    Returns:
+        str: The file path of the PDF.
+    """
+    vocabulary = makeVocabulary()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        if scannedEvery and (number + 1) % scannedEvery == 0:
+            page.draw_rect(pymupdf.Rect(72, 72, 540, 720), color=(0, 0, 0))
+            continue
+        text = "\n\n".join(makeParagraphs(offset + number, paragraphs, vocabulary))
+        page.insert_textbox(pymupdf.Rect(54, 54, 558, 738), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
@@ -0,0 +1,417 @@
+"""
+Offline benchmarks of the ConversAI pipeline.
+
+Every network dependency is replaced by a local stand-in: hashing embeddings instead of the
+HuggingFace model, a chat model with configurable latency instead of Groq, a local HTTP server
+serving a synthetic site, generated PDFs, a fake OCR reader, and a local mock of the Groq API for
+the LLM gateway. Run from the repository root:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json
+"""
+from benchmarks.fixtures import MockLlmServer, SyntheticSite, makePdf, makeQuestions
+from benchmarks.fakes import HashingEmbeddings, LatencyChatModel, FakeOcrReader
+from typing import Any, Callable, Iterable
+import numpy as np
+import configparser
+import subprocess
+import threading
+import tempfile
+import platform
+import argparse
+import shutil
+import json
+import time
+import uuid
+import sys
+import os
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPOSITORY not in sys.path:
+    sys.path.insert(0, REPOSITORY)  # The benchmarks move into a scratch directory before importing src
+
+def currentRss() -> int:
+    """Return the resident memory of the process in bytes, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+class MemorySampler:
+    def __init__(self, interval: float = 0.005) -> None:
+        """
+        Initialize a background sampler of the resident memory of the process.
+
+        Args:
+            interval (float): The time between samples, in seconds.
+        """
+        self.interval = interval
+        self.baseline = currentRss()
+        self.peak = self.baseline
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self) -> None:
+        """Record the peak resident memory until stopped."""
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, currentRss())
+
+    def __enter__(self) -> "MemorySampler":
+        if self.baseline is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+            self.peak = max(self.peak, currentRss())
+
+    def peakGrowthMB(self) -> float:
+        """Return the growth of the resident memory at its peak over its value at start, in megabytes."""
+        return None if self.baseline is None else round((self.peak - self.baseline) / 1024 / 1024, 2)
+
+class StageRecorder:
+    def __init__(self) -> None:
+        """Initialize a recorder of per-stage latency, throughput and memory statistics."""
+        self.results: dict[str, dict] = {}
+
+    def run(self, name: str, items: Iterable, function: Callable[[Any], Any], units: Callable[[Any], int] = None) -> list:
+        """
+        Apply a function to each item, timing every call.
+
+        Args:
+            name (str): The name of the stage.
+            items (Iterable): The items to process, one call each.
+            function (Callable[[Any], Any]): The operation of the stage.
+            units (Callable[[Any], int], optional): The number of units, e.g. chunks, an item counts for in
+                the throughput. Each item counts for one when None.
+
+        Returns:
+            list: The results of the calls, in item order.
+        """
+        items = list(items)
+        latencies, outputs = [], []
+        with MemorySampler() as sampler:
+            start = time.perf_counter()
+            for item in items:
+                callStart = time.perf_counter()
+                outputs.append(function(item))
+                latencies.append(time.perf_counter() - callStart)
+            total = time.perf_counter() - start
+        count = sum(units(item) for item in items) if units else len(items)
+        self.results[name] = {
+            "calls": len(items),
+            "units": count,
+            "totalSeconds": round(total, 4),
+            "throughputPerSecond": round(count / total, 2) if total else None,
+            "p50Ms": round(float(np.percentile(latencies, 50)) * 1000, 3) if latencies else None,
+            "p95Ms": round(float(np.percentile(latencies, 95)) * 1000, 3) if latencies else None,
+            "peakMemoryMB": sampler.peakGrowthMB()
+        }
+        print(f"{name:<24} {self.results[name]}", file=sys.stderr)
+        return outputs
+
+    def measure(self, name: str, function: Callable[[], Any], units: int = 1) -> Any:
+        """Time a single operation as a stage of its own."""
+        return self.run(name, [units], lambda _: function(), units=lambda count: count)[0]
+
+def prepareWorkspace(workspace: str, args: argparse.Namespace) -> None:
+    """
+    Write a benchmark configuration into an empty working directory and move into it.
+
+    The configuration is the repository's with every cache and artifact path pointing into the
+    workspace, so runs are isolated and start cold unless --with-caches is given.
+
+    Args:
+        workspace (str): The working directory.
+        args (argparse.Namespace): The benchmark arguments.
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(os.path.join(REPOSITORY, "config.ini"))
+    overrides = {
+        ("EMBEDDINGS", "embeddingModel"): f"hashing-{args.dimensions}",
+        ("EMBEDDINGCACHE", "enabled"): str(args.with_caches).lower(),
+        ("EMBEDDINGCACHE", "path"): os.path.join(workspace, "embeddingCache.sqlite"),
+        ("INDEXSTORE", "enabled"): "false",
+        ("INDEXSTORE", "path"): os.path.join(workspace, "indexes"),
+        ("COLLECTIONS", "path"): os.path.join(workspace, "collections"),
+        ("ANSWERCACHE", "enabled"): str(args.with_caches).lower(),
+        ("HTTPCACHE", "enabled"): str(args.with_caches).lower(),
+        ("HTTPCACHE", "path"): os.path.join(workspace, "httpCache.sqlite"),
+        ("YOUTUBE", "storePath"): os.path.join(workspace, "transcripts.sqlite"),
+        ("WEBCRAWLER", "maxDepth"): "32",
+        ("WEBCRAWLER", "maxPages"): str(args.pages),
+        ("WEBCRAWLER", "timeout"): "3600",
+        ("EASYOCR", "gpu"): "false",
+        ("BATCH", "tokensPerMinute"): str(args.tokens_per_minute)
+    }
+    for (section, option), value in overrides.items():
+        if config.has_section(section):
+            config.set(section, option, value)
+    with open(os.path.join(workspace, "config.ini"), "w") as file:
+        config.write(file)
+    shutil.copy(os.path.join(REPOSITORY, "params.yaml"), workspace)
+    os.chdir(workspace)
+
+def getRevision() -> str:
+    """Return the git commit of the repository, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPOSITORY, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runStages(args: argparse.Namespace, recorder: StageRecorder, site: SyntheticSite, pdfPaths: list[str]) -> None:
+    """
+    Benchmark each stage of the pipeline in isolation.
+
+    Args:
+        args (argparse.Namespace): The benchmark arguments.
+        recorder (StageRecorder): The recorder of the results.
+        site (SyntheticSite): The running synthetic site.
+        pdfPaths (list[str]): The generated PDFs.
+    """
+    from src.components.loaders.websiteCrawler import WebsiteCrawler
+    from src.components.vectors.numpyIndex import NumpyVectorIndex
+    from src.components.loaders.pdfLoader import PdfLoader
+    from langchain_core.documents import Document
+    from src.utils.functions import cleanText
+    from src.components.rag.RAG import Chain
+    from bs4 import BeautifulSoup
+    import pymupdf
+
+    crawler = WebsiteCrawler()
+    pdfLoader = PdfLoader(reader=FakeOcrReader(latency=args.ocr_latency))
+
+    def loadUrl(url: str) -> str:
+        return BeautifulSoup(crawler.fetchPage(url).body, "html.parser").get_text(separator=" ", strip=True)
+
+    def loadPdfPages(path: str) -> list[str]:
+        texts = []
+        with pymupdf.open(path) as doc:
+            for page in doc:
+                text = page.get_text()
+                if len(text.strip()) < pdfLoader.config.getint("PDFLOADER", "minTextChars"):
+                    text = "\n".join(result[1] for result in pdfLoader.getReader().readtext(pdfLoader.renderPage(page), paragraph=True))
+                texts.append(text)
+        return texts
+
+    rawTexts = recorder.run("load.web", site.urls(), loadUrl)
+    pageCounts = {path: pymupdf.open(path).page_count for path in pdfPaths}
+    for pages in recorder.run("load.pdf", pdfPaths, loadPdfPages, units=pageCounts.get):
+        rawTexts.extend(pages)
+    texts = recorder.run("clean", rawTexts, lambda text: cleanText(text=text))
+
+    chain = Chain(embeddings=HashingEmbeddings(dimensions=args.dimensions, latency=args.embed_latency), llm=LatencyChatModel(
+        firstTokenLatency=args.llm_latency, tokenLatency=args.token_latency, answerTokens=args.answer_tokens))
+    store = chain.store
+    documents = [Document(page_content=text, metadata={"source": str(index)}) for index, text in enumerate(texts)]
+    chunkLists = recorder.run("split", documents, lambda document: store.splitter.split_documents([document]))
+    chunks = [chunk for chunkList in chunkLists for chunk in chunkList]
+
+    batchSize = store.config.getint("VECTORSTORE", "embedBatchSize")
+    batches = [chunks[start:start + batchSize] for start in range(0, len(chunks), batchSize)]
+    vectors = recorder.run("embed", batches, lambda batch: store.vectorEmbeddings.embed_documents([chunk.page_content for chunk in batch]), units=len)
+
+    index = store.createIndex()
+
+    def indexBatch(pair: tuple) -> None:
+        batch, batchVectors = pair
+        if isinstance(index, NumpyVectorIndex):
+            index.addVectors(vectors=batchVectors, texts=[chunk.page_content for chunk in batch],
+                             metadatas=[chunk.metadata for chunk in batch], ids=[str(uuid.uuid4()) for _ in batch])
+        else:
+            index.add_documents(documents=batch)
+
+    recorder.run("index", list(zip(batches, vectors)), indexBatch, units=lambda pair: len(pair[0]))
+
+    retriever = store.createRetriever(index)
+    questions = makeQuestions(args.questions, items=args.pages)
+    contexts = recorder.run("retrieve", questions, retriever.invoke)
+
+    generator = chain.buildGenerator()
+    recorder.run("generate", list(zip(questions, contexts))[:args.llm_questions],
+                 lambda pair: generator.invoke({"context": chain.formatDocs(pair[1]), "question": pair[0]}))
+
+def runEndToEnd(args: argparse.Namespace, recorder: StageRecorder, seedUrl: str, pdfPaths: list[str]) -> None:
+    """
+    Benchmark the Pipeline end to end, as the app drives it.
+
+    Args:
+        args (argparse.Namespace): The benchmark arguments.
+        recorder (StageRecorder): The recorder of the results.
+        seedUrl (str): The URL of the first page of the synthetic site.
+        pdfPaths (list[str]): The generated PDFs.
+    """
+    from src.pipelines.completePipeline import Pipeline
+
+    pipeline = Pipeline(
+        embeddings=HashingEmbeddings(dimensions=args.dimensions, latency=args.embed_latency),
+        llm=LatencyChatModel(firstTokenLatency=args.llm_latency, tokenLatency=args.token_latency, answerTokens=args.answer_tokens),
+        ocrReader=FakeOcrReader(latency=args.ocr_latency)
+    )
+    links = recorder.measure("endToEnd.crawl", lambda: pipeline.webCrawler.getLinks(url=seedUrl), units=args.pages)
+    webChain = recorder.measure("endToEnd.webIndex", lambda: pipeline.webCrawl(urls=links), units=len(links))
+    recorder.measure("endToEnd.pdfIndex", lambda: pipeline.autoPdf(paths=pdfPaths), units=args.pdfs * args.pdf_pages)
+
+    questions = makeQuestions(args.questions, items=args.pages, seed=1)
+    firstTokens = []
+
+    def stream(question: str) -> None:
+        start = time.perf_counter()
+        firstToken = None
+        for _ in pipeline.ragChain.streamResponse(chain=webChain, question=question):
+            if firstToken is None:
+                firstToken = time.perf_counter() - start
+        firstTokens.append(firstToken)
+
+    recorder.run("endToEnd.stream", questions[:args.llm_questions], stream)
+    recorder.results["endToEnd.stream"]["firstTokenP50Ms"] = round(float(np.percentile(firstTokens, 50)) * 1000, 3) if firstTokens else None
+    conversation = pipeline.ragChain.createConversation()
+    recorder.run("endToEnd.conversation", questions[:args.llm_questions],
+                 lambda question: pipeline.ragChain.answer(chain=webChain, question=question, conversation=conversation))
+    recorder.results["endToEnd.conversation"]["historyTokens"] = pipeline.ragChain.estimateTokens(conversation.getHistory())
+    answers = recorder.measure("endToEnd.answerBatch", lambda: pipeline.answerQuestions(chain=webChain, questions=questions), units=len(questions))
+    recorder.results["endToEnd.answerBatch"]["errors"] = sum(answer.error is not None for answer in answers)
+
+def runGateway(args: argparse.Namespace, recorder: StageRecorder) -> None:
+    """
+    Benchmark the LLM gateway on a burst of concurrent calls to a mock Groq API enforcing a token rate limit.
+
+    The gateway starts with rate limits far above the mock's, so that it must learn them from the
+    rate limit headers, and can fall back to a second model with a rate limit of its own.
+
+    Args:
+        args (argparse.Namespace): The benchmark arguments.
+        recorder (StageRecorder): The recorder of the results.
+    """
+    from src.components.rag.llmGateway import LLMGateway, ModelLane
+    from langchain_core.messages import HumanMessage
+    from concurrent.futures import ThreadPoolExecutor
+
+    server = MockLlmServer(tokensPerMinute=args.gateway_tokens_per_minute, firstTokenLatency=args.llm_latency,
+                           tokenLatency=args.token_latency, answerTokens=args.answer_tokens)
+    baseUrl = server.start()
+    os.environ.setdefault("GROQ_API_KEY", "mock")
+
+    def createLane(modelName: str) -> ModelLane:
+        return ModelLane(modelName=modelName, temperature=0.75, maxTokens=args.answer_tokens, tokensPerMinute=1e9,
+                         requestsPerMinute=1e9, maxConnections=args.llm_questions, baseUrl=baseUrl)
+
+    gateway = LLMGateway(primary=createLane("primary"), fallback=createLane("fallback"), retryBaseSeconds=0.1, timeoutSeconds=300)
+    prompts = [[HumanMessage(content=question)] for question in makeQuestions(args.llm_questions, items=args.pages, seed=2)]
+    errors = []
+
+    def generate(messages: list) -> None:
+        try:
+            gateway.generate(messages)
+        except Exception as e:
+            errors.append(e)
+
+    def burst() -> None:
+        with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+            list(executor.map(generate, prompts))
+
+    try:
+        recorder.measure("gateway.burst", burst, units=len(prompts))
+    finally:
+        gateway.close()
+        server.stop()
+    recorder.results["gateway.burst"].update(errors=len(errors), rateLimited=server.rateLimited, requestsByModel=server.requests)
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    List the stages that regressed against a baseline run.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of the baseline run.
+        tolerance (float): The relative slowdown tolerated, e.g. 0.2 for 20%.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for name, stage in results["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            continue
+        if previous.get("p95Ms") and stage["p95Ms"] > previous["p95Ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95Ms']}ms -> {stage['p95Ms']}ms")
+        if previous.get("throughputPerSecond") and stage["throughputPerSecond"] < previous["throughputPerSecond"] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {previous['throughputPerSecond']}/s -> {stage['throughputPerSecond']}/s")
+    return regressions
+
+def parseArgs() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description="Run the offline ConversAI benchmarks.")
+    parser.add_argument("--pages", type=int, default=200, help="Pages of the synthetic website.")
+    parser.add_argument("--pdfs", type=int, default=2, help="Generated PDF files.")
+    parser.add_argument("--pdf-pages", type=int, default=50, help="Pages per generated PDF.")
+    parser.add_argument("--scanned-every", type=int, default=5, help="Leave every n-th PDF page without a text layer.")
+    parser.add_argument("--questions", type=int, default=200, help="Questions retrieved for and answered in batch.")
+    parser.add_argument("--llm-questions", type=int, default=20, help="Questions answered one at a time.")
+    parser.add_argument("--dimensions", type=int, default=384, help="Dimensions of the fake embeddings.")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per text embedded.")
+    parser.add_argument("--ocr-latency", type=float, default=0.05, help="Seconds per page OCR'd.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds to the first LLM token.")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds per further LLM token.")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Tokens per LLM answer.")
+    parser.add_argument("--tokens-per-minute", type=float, default=1e9, help="The [BATCH] token rate limit.")
+    parser.add_argument("--gateway-tokens-per-minute", type=float, default=1200, help="The token rate limit per model of the mock Groq API.")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the embedding, HTTP and answer caches enabled.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--baseline", help="Compare against the JSON results of a previous run.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown tolerated against the baseline.")
+    return parser.parse_args()
+
+def main() -> int:
+    """Run the benchmarks and report the results."""
+    args = parseArgs()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    output = os.path.abspath(args.output) if args.output else None
+    workspace = tempfile.mkdtemp(prefix="conversai-bench-")
+    site = SyntheticSite(pages=args.pages)
+    try:
+        prepareWorkspace(workspace, args)
+        seedUrl = site.start()
+        pdfPaths = [
+            makePdf(os.path.join(workspace, f"document{index}.pdf"), args.pdf_pages, args.scanned_every, offset=index * args.pdf_pages)
+            for index in range(args.pdfs)
+        ]
+        recorder = StageRecorder()
+        runStages(args, recorder, site, pdfPaths)
+        runEndToEnd(args, recorder, seedUrl, pdfPaths)
+        runGateway(args, recorder)
+    finally:
+        site.stop()
+        os.chdir(REPOSITORY)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    results = {
+        "revision": getRevision(),
+        "createdAt": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "stages": recorder.results
+    }
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
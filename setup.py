@@ -13,7 +13,7 @@ setup(
     author="Rauhan Ahmed Siddiqui, Ishwor Subedi",
     author_email="rauhaan.siddiqui@gmail.com, ishworr.subedii@gmail.com",
     version="0.1",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=getRequirements(requirementsPath="requirements.txt"),
     description="ConversAI: An innovative conversational AI framework for intelligent text extraction and querying.",
     long_description=open('README.md').read(),
@@ -0,0 +1,186 @@
+from src.utils.tracing import metrics
+from src.utils.logging import logger
+from dataclasses import dataclass
+import threading
+import sqlite3
+import time
+import os
+
+PAGE_BYTES = "LENGTH(body) + COALESCE(LENGTH(CAST(text AS BLOB)), 0)"  # The size of a stored page, in SQL
+
+@dataclass
+class CachedPage:
+    url: str
+    body: bytes
+    contentType: str
+    etag: str
+    lastModified: str
+    expires: float
+    text: str = None
+
+class HttpCache:
+    def __init__(self, path: str, maxSizeMB: float) -> None:
+        """
+        Initialize an on-disk, size-bounded HTTP cache storing page bodies, validators and extracted text in SQLite.
+
+        Args:
+            path (str): The file path of the SQLite database holding the cache.
+            maxSizeMB (float): The size budget of the stored bodies and texts in megabytes.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.maxBytes = int(maxSizeMB * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, body BLOB NOT NULL, contentType TEXT, etag TEXT, lastModified TEXT, "
+            "expires REAL NOT NULL, text TEXT, lastAccess REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(pages)")]
+        if "lastAccess" not in columns:  # Caches written before pages were evicted
+            self.connection.execute("ALTER TABLE pages ADD COLUMN lastAccess REAL NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idxPagesLastAccess ON pages (lastAccess)")
+        self.connection.commit()
+        self.totalBytes = self.connection.execute(f"SELECT COALESCE(SUM({PAGE_BYTES}), 0) FROM pages").fetchone()[0]
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def getExpiry(headers) -> float:
+        """
+        Compute until when a response is fresh from its Cache-Control header.
+
+        Args:
+            headers: The response headers.
+
+        Returns:
+            float: The expiry timestamp, or None if the response must not be stored.
+        """
+        cacheControl = [directive.strip().lower() for directive in headers.get("Cache-Control", "").split(",")]
+        if "no-store" in cacheControl:
+            return None
+        now = time.time()
+        if "no-cache" in cacheControl:
+            return now
+        for directive in cacheControl:
+            if directive.startswith("max-age="):
+                try:
+                    return now + int(directive.split("=", 1)[1])
+                except ValueError:
+                    return now
+        return now
+
+    def get(self, url: str) -> CachedPage:
+        """
+        Look up a cached page.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            CachedPage: The cached page, or None if the URL is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, body, contentType, etag, lastModified, expires, text FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row:
+                self.connection.execute("UPDATE pages SET lastAccess = ? WHERE url = ?", (time.time(), url))
+                self.connection.commit()
+        return CachedPage(*row) if row else None
+
+    def put(self, page: CachedPage) -> None:
+        """
+        Store a page, replacing any previous version, and evict the least recently used pages beyond the size budget.
+
+        Args:
+            page (CachedPage): The page to store.
+        """
+        with self.lock:
+            self.totalBytes -= self.getBytes(page.url)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (page.url, page.body, page.contentType, page.etag, page.lastModified, page.expires, page.text, time.time())
+            )
+            self.totalBytes += self.getBytes(page.url)
+            self.evict()
+            self.connection.commit()
+
+    def refresh(self, url: str, expires: float) -> None:
+        """
+        Extend the freshness of a page after a successful revalidation.
+
+        Args:
+            url (str): The URL of the page.
+            expires (float): The new expiry timestamp.
+        """
+        with self.lock:
+            self.connection.execute("UPDATE pages SET expires = ? WHERE url = ?", (expires, url))
+            self.connection.commit()
+
+    def setText(self, url: str, text: str) -> None:
+        """
+        Store the clean text extracted from a cached page.
+
+        Args:
+            url (str): The URL of the page.
+            text (str): The extracted text.
+        """
+        with self.lock:
+            self.totalBytes -= self.getBytes(url)
+            self.connection.execute("UPDATE pages SET text = ? WHERE url = ?", (text, url))
+            self.totalBytes += self.getBytes(url)
+            self.evict()
+            self.connection.commit()
+
+    def getBytes(self, url: str) -> int:
+        """Return the size of the body and text of a page, 0 if it is not cached. Expects the lock to be held."""
+        row = self.connection.execute(f"SELECT {PAGE_BYTES} FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else 0
+
+    def evict(self) -> None:
+        """Delete the least recently used pages until the cache fits its budget. Expects the lock to be held."""
+        while self.totalBytes > self.maxBytes:
+            rows = self.connection.execute(
+                f"SELECT url, {PAGE_BYTES} FROM pages ORDER BY lastAccess LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.totalBytes = 0
+                break
+            evicted = []
+            for url, nbytes in rows:
+                if self.totalBytes <= self.maxBytes:
+                    break
+                evicted.append((url,))
+                self.totalBytes -= nbytes
+            self.connection.executemany("DELETE FROM pages WHERE url = ?", evicted)
+            logger.info(f"Evicted {len(evicted)} pages from the HTTP cache")
+
+    def record(self, outcome: str) -> None:
+        """
+        Count the outcome of a lookup.
+
+        Args:
+            outcome (str): One of "hit", "revalidated" or "miss".
+        """
+        with self.lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "revalidated":
+                self.revalidated += 1
+            else:
+                self.misses += 1
+        metrics.increment("conversai_http_cache_total", {"outcome": outcome}, help="HTTP cache lookups by outcome.")
+
+    def stats(self) -> dict:
+        """
+        Return the cache statistics.
+
+        Returns:
+            dict: The number of fresh hits, revalidated pages and misses.
+        """
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
@@ -1,20 +1,39 @@
 from src.utils.functions import cleanText, getConfig
+from langchain_community.docstore.document import Document
 from concurrent.futures import ThreadPoolExecutor
 from src.utils.exceptions import CustomException
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from src.utils.tracing import tracer
+from src.utils.models import ocrReader
 from src.utils.logging import logger
+from typing import Callable, Iterator
 import numpy as np
+import threading
 import pymupdf
-import easyocr
 
 class PdfLoader:
-    def __init__(self) -> None:
+    def __init__(self, reader=None) -> None:
         """
-        Initialize the PdfLoader with configuration settings and an EasyOCR reader.
+        Initialize the PdfLoader with configuration settings.
+
+        The shared EasyOCR reader is loaded on the first OCR'd page, unless a reader is given.
+
+        Args:
+            reader (optional): An object with EasyOCR's readtext method to use instead of an EasyOCR reader.
+        """
+        self.config = getConfig(path="config.ini")
+        self.reader = reader
+
+    def getReader(self):
         """
-        self.config = getConfig(path="config.ini") 
-        self.reader = easyocr.Reader(['en'], gpu=self.config.getboolean("EASYOCR", "gpu"))
+        Return the OCR reader, loading the shared EasyOCR reader if none was given.
 
+        Returns:
+            An object with EasyOCR's readtext method.
+        """
+        return self.reader or ocrReader.get()
+
+    @tracer.traced("pdf.textLayer")
     def extractTextFromPage(self, page) -> str:
         """
         Extract and clean text from a PDF page.
@@ -27,6 +46,27 @@ class PdfLoader:
         """
         return cleanText(text=page.get_text())
 
+    def iterSearchablePages(self, pdfPath: str) -> Iterator[tuple[int, str]]:
+        """
+        Extract text from a searchable PDF page by page, one window of pages at a time.
+
+        Args:
+            pdfPath (str): The file path to the searchable PDF.
+
+        Yields:
+            tuple[int, str]: The page number, starting at 1, and its cleaned text, in page order.
+        """
+        doc = pymupdf.open(pdfPath)
+        windowSize = self.config.getint("EASYOCR", "windowSize")
+        try:
+            with ThreadPoolExecutor() as executor:
+                for first in range(0, len(doc), windowSize):
+                    pages = [doc.load_page(i) for i in range(first, min(first + windowSize, len(doc)))]
+                    for offset, text in enumerate(executor.map(tracer.bind(self.extractTextFromPage), pages)):
+                        yield first + offset + 1, text
+        finally:
+            doc.close()
+
     def searchablePdf(self, pdfPath: str) -> str:
         """
         Extract text from a searchable PDF.
@@ -39,15 +79,11 @@ class PdfLoader:
         """
         try:
             logger.info("Text Extraction Started from Searchable PDF")
-            doc = pymupdf.open(pdfPath)
-            pages = [doc.load_page(i) for i in range(len(doc))]
-            with ThreadPoolExecutor() as executor:
-                texts = list(executor.map(self.extractTextFromPage, pages))
-            doc.close()
-            return "\n".join(texts)
+            return "\n".join(text for _, text in self.iterSearchablePages(pdfPath))
         except Exception as e:
             logger.error(CustomException(e))
 
+    @tracer.traced("pdf.ocr")
     def getText(self, image) -> str:
         """
         Extract and clean text from an image using EasyOCR.
@@ -58,23 +94,210 @@ class PdfLoader:
         Returns:
             str: Cleaned text extracted from the image.
         """
-        text = "\n".join([text[1] for text in self.reader.readtext(np.array(image), paragraph=True)])
+        text = "\n".join([text[1] for text in self.getReader().readtext(np.array(image), paragraph=True)])
         return cleanText(text=text)
 
-    def scannablePdf(self, pdfPath: str) -> str:
+    @tracer.traced("pdf.render")
+    def renderPages(self, pdfPath: str, firstPage: int, lastPage: int) -> list:
+        """
+        Render a window of PDF pages into images.
+
+        Args:
+            pdfPath (str): The file path to the PDF.
+            firstPage (int): The first page of the window, starting at 1.
+            lastPage (int): The last page of the window, inclusive.
+
+        Returns:
+            list: The rendered PIL images, in page order.
+        """
+        return convert_from_path(
+            pdfPath,
+            dpi=self.config.getint("EASYOCR", "dpi"),
+            first_page=firstPage,
+            last_page=lastPage
+        )
+
+    def iterScannablePages(self, pdfPath: str) -> Iterator[tuple[int, str]]:
+        """
+        OCR a scannable PDF page by page.
+
+        Pages are rendered in bounded windows, the next window being rendered while the current one is
+        OCR'd across a pool of workers, so only two windows of images are held in memory at once.
+
+        Args:
+            pdfPath (str): The file path to the scannable PDF.
+
+        Yields:
+            tuple[int, str]: The page number, starting at 1, and its cleaned text, in page order.
+        """
+        totalPages = pdfinfo_from_path(pdfPath)["Pages"]
+        windowSize = self.config.getint("EASYOCR", "windowSize")
+        windows = [(first, min(first + windowSize - 1, totalPages)) for first in range(1, totalPages + 1, windowSize)]
+        renderPages, getText = tracer.bind(self.renderPages), tracer.bind(self.getText)
+        with ThreadPoolExecutor(max_workers=1) as renderer, \
+                ThreadPoolExecutor(max_workers=self.config.getint("EASYOCR", "workers")) as executor:
+            nextImages = renderer.submit(renderPages, pdfPath, *windows[0]) if windows else None
+            for index, (first, last) in enumerate(windows):
+                images = nextImages.result()
+                nextImages = renderer.submit(renderPages, pdfPath, *windows[index + 1]) if index + 1 < len(windows) else None
+                for offset, text in enumerate(executor.map(getText, images)):
+                    yield first + offset, text
+                del images
+                logger.info(f"OCR progress: {last}/{totalPages} pages")
+
+    def scannablePdf(self, pdfPath: str, progressCallback: Callable[[int, int], None] = None) -> str:
         """
         Extract text from a scannable PDF using OCR.
 
         Args:
             pdfPath (str): The file path to the scannable PDF.
+            progressCallback (Callable[[int, int], None], optional): Called with the number of pages
+                done and the total number of pages after each page.
 
         Returns:
             str: All extracted text from the PDF.
         """
         try:
             logger.info("Text Extraction Started from Scannable PDF")
-            allImages = convert_from_path(pdfPath)
-            texts = [self.getText(image) for image in allImages]
+            totalPages = pdfinfo_from_path(pdfPath)["Pages"]
+            texts = []
+            for _, text in self.iterScannablePages(pdfPath):
+                texts.append(text)
+                if progressCallback is not None:
+                    progressCallback(len(texts), totalPages)
             return "\n".join(texts)
         except Exception as e:
-            logger.error(CustomException(e))
\ No newline at end of file
+            logger.error(CustomException(e))
+
+    @tracer.traced("pdf.render")
+    def renderPage(self, page) -> np.ndarray:
+        """
+        Render a PDF page into an image with PyMuPDF.
+
+        Args:
+            page: A PyMuPDF page object.
+
+        Returns:
+            np.ndarray: The rendered page as an RGB image array.
+        """
+        pixmap = page.get_pixmap(dpi=self.config.getint("EASYOCR", "dpi"), colorspace=pymupdf.csRGB, alpha=False)
+        return np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+
+    def iterAutoPages(self, pdfPath: str, onPageDone: Callable[[], None] = None) -> Iterator[tuple[int, str]]:
+        """
+        Extract text from any PDF page by page, running OCR only on pages without a usable text layer.
+
+        Pages whose text layer has fewer than [PDFLOADER] minTextChars characters are rendered with
+        PyMuPDF and OCR'd across a pool of workers, with at most one window of rendered pages pending.
+
+        Args:
+            pdfPath (str): The file path to the PDF.
+            onPageDone (Callable[[], None], optional): Called once the text of each page is extracted,
+                from the OCR workers for OCR'd pages, so possibly out of page order.
+
+        Yields:
+            tuple[int, str]: The page number, starting at 1, and its cleaned text, in page order.
+        """
+        minTextChars = self.config.getint("PDFLOADER", "minTextChars")
+        windowSize = self.config.getint("EASYOCR", "windowSize")
+        doc = pymupdf.open(pdfPath)
+        totalPages = len(doc)
+        ready = {}
+        pending = {}
+        nextPage = 0
+        ocrPages = 0
+        getText = tracer.bind(self.getText)
+        try:
+            with ThreadPoolExecutor(max_workers=self.config.getint("EASYOCR", "workers")) as executor:
+                for number in range(totalPages):
+                    page = doc.load_page(number)
+                    with tracer.span("pdf.textLayer"):
+                        text = page.get_text()
+                    if len(text.strip()) >= minTextChars:
+                        ready[number] = cleanText(text=text)
+                        if onPageDone is not None:
+                            onPageDone()
+                    else:
+                        ocrPages += 1
+                        pending[number] = executor.submit(getText, self.renderPage(page))
+                        if onPageDone is not None:
+                            pending[number].add_done_callback(lambda _: onPageDone())
+                        if len(pending) >= windowSize:
+                            oldest = min(pending)
+                            ready[oldest] = pending.pop(oldest).result()
+                    if nextPage in pending and pending[nextPage].done():
+                        ready[nextPage] = pending.pop(nextPage).result()
+                    while nextPage in ready:
+                        yield nextPage + 1, ready.pop(nextPage)
+                        nextPage += 1
+                for number in sorted(pending):
+                    ready[number] = pending[number].result()
+                while nextPage in ready:
+                    yield nextPage + 1, ready.pop(nextPage)
+                    nextPage += 1
+        finally:
+            doc.close()
+        logger.info(f"PDF pages from text layer: {totalPages - ocrPages}, pages OCR'd: {ocrPages}")
+
+    def autoPdf(self, pdfPath: str, progressCallback: Callable[[int, int], None] = None) -> str:
+        """
+        Extract text from any PDF, running OCR only on pages without a usable text layer.
+
+        Args:
+            pdfPath (str): The file path to the PDF.
+            progressCallback (Callable[[int, int], None], optional): Called with the number of pages
+                done and the total number of pages as each page is read from its text layer or OCR'd.
+
+        Returns:
+            str: All extracted text from the PDF.
+        """
+        try:
+            logger.info("Text Extraction Started from PDF")
+            with pymupdf.open(pdfPath) as doc:
+                totalPages = len(doc)
+            done = 0
+            lock = threading.Lock()
+
+            def onPageDone() -> None:
+                nonlocal done
+                with lock:
+                    done += 1
+                    progressCallback(done, totalPages)
+
+            return "\n".join(text for _, text in self.iterAutoPages(pdfPath, onPageDone if progressCallback is not None else None))
+        except Exception as e:
+            logger.error(CustomException(e))
+
+    @staticmethod
+    def countPages(pdfPath: str) -> int:
+        """
+        Count the pages of a PDF without extracting them.
+
+        Args:
+            pdfPath (str): The file path to the PDF.
+
+        Returns:
+            int: The number of pages.
+        """
+        with pymupdf.open(pdfPath) as doc:
+            return len(doc)
+
+    def loadPages(self, pdfPath: str, mode: str = "autoPdf") -> Iterator[Document]:
+        """
+        Load a PDF incrementally as one document per page.
+
+        Args:
+            pdfPath (str): The file path to the PDF.
+            mode (str): The extraction mode: "searchablePdf", "scannablePdf" or "autoPdf".
+
+        Yields:
+            Document: The text of each page, with its "path" and "page" metadata, in page order.
+        """
+        iterPages = {
+            "searchablePdf": self.iterSearchablePages,
+            "scannablePdf": self.iterScannablePages,
+            "autoPdf": self.iterAutoPages
+        }[mode]
+        logger.info(f"Loading PDF pages ({mode})")
+        for pageNumber, text in iterPages(pdfPath):
+            yield Document(page_content=text, metadata={"path": pdfPath, "page": pageNumber})
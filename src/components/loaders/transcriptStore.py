@@ -0,0 +1,49 @@
+import threading
+import sqlite3
+import time
+import os
+
+class TranscriptStore:
+    def __init__(self, path: str) -> None:
+        """
+        Initialize a persistent store of YouTube transcripts keyed by video ID, backed by SQLite.
+
+        Args:
+            path (str): The file path of the SQLite database holding the transcripts.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (videoId TEXT PRIMARY KEY, text TEXT NOT NULL, fetchedAt REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, videoId: str) -> str:
+        """
+        Look up the transcript of a video.
+
+        Args:
+            videoId (str): The YouTube video ID.
+
+        Returns:
+            str: The stored transcript, or None if the video is unknown.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT text FROM transcripts WHERE videoId = ?", (videoId,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, videoId: str, text: str) -> None:
+        """
+        Store the transcript of a video.
+
+        Args:
+            videoId (str): The YouTube video ID.
+            text (str): The cleaned transcript.
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?)", (videoId, text, time.time()))
+            self.connection.commit()
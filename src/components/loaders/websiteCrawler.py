@@ -1,47 +1,149 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, as_completed
+from langchain_community.docstore.document import Document
 from src.utils.exceptions import CustomException
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlsplit, urlunsplit, urljoin
 from src.utils.functions import getConfig, cleanText
+from src.components.loaders.httpCache import HttpCache, CachedPage
+from requests.adapters import HTTPAdapter
+from src.utils.tracing import tracer
 from src.utils.logging import logger
+from collections import defaultdict
 from bs4 import BeautifulSoup
+from typing import Iterator
+import threading
 import time
 import requests
 
 class WebsiteCrawler:
     def __init__(self):
-        """Initialize the WebsiteCrawler with configuration settings."""
+        """Initialize the WebsiteCrawler with configuration settings and a pooled HTTP session."""
         self.config = getConfig(path="config.ini")
+        self.requestTimeout = self.config.getfloat("WEBCRAWLER", "requestTimeout")
+        self.maxWorkers = self.config.getint("WEBCRAWLER", "maxWorkers")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.maxWorkers, pool_maxsize=self.maxWorkers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.hostLimits = defaultdict(lambda: threading.BoundedSemaphore(self.config.getint("WEBCRAWLER", "perHostConcurrency")))
+        self.hostLimitsLock = threading.Lock()
+        self.cache = HttpCache(
+            path=self.config.get("HTTPCACHE", "path"),
+            maxSizeMB=self.config.getfloat("HTTPCACHE", "maxSizeMB")
+        ) if self.config.getboolean("HTTPCACHE", "enabled") else None
+
+    def normalizeUrl(self, url: str) -> str:
+        """
+        Normalize a URL so that equivalent forms deduplicate to the same string.
 
-    def getLinksFromPage(self, url: str) -> list[str]:
+        Args:
+            url (str): The URL to normalize.
+
+        Returns:
+            str: The URL with a lowercase scheme and host, no default port, no fragment and no trailing slash.
         """
-        Extract all valid links from a given webpage.
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc.lower()
+        if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+            netloc = netloc.rsplit(":", 1)[0]
+        path = parts.path.rstrip("/")
+        return urlunsplit((scheme, netloc, path, parts.query, ""))
+
+    @tracer.traced("web.fetch")
+    def fetch(self, url: str, headers: dict = None) -> requests.Response:
+        """
+        Fetch a URL through the pooled session, respecting the per-host concurrency limit.
 
         Args:
-            url (str): The URL of the webpage to extract links from.
+            url (str): The URL to fetch.
+            headers (dict, optional): Extra request headers.
 
         Returns:
-            list[str]: A list of extracted links from the page.
+            requests.Response: The HTTP response.
+        """
+        with self.hostLimitsLock:
+            hostLimit = self.hostLimits[urlsplit(url).netloc]
+        with hostLimit:
+            return self.session.get(url, headers=headers, timeout=self.requestTimeout)
+
+    def fetchPage(self, url: str) -> CachedPage:
         """
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
-        anchors = soup.find_all("a")
-        links = []
+        Fetch a page through the HTTP cache.
 
-        for anchor in anchors:
-            if "href" in anchor.attrs:
-                if urlparse(anchor.attrs["href"]).netloc == urlparse(url).netloc:
-                    links.append(anchor.attrs["href"])
-                elif not anchor.attrs["href"].startswith(("//", "file", "javascript", "tel", "mailto", "http")):
-                    links.append(urljoin(url + "/", anchor.attrs["href"]))
-                
-                links = [link for link in links if "#" not in link]
-                links = list(set(links))
+        Fresh cached pages are returned without a request, stale ones are revalidated with
+        If-None-Match / If-Modified-Since, and a 304 reuses the cached body and extracted text.
 
-        return links
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            CachedPage: The page, with its extracted text when known.
+        """
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and entry.expires > time.time():
+            self.cache.record("hit")
+            return entry
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.lastModified:
+            headers["If-Modified-Since"] = entry.lastModified
+        response = self.fetch(url, headers=headers)
+        if entry is not None and response.status_code == 304:
+            expires = HttpCache.getExpiry(response.headers)
+            if expires is not None:
+                self.cache.refresh(url, expires)
+            self.cache.record("revalidated")
+            return entry
+        response.raise_for_status()
+        page = CachedPage(
+            url=url,
+            body=response.content,
+            contentType=response.headers.get("Content-Type", "text/html"),
+            etag=response.headers.get("ETag"),
+            lastModified=response.headers.get("Last-Modified"),
+            expires=HttpCache.getExpiry(response.headers)
+        )
+        if self.cache is not None:
+            self.cache.record("miss")
+            if page.expires is not None:
+                self.cache.put(page)
+        return page
+
+    def getLinksFromPage(self, url: str) -> list[str]:
+        """
+        Extract all valid links from a given webpage.
 
+        Args:
+            url (str): The URL of the webpage to extract links from.
+
+        Returns:
+            list[str]: A list of normalized links to pages on the same host.
+        """
+        page = self.fetchPage(url)
+        if "html" not in (page.contentType or "text/html"):
+            return []
+        soup = BeautifulSoup(page.body, "html.parser")
+        host = urlsplit(url).netloc.lower()
+        links = set()
+
+        for anchor in soup.find_all("a", href=True):
+            href = anchor.attrs["href"].strip()
+            if href.startswith("#"):
+                continue  # Links within the page; other schemes are rejected below
+            link = urljoin(url, href)
+            if urlsplit(link).scheme in ("http", "https") and urlsplit(link).netloc.lower() == host:
+                links.add(self.normalizeUrl(link))
+
+        return list(links)
+
+    @tracer.traced("web.crawl")
     def getLinks(self, url: str) -> list[str]:
         """
-        Fetch and return all unique links found from the given URL.
+        Crawl the website breadth-first from the given URL and return the unique links found.
+
+        Pages of each depth level are fetched concurrently. The crawl stops at [WEBCRAWLER] maxDepth
+        levels, maxPages links or after timeout seconds, whichever comes first.
 
         Args:
             url (str): The starting URL to fetch links from.
@@ -51,23 +153,43 @@ class WebsiteCrawler:
         """
         try:
             logger.info("Fetching links from URL")
-            start = time.time()
-            links = self.getLinksFromPage(url)
-            uniqueLinks = set()
-
-            for link in links:
-                now = time.time()
-                if now - start > self.config.getint("WEBCRAWLER", "timeout"):
-                    break
-                uniqueLinks = uniqueLinks.union(set(self.getLinksFromPage(link)))
-
-            return list(set([x[:-1] if x[-1] == "/" else x for x in uniqueLinks]))
+            deadline = time.time() + self.config.getint("WEBCRAWLER", "timeout")
+            maxPages = self.config.getint("WEBCRAWLER", "maxPages")
+            seed = self.normalizeUrl(url)
+            seen = {seed}
+            level = [seed]
+
+            getLinksFromPage = tracer.bind(self.getLinksFromPage)
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                for depth in range(self.config.getint("WEBCRAWLER", "maxDepth")):
+                    nextLevel = []
+                    pending = {executor.submit(getLinksFromPage, link) for link in level}
+                    while pending and time.time() < deadline:
+                        done, pending = wait(pending, timeout=deadline - time.time(), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            if future.exception() is not None:
+                                logger.warning(f"Failed to fetch a page while crawling: {future.exception()}")
+                                continue
+                            for link in future.result():
+                                if link not in seen and len(seen) < maxPages:
+                                    seen.add(link)
+                                    nextLevel.append(link)
+                    for future in pending:
+                        future.cancel()
+                    if time.time() >= deadline or len(seen) >= maxPages or not nextLevel:
+                        break
+                    level = nextLevel
+
+            logger.info(f"Found {len(seen)} links")
+            if self.cache is not None:
+                logger.info(f"HTTP cache: {self.cache.stats()}")
+            return list(seen)
         except Exception as e:
             logger.error(CustomException(e))
 
     def extractTextFromUrl(self, url: str) -> str:
         """
-        Extract and clean text content from a given URL.
+        Extract and clean text content from a given URL, reusing the cached text of unchanged pages.
 
         Args:
             url (str): The URL of the webpage to extract text from.
@@ -75,11 +197,15 @@ class WebsiteCrawler:
         Returns:
             str: Cleaned text extracted from the webpage.
         """
-        response = requests.get(url)
-        response.raise_for_status()
-        html = response.text
-        soup = BeautifulSoup(html, 'html.parser')
-        return cleanText(text=soup.get_text(separator=' ', strip=True))
+        page = self.fetchPage(url)
+        if page.text is not None:
+            return page.text
+        with tracer.span("web.extract"):
+            soup = BeautifulSoup(page.body, 'html.parser')
+            text = cleanText(text=soup.get_text(separator=' ', strip=True))
+        if self.cache is not None and page.expires is not None:
+            self.cache.setText(url, text)
+        return text
 
     def extractTextFromUrlList(self, urls: list[str]) -> str:
         """
@@ -93,8 +219,34 @@ class WebsiteCrawler:
         """
         try:
             logger.info("Extracting text from URLs")
-            with ThreadPoolExecutor() as executor:
-                texts = list(executor.map(self.extractTextFromUrl, urls))
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                texts = list(executor.map(tracer.bind(self.extractTextFromUrl), urls))
+            if self.cache is not None:
+                logger.info(f"HTTP cache: {self.cache.stats()}")
             return "\n".join(texts)
         except Exception as e:
-            logger.error(CustomException(e))
\ No newline at end of file
+            logger.error(CustomException(e))
+
+    def loadUrls(self, urls: list[str]) -> Iterator[Document]:
+        """
+        Load web pages concurrently, yielding each page as soon as it is extracted.
+
+        Pages that fail to load are logged and skipped.
+
+        Args:
+            urls (list[str]): A list of URLs to extract text from.
+
+        Yields:
+            Document: The text of each page with its normalized "url" metadata, in completion order.
+        """
+        logger.info("Extracting text from URLs")
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            extractTextFromUrl = tracer.bind(self.extractTextFromUrl)
+            futures = {executor.submit(extractTextFromUrl, url): url for url in urls}
+            for future in as_completed(futures):
+                try:
+                    yield Document(page_content=future.result(), metadata={"url": self.normalizeUrl(futures[future])})
+                except Exception as e:
+                    logger.error(CustomException(e))
+        if self.cache is not None:
+            logger.info(f"HTTP cache: {self.cache.stats()}")
@@ -1,31 +1,152 @@
 from langchain_community.document_loaders import YoutubeLoader
+from src.components.loaders.transcriptStore import TranscriptStore
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_community.docstore.document import Document
 from src.utils.exceptions import CustomException
-from src.utils.functions import cleanText
+from src.utils.functions import cleanText, getConfig
+from urllib.parse import urlsplit, parse_qs
+from src.utils.tracing import tracer
 from src.utils.logging import logger
+from dataclasses import dataclass
+from typing import Iterator
+import re
+
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+@dataclass
+class TranscriptResult:
+    videoId: str
+    text: str = ""
+    error: str = None
 
 class YoutubeTranscriptLoader:
     def __init__(self):
-        """Initialize the YoutubeTranscriptLoader."""
-        pass
-        
-    def getTranscripts(self, urls: str) -> str:
+        """Initialize the YoutubeTranscriptLoader with configuration settings and a transcript store."""
+        self.config = getConfig(path="config.ini")
+        self.store = TranscriptStore(path=self.config.get("YOUTUBE", "storePath"))
+
+    def getVideoId(self, url: str) -> str:
+        """
+        Extract the video ID from any common form of YouTube URL.
+
+        Handles youtu.be links, watch?v= links, shorts, embed and live links, extra query
+        parameters and bare video IDs.
+
+        Args:
+            url (str): The YouTube URL or video ID.
+
+        Returns:
+            str: The video ID, or None if the URL is not recognised.
+        """
+        url = url.strip()
+        if VIDEO_ID_PATTERN.match(url):
+            return url
+        parts = urlsplit(url if "//" in url else "https://" + url)
+        host = parts.netloc.lower()
+        segments = [segment for segment in parts.path.split("/") if segment]
+        candidate = None
+        if host.endswith("youtu.be") and segments:
+            candidate = segments[0]
+        elif "youtube" in host:
+            if "v" in parse_qs(parts.query):
+                candidate = parse_qs(parts.query)["v"][0]
+            elif len(segments) > 1 and segments[0] in ("shorts", "embed", "live", "v"):
+                candidate = segments[1]
+        return candidate if candidate and VIDEO_ID_PATTERN.match(candidate) else None
+
+    @tracer.traced("youtube.fetch")
+    def fetchTranscript(self, videoId: str) -> TranscriptResult:
+        """
+        Fetch the transcript of a video, from the transcript store when already known.
+
+        Args:
+            videoId (str): The YouTube video ID.
+
+        Returns:
+            TranscriptResult: The cleaned transcript, or the error that prevented fetching it. Videos without
+                a transcript, e.g. with transcripts disabled, are failures and are not stored, so they are
+                fetched again next time.
+        """
+        text = self.store.get(videoId)
+        if text:
+            return TranscriptResult(videoId=videoId, text=text)
+        try:
+            loader = YoutubeLoader(videoId, add_video_info=False)
+            text = cleanText(text=" ".join([x.page_content for x in loader.load()]))
+            if not text.strip():
+                return TranscriptResult(videoId=videoId, error="no transcript available")
+            self.store.put(videoId, text)
+            return TranscriptResult(videoId=videoId, text=text)
+        except Exception as e:
+            logger.error(CustomException(e))
+            return TranscriptResult(videoId=videoId, error=str(e))
+
+    def fetchTranscripts(self, urls: list[str]) -> list[TranscriptResult]:
+        """
+        Fetch the transcripts of several videos concurrently, one result per distinct video.
+
+        Args:
+            urls (list[str]): YouTube URLs in any form.
+
+        Returns:
+            list[TranscriptResult]: The transcript or error of each video, in order of first appearance.
+        """
+        videoIds = {}
+        for url in urls:
+            videoId = self.getVideoId(url)
+            videoIds.setdefault(videoId or url, videoId is not None)  # Unrecognised URLs are kept as failures
+        fetchTranscript = tracer.bind(self.fetchTranscript)
+        with ThreadPoolExecutor(max_workers=self.config.getint("YOUTUBE", "maxWorkers")) as executor:
+            futures = [
+                executor.submit(fetchTranscript, videoId) if valid else None
+                for videoId, valid in videoIds.items()
+            ]
+        return [
+            future.result() if future is not None else TranscriptResult(videoId=videoId, error="Could not determine the video ID")
+            for videoId, future in zip(videoIds, futures)
+        ]
+
+    def getTranscripts(self, urls: list[str]) -> str:
         """
         Retrieve transcripts from a list of YouTube URLs.
 
         Args:
-            urls (str): Comma-separated YouTube URLs to fetch transcripts from.
+            urls (list[str]): YouTube URLs to fetch transcripts from.
 
         Returns:
             str: Combined transcripts cleaned and joined by newlines.
         """
-        texts = []
-        for url in set(urls):
-            try:
-                loader = YoutubeLoader.from_youtube_url(url, add_video_info=False)
-                doc = " ".join([x.page_content for x in loader.load()])
-                texts.append(cleanText(text=doc))
-            except Exception as e:
-                logger.error(CustomException(e))
-                texts.append("")  # Append an empty string on error
-                
-        return "\n".join(texts)
\ No newline at end of file
+        results = self.fetchTranscripts(urls=urls)
+        failures = [result for result in results if result.error is not None]
+        for result in failures:
+            logger.warning(f"No transcript for video '{result.videoId}': {result.error}")
+        logger.info(f"Fetched {len(results) - len(failures)} transcripts, {len(failures)} failed")
+        return "\n".join([result.text for result in results if result.error is None])
+
+    def loadTranscripts(self, urls: list[str]) -> Iterator[Document]:
+        """
+        Load transcripts concurrently, yielding each one as soon as it is available.
+
+        Videos without a transcript are logged and skipped.
+
+        Args:
+            urls (list[str]): YouTube URLs in any form.
+
+        Yields:
+            Document: The transcript of each video with its "videoId" metadata, in completion order.
+        """
+        videoIds = {}
+        for url in urls:
+            videoId = self.getVideoId(url)
+            if videoId is None:
+                logger.warning(f"No transcript for video '{url}': Could not determine the video ID")
+            else:
+                videoIds[videoId] = True
+        fetchTranscript = tracer.bind(self.fetchTranscript)
+        with ThreadPoolExecutor(max_workers=self.config.getint("YOUTUBE", "maxWorkers")) as executor:
+            for future in as_completed([executor.submit(fetchTranscript, videoId) for videoId in videoIds]):
+                result = future.result()
+                if result.error is not None:
+                    logger.warning(f"No transcript for video '{result.videoId}': {result.error}")
+                else:
+                    yield Document(page_content=result.text, metadata={"videoId": result.videoId})
@@ -1,61 +1,400 @@
 from src.components.vectors.vectorstore import VectorStore
+from src.components.rag.conversationMemory import Conversation
+from src.components.rag.contextPacker import ContextPacker
+from src.components.rag.answerCache import AnswerCache
+from src.components.rag.llmGateway import GatewayChatModel
+from src.components.vectors.hybridRetriever import HybridRetriever
+from src.components.vectors.numpyIndex import NumpyVectorIndex
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableLambda
+from langchain_core.retrievers import BaseRetriever
 from src.utils.exceptions import CustomException
-from src.utils.functions import getConfig, loadYaml
+from src.utils.functions import getConfig, getFingerprint, loadYaml
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.rateLimiter import TokenBucket
+from src.utils.tracing import TracingCallbackHandler, tracer
+from src.utils.models import llmGateway
 from src.utils.logging import logger
 from langchain_groq import ChatGroq
+from typing import Callable, Iterator
+from dataclasses import dataclass
+import numpy as np
+import threading
+import time
+
+NO_HISTORY = "No previous conversation."
+
+@dataclass
+class BatchAnswer:
+    question: str
+    answer: str = None
+    error: str = None
 
 class Chain:
-    def __init__(self):
-        """Initialize the Chain with configuration and prompt template."""
+    def __init__(self, embeddings: Embeddings = None, llm: BaseChatModel = None):
+        """
+        Initialize the Chain with configuration and prompt template.
+
+        Args:
+            embeddings (Embeddings, optional): The embedding model to use instead of the [EMBEDDINGS] model.
+            llm (BaseChatModel, optional): The chat model to use instead of the [LLM] Groq model, called
+                through the process-wide gateway when [LLMGATEWAY] is enabled.
+        """
         self.config = getConfig(path="config.ini")
-        self.store = VectorStore()
-        prompt = loadYaml(path="params.yaml")["prompt"]
-        self.prompt = ChatPromptTemplate.from_template(prompt)
+        self.store = VectorStore(embeddings=embeddings)
+        self.llm = llm
+        params = loadYaml(path="params.yaml")
+        prompt = params["prompt"]
+        self.prompt = ChatPromptTemplate.from_template(prompt).partial(history=NO_HISTORY)
+        self.rewritePrompt = ChatPromptTemplate.from_template(params["rewritePrompt"])
+        self.summaryPrompt = ChatPromptTemplate.from_template(params["summaryPrompt"])
+        self.answerCache = AnswerCache(
+            threshold=self.config.getfloat("ANSWERCACHE", "threshold"),
+            ttlMinutes=self.config.getfloat("ANSWERCACHE", "ttlMinutes"),
+            maxEntries=self.config.getint("ANSWERCACHE", "maxEntries"),
+            waitSeconds=self.config.getfloat("ANSWERCACHE", "waitSeconds")
+        ) if self.config.getboolean("ANSWERCACHE", "enabled") else None
+        self.contextPacker = ContextPacker(
+            maxTokens=self.config.getint("LLM", "contextTokens"),
+            countTokens=self.estimateTokens
+        )
+        self.settingsFingerprint = getFingerprint(
+            prompt,
+            *(self.config.get("LLM", option) for option in ("llmModel", "maxTokens", "temperature", "contextTokens")),
+            *(f"{option}={value}" for option, value in self.config.items("RETRIEVER"))
+        )
 
     def formatDocs(self, docs) -> str:
         """
-        Format a list of documents into a single string.
+        Format a list of documents into a single context string within the [LLM] contextTokens budget.
+
+        Overlapping chunks of the same document are merged and duplicates dropped before packing.
 
         Args:
-            docs: A list of documents to format.
+            docs: A list of documents to format, most relevant first.
 
         Returns:
             str: Formatted string with documents or a placeholder if empty.
         """
-        context = ""
-        for doc in docs:
-            context += f"{doc}\n\n\n"
-        if context == "":
-            context = "No Context Found"
+        return self.contextPacker.pack(docs) or "No Context Found"
+
+    def getLlm(self) -> BaseChatModel:
+        """Return the chat model of the chains: the injected one, or the [LLM] model, through the gateway when enabled."""
+        if self.llm is not None:
+            llm = self.llm
+        elif self.config.getboolean("LLMGATEWAY", "enabled"):
+            llm = GatewayChatModel(gateway=llmGateway.get())
         else:
-            pass
-        return context
+            llm = ChatGroq(model_name=self.config.get("LLM", "llmModel"),
+                           temperature=self.config.getfloat("LLM", "temperature"),
+                           max_tokens=self.config.getint("LLM", "maxTokens"))
+        return llm
+
+    def buildGenerator(self):
+        """
+        Build the part of the chain generating an answer from a context and a question.
 
-    def returnChain(self, text: str):
+        Returns:
+            Chain: A chain taking "context", "question" and optionally "history" and returning the answer text.
+        """
+        return self.prompt | self.getLlm() | StrOutputParser()
+
+    def buildChain(self, retriever):
         """
-        Create and return a processing chain based on the input text.
+        Build the processing chain answering questions from a retriever.
 
         Args:
-            text (str): Input text to prepare the chain.
+            retriever: The retriever providing the context.
+
+        Returns:
+            Chain: Configured chain taking a "question" and optionally the conversation "history".
+        """
+        return (
+            {"context": RunnableLambda(lambda x: x["question"]) | retriever | RunnableLambda(self.formatDocs),
+             "question": RunnableLambda(lambda x: x["question"]),
+             "history": RunnableLambda(lambda x: x.get("history") or NO_HISTORY)}
+            | self.buildGenerator()
+        )
+
+    @tracer.traced("chain.build")
+    def returnChain(self, text: str = None, sourceKey: str = None, documents: list = None,
+                    onChain: Callable = None, onBatch: Callable[[int], None] = None, cancel: threading.Event = None):
+        """
+        Create and return a processing chain based on the input text or documents.
+
+        Args:
+            text (str, optional): Input text to prepare the chain.
+            sourceKey (str, optional): The fingerprint of the source of the text, used to persist its index.
+            documents (list, optional): Documents tagged with their source to prepare the chain from instead.
+            onChain (Callable, optional): Called with the chain before its index is filled, so that it can
+                answer from the chunks ingested so far.
+            onBatch (Callable[[int], None], optional): Called with the number of chunks of each batch once indexed.
+            cancel (threading.Event, optional): Stops the ingestion when set.
 
         Returns:
             Chain: Configured chain for processing input.
         """
         try:
             logger.info("Preparing chain")
-            store = self.store.setupStore(text=text)
-            chain = (
-                {"context": RunnableLambda(lambda x: x["question"]) | store | RunnableLambda(self.formatDocs),
-                 "question": RunnableLambda(lambda x: x["question"])}
-                | self.prompt
-                | ChatGroq(model_name=self.config.get("LLM", "llmModel"),
-                           temperature=self.config.getfloat("LLM", "temperature"),
-                           max_tokens=self.config.getint("LLM", "maxTokens"))
-                | StrOutputParser()
+            store = self.store.setupStore(
+                text=text, sourceKey=sourceKey, documents=documents,
+                onRetriever=(lambda retriever: onChain(self.buildChain(retriever=retriever))) if onChain is not None else None,
+                onBatch=onBatch, cancel=cancel
             )
-            return chain
+            return self.buildChain(retriever=store)
         except Exception as e:
-            logger.error(CustomException(e))
\ No newline at end of file
+            logger.error(CustomException(e))
+
+    def loadChain(self, sourceKey: str):
+        """
+        Create a processing chain over the persisted index of a source.
+
+        Args:
+            sourceKey (str): The fingerprint of the indexed source.
+
+        Returns:
+            Chain: Configured chain for processing input, or None if the source has no persisted index.
+        """
+        store = self.store.loadStore(sourceKey=sourceKey)
+        return self.buildChain(retriever=store) if store is not None else None
+
+    def getCacheNamespace(self, chain) -> str:
+        """
+        Return the answer cache namespace of a chain.
+
+        Args:
+            chain: A chain returned by returnChain.
+
+        Returns:
+            str: A fingerprint of the content of the chain's index and of the prompt, LLM and retriever settings.
+        """
+        return getFingerprint(self.store.getIndexFingerprint(self.getRetriever(chain)), self.settingsFingerprint)
+
+    def cachedResponse(self, chain, question: str, generate: Callable[[], Iterator[str]], embedding: list[float] = None) -> Iterator[str]:
+        """
+        Serve an answer through the answer cache when it is enabled.
+
+        The question is only embedded when it is not cached as is, and not when the retriever answers
+        it from the lexical index alone, in which case only the same question can hit its answer. On a
+        miss, retrieval reuses that embedding.
+
+        Args:
+            chain: A chain returned by returnChain.
+            question (str): The question to be answered.
+            generate (Callable[[], Iterator[str]]): A function yielding the answer generated so far by the chain.
+            embedding (list[float], optional): The embedding of the question, computed when needed if missing.
+
+        Yields:
+            str: The response generated so far.
+        """
+        if self.answerCache is None:
+            yield from generate()
+            return
+        retriever = self.getRetriever(chain)
+
+        def getVector() -> np.ndarray:
+            if embedding is not None:
+                vector = np.asarray(embedding, dtype=np.float32)
+            elif isinstance(retriever, HybridRetriever) and retriever.skipsEmbedding(question):
+                return None
+            else:
+                raw = self.store.vectorEmbeddings.embed_query(question)
+                if isinstance(getattr(retriever, "vectorstore", None), NumpyVectorIndex):
+                    retriever.vectorstore.rememberQuery(question, raw)  # Retrieval on a miss reuses it
+                vector = np.asarray(raw, dtype=np.float32)
+            return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+        yield from self.answerCache.serve(self.getCacheNamespace(chain), question, getVector, generate)
+
+    def createConversation(self) -> Conversation:
+        """Create an empty conversation with the [MEMORY] history budget."""
+        return Conversation(
+            maxTokens=self.config.getint("MEMORY", "historyTokens"),
+            keepTurns=self.config.getint("MEMORY", "keepTurns"),
+            countTokens=self.estimateTokens
+        )
+
+    def prepareQuestion(self, question: str, conversation: Conversation = None) -> tuple[str, str]:
+        """
+        Prepare a question of a conversation for retrieval.
+
+        Args:
+            question (str): The question as asked.
+            conversation (Conversation, optional): The conversation the question belongs to.
+
+        Returns:
+            tuple[str, str]: The question rewritten to stand on its own when [MEMORY] rewriteQuestions is
+                enabled and the conversation has a history, or as asked otherwise, and the history.
+        """
+        history = conversation.getHistory() if conversation is not None else ""
+        if not history or not self.config.getboolean("MEMORY", "rewriteQuestions"):
+            return question, history
+        with tracer.span("memory.rewrite"):
+            try:
+                rewritten = (self.rewritePrompt | self.getLlm() | StrOutputParser()).invoke({"history": history, "question": question}).strip()
+            except Exception as e:
+                logger.error(CustomException(e))
+                rewritten = ""
+        return rewritten or question, history
+
+    def summarize(self, summary: str, turns: str) -> str:
+        """
+        Fold turns of a conversation into its summary.
+
+        Args:
+            summary (str): The current summary, empty for the first compaction.
+            turns (str): The transcript of the turns to fold.
+
+        Returns:
+            str: The new summary.
+        """
+        inputs = {"summary": summary or "None yet.", "turns": turns, "words": self.config.getint("MEMORY", "summaryWords")}
+        return (self.summaryPrompt | self.getLlm() | StrOutputParser()).invoke(inputs)
+
+    def remember(self, conversation: Conversation, question: str, answer: str) -> None:
+        """Record a turn in a conversation, if any, compacting its history in the background once it exceeds its budget."""
+        if conversation is not None and answer is not None and conversation.addTurn(question=question, answer=answer):
+            threading.Thread(target=conversation.compact, args=(self.summarize,), name="memory.compact", daemon=True).start()
+
+    @tracer.traced("chain.answer")
+    def answer(self, chain, question: str, conversation: Conversation = None) -> str:
+        """
+        Answer a question, reusing the cached answer of a similar question about the same documents.
+
+        Follow-up questions of a conversation bypass the answer cache, as their answers depend on its history.
+
+        Args:
+            chain: A chain returned by returnChain.
+            question (str): The question to be answered.
+            conversation (Conversation, optional): The conversation the question belongs to. Its history is
+                used to rewrite the question for retrieval and given to the LLM, and the turn is added to it.
+
+        Returns:
+            str: The answer.
+        """
+        standalone, history = self.prepareQuestion(question, conversation)
+        inputs = {"question": standalone, "history": history}
+        generate = lambda: iter([chain.invoke(inputs, config={"callbacks": [TracingCallbackHandler(tracer)]})])
+        response = None
+        for response in (generate() if history else self.cachedResponse(chain, standalone, generate)):
+            pass
+        self.remember(conversation, question, response)
+        return response
+
+    @tracer.traced("chain.answer")
+    def streamResponse(self, chain, question: str, conversation: Conversation = None):
+        """
+        Stream the answer to a question, yielding the response accumulated so far.
+
+        A cached answer of a similar question about the same documents is yielded at once. Follow-up
+        questions of a conversation bypass the answer cache, as their answers depend on its history.
+
+        Args:
+            chain: A chain returned by returnChain.
+            question (str): The question to be answered.
+            conversation (Conversation, optional): The conversation the question belongs to. Its history is
+                used to rewrite the question for retrieval and given to the LLM, and the turn is added to it
+                once the answer is complete.
+
+        Yields:
+            str: The response generated up to the latest token.
+        """
+        start = time.time()
+        standalone, history = self.prepareQuestion(question, conversation)
+        inputs = {"question": standalone, "history": history}
+
+        def generate() -> Iterator[str]:
+            response = ""
+            for token in chain.stream(inputs, config={"callbacks": [TracingCallbackHandler(tracer)]}):
+                response += token
+                yield response
+
+        firstToken = None
+        response = None
+        for response in (generate() if history else self.cachedResponse(chain, standalone, generate)):
+            if firstToken is None:
+                firstToken = time.time() - start
+            yield response
+        logger.info(f"Time to first token: {firstToken or 0:.2f}s, total time: {time.time() - start:.2f}s")
+        self.remember(conversation, question, response)
+
+    @staticmethod
+    def estimateTokens(text: str) -> int:
+        """Roughly estimate the number of LLM tokens of a text, at four characters per token."""
+        return len(text) // 4 + 1
+
+    @tracer.traced("chain.answerBatch")
+    def answerBatch(self, chain, questions: list[str]) -> list[BatchAnswer]:
+        """
+        Answer many questions against the index of a chain.
+
+        The questions are embedded in one batch and their contexts retrieved with batched matrix
+        operations. LLM calls are then dispatched across [BATCH] concurrency workers. Through the LLM
+        gateway, calls wait for its rate limits; otherwise each call first takes its estimated prompt
+        and completion tokens from a [BATCH] tokensPerMinute bucket. Questions answered from the
+        answer cache or by an identical question take no tokens.
+
+        Args:
+            chain: A chain returned by returnChain.
+            questions (list[str]): The questions to be answered.
+
+        Returns:
+            list[BatchAnswer]: The answer or the error of each question, in question order.
+        """
+        start = time.time()
+        retriever = self.getRetriever(chain)
+        with tracer.span("batch.embed", questions=len(questions)):
+            embeddings = self.store.embedQueries(questions)
+        with tracer.span("batch.retrieve", questions=len(questions)):
+            contexts = self.store.retrieveBatch(retriever, questions, embeddings)
+        logger.info(f"Retrieved the context of {len(questions)} questions in {time.time() - start:.2f}s")
+        generator = self.buildGenerator()
+        throughGateway = self.llm is None and self.config.getboolean("LLMGATEWAY", "enabled")
+        bucket = None if throughGateway else TokenBucket(tokensPerMinute=self.config.getfloat("BATCH", "tokensPerMinute"))
+        promptTokens = self.estimateTokens(self.prompt.format(context="", question=""))
+        maxTokens = self.config.getint("LLM", "maxTokens")
+
+        def answerOne(index: int) -> str:
+            inputs = {"context": self.formatDocs(contexts[index]), "question": questions[index]}
+
+            def generate() -> Iterator[str]:
+                if bucket is not None:
+                    with tracer.span("batch.rateLimit"):
+                        bucket.acquire(promptTokens + self.estimateTokens(inputs["context"] + inputs["question"]) + maxTokens)
+                yield generator.invoke(inputs, config={"callbacks": [TracingCallbackHandler(tracer)]})
+
+            response = None
+            for response in self.cachedResponse(chain, questions[index], generate, embeddings[index]):
+                pass
+            return response
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.config.getint("BATCH", "concurrency")) as executor:
+            answerOne = tracer.bind(answerOne)
+            futures = [executor.submit(answerOne, index) for index in range(len(questions))]
+            for question, future in zip(questions, futures):
+                try:
+                    results.append(BatchAnswer(question=question, answer=future.result()))
+                except Exception as e:
+                    logger.error(CustomException(e))
+                    results.append(BatchAnswer(question=question, error=str(e)))
+        failed = sum(result.error is not None for result in results)
+        logger.info(f"Answered {len(questions) - failed} of {len(questions)} questions in {time.time() - start:.2f}s")
+        return results
+
+    def getRetriever(self, chain):
+        """
+        Return the retriever used by a chain built with returnChain.
+
+        Args:
+            chain: A chain returned by returnChain.
+
+        Returns:
+            Retriever: The retriever feeding the chain its context.
+        """
+        for step in chain.first.steps__["context"].steps:
+            if isinstance(step, BaseRetriever):
+                return step
@@ -0,0 +1,230 @@
+from concurrent.futures import Future
+from src.utils.tracing import metrics
+from src.utils.logging import logger
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+from dataclasses import dataclass
+import numpy as np
+import threading
+import itertools
+import time
+
+@dataclass
+class CachedAnswer:
+    namespace: str
+    question: str
+    vector: Optional[np.ndarray]
+    answer: str
+    createdAt: float
+
+class AnswerCache:
+    def __init__(self, threshold: float, ttlMinutes: float, maxEntries: int, waitSeconds: float = 60.0) -> None:
+        """
+        Initialize an in-memory cache of answers looked up by question, then by question similarity.
+
+        Answers are grouped by namespace, a fingerprint of the index and generation settings they
+        were produced with, so that a hit is only possible against the same documents.
+
+        Args:
+            threshold (float): The cosine similarity above which a cached question counts as the same question.
+            ttlMinutes (float): The age after which an answer is evicted, in minutes.
+            maxEntries (int): The number of answers kept, least recently used ones being evicted first.
+            waitSeconds (float): The longest time a question waits for the answer of an identical question
+                being generated, before generating its own.
+        """
+        self.threshold = threshold
+        self.ttl = ttlMinutes * 60
+        self.maxEntries = maxEntries
+        self.waitSeconds = waitSeconds
+        self.entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self.namespaces: dict[str, dict[int, CachedAnswer]] = {}
+        self.questions: dict[tuple[str, str], int] = {}  # The entry of each normalized question per namespace
+        self.inflight: dict[tuple[str, str], Future] = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def normalizeQuestion(question: str) -> str:
+        """Return the question lowercased with its whitespace collapsed, identifying identical questions."""
+        return " ".join(question.lower().split())
+
+    def lookupExact(self, namespace: str, question: str) -> str:
+        """
+        Find the answer of the same question, up to case and whitespace.
+
+        Args:
+            namespace (str): The namespace of the question.
+            question (str): The question.
+
+        Returns:
+            str: The cached answer, or None if the question is not cached.
+        """
+        with self.lock:
+            self.expire()
+            entryId = self.questions.get((namespace, self.normalizeQuestion(question)))
+            if entryId is None:
+                return None
+            self.entries.move_to_end(entryId)
+            return self.entries[entryId].answer
+
+    def lookup(self, namespace: str, vector: np.ndarray) -> str:
+        """
+        Find the answer of the cached question most similar to a question.
+
+        Args:
+            namespace (str): The namespace of the question.
+            vector (np.ndarray): The normalized embedding of the question.
+
+        Returns:
+            str: The cached answer, or None if no cached question is similar enough.
+        """
+        with self.lock:
+            self.expire()
+            candidates = self.namespaces.get(namespace)
+            ids = [entryId for entryId, entry in (candidates or {}).items() if entry.vector is not None]
+            if not ids:
+                return None
+            similarities = np.stack([candidates[entryId].vector for entryId in ids]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            self.entries.move_to_end(ids[best])
+            return candidates[ids[best]].answer
+
+    def put(self, namespace: str, question: str, vector: np.ndarray, answer: str) -> None:
+        """
+        Store an answer, evicting the least recently used answers beyond maxEntries.
+
+        Args:
+            namespace (str): The namespace of the question.
+            question (str): The question.
+            vector (np.ndarray): The normalized embedding of the question, None to only match the same question.
+            answer (str): The answer to store.
+        """
+        with self.lock:
+            entryId = next(self.ids)
+            entry = CachedAnswer(namespace=namespace, question=question, vector=vector, answer=answer, createdAt=time.time())
+            self.entries[entryId] = entry
+            self.namespaces.setdefault(namespace, {})[entryId] = entry
+            previous = self.questions.get((namespace, self.normalizeQuestion(question)))
+            if previous is not None:
+                self.remove(previous)
+            self.questions[(namespace, self.normalizeQuestion(question))] = entryId
+            while len(self.entries) > self.maxEntries:
+                self.remove(next(iter(self.entries)))
+
+    def serve(self, namespace: str, question: str, getVector: Callable[[], Optional[np.ndarray]], generate: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Answer a question from the cache, or generate and cache the answer.
+
+        The same question is looked up first, then concurrent identical questions in a namespace
+        share one generation: the first caller generates, the others wait up to waitSeconds for its
+        complete answer. Only then is the question embedded to look up similar questions.
+
+        Args:
+            namespace (str): The namespace of the question.
+            question (str): The question.
+            getVector (Callable[[], Optional[np.ndarray]]): A function returning the normalized embedding
+                of the question, or None to skip the similarity lookup and only cache the question as is.
+            generate (Callable[[], Iterator[str]]): A function yielding the answer generated so far.
+
+        Yields:
+            str: The answer generated so far, or the complete answer on a hit.
+        """
+        answer = self.lookupExact(namespace, question)
+        if answer is not None:
+            self.record("hit")
+            yield answer
+            return
+        key = (namespace, self.normalizeQuestion(question))
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            try:
+                answer = future.result(timeout=self.waitSeconds)
+                self.record("coalesced")
+                yield answer
+                return
+            except Exception as e:
+                logger.warning(f"Coalesced answer failed or timed out, generating it again: {e!r}")
+        response = None
+        completed = False
+        try:
+            vector = getVector()
+            answer = self.lookup(namespace, vector) if vector is not None else None
+            if answer is not None:
+                self.record("hit")
+                response, completed = answer, True
+                yield answer
+                return
+            self.record("miss")
+            for response in generate():
+                yield response
+            completed = response is not None
+            if completed:
+                self.put(namespace, question, vector, response)
+        finally:
+            if leader:
+                with self.lock:
+                    self.inflight.pop(key, None)
+                if completed:
+                    future.set_result(response)
+                else:
+                    future.set_exception(RuntimeError("The answer could not be generated"))
+
+    def record(self, outcome: str) -> None:
+        """
+        Count a lookup outcome and log the hit rate.
+
+        Args:
+            outcome (str): One of "hit", "coalesced" or "miss".
+        """
+        with self.lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "coalesced":
+                self.coalesced += 1
+            else:
+                self.misses += 1
+            stats = self.stats()
+        metrics.increment("conversai_answer_cache_total", {"outcome": outcome}, help="Answer cache lookups by outcome.")
+        logger.info(f"Answer cache: {stats}")
+
+    def stats(self) -> dict:
+        """
+        Return the cache statistics.
+
+        Returns:
+            dict: Hits, coalesced requests, misses, hit rate and number of entries.
+        """
+        total = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hitRate": round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+            "entries": len(self.entries)
+        }
+
+    def expire(self) -> None:
+        """Evict the answers older than the TTL. Expects the lock to be held."""
+        now = time.time()
+        for entryId in [entryId for entryId, entry in self.entries.items() if now - entry.createdAt > self.ttl]:
+            self.remove(entryId)
+
+    def remove(self, entryId: int) -> None:
+        """Remove an answer. Expects the lock to be held."""
+        entry = self.entries.pop(entryId)
+        questionKey = (entry.namespace, self.normalizeQuestion(entry.question))
+        if self.questions.get(questionKey) == entryId:
+            del self.questions[questionKey]
+        namespace = self.namespaces[entry.namespace]
+        del namespace[entryId]
+        if not namespace:
+            del self.namespaces[entry.namespace]
@@ -0,0 +1,142 @@
+from langchain_community.docstore.document import Document
+from dataclasses import dataclass
+from src.utils.tracing import metrics
+from typing import Callable
+
+@dataclass
+class Segment:
+    text: str
+    rank: int
+    start: int = None
+    end: int = None
+
+class ContextPacker:
+    def __init__(self, maxTokens: int, countTokens: Callable[[str], int], separator: str = "\n\n", minPartialTokens: int = 64, adjacentChars: int = 8) -> None:
+        """
+        Initialize an assembler packing retrieved chunks into an LLM context of bounded size.
+
+        Chunks of the same document, identified by their "source" and "page" metadata, are merged
+        when their "start_index" spans overlap or are adjacent, so the text shared by overlapping
+        chunks appears once. Consecutive chunks split at a paragraph are separated only by the
+        whitespace the splitter stripped, so spans up to adjacentChars apart count as adjacent.
+        Duplicated texts are dropped. The resulting segments are packed in order of relevance, each
+        in document order, until the token budget is spent.
+
+        Args:
+            maxTokens (int): The token budget of the context.
+            countTokens (Callable[[str], int]): A function estimating the number of tokens of a text.
+            separator (str): The text placed between segments.
+            minPartialTokens (int): The smallest remaining budget worth filling with a truncated segment.
+            adjacentChars (int): The largest gap between two spans merged as adjacent.
+        """
+        self.maxTokens = maxTokens
+        self.countTokens = countTokens
+        self.separator = separator
+        self.minPartialTokens = minPartialTokens
+        self.adjacentChars = adjacentChars
+
+    def mergeSpans(self, chunks: list[tuple[int, Document]]) -> list[Segment]:
+        """
+        Merge the overlapping or adjacent chunks of one document.
+
+        Args:
+            chunks (list[tuple[int, Document]]): The retrieval rank and the chunk, each with a "start_index".
+
+        Returns:
+            list[Segment]: The merged segments, in document order.
+        """
+        segments = []
+        for rank, chunk in sorted(chunks, key=lambda item: item[1].metadata["start_index"]):
+            start = chunk.metadata["start_index"]
+            end = start + len(chunk.page_content)
+            last = segments[-1] if segments else None
+            if last is not None and start <= last.end + self.adjacentChars:
+                if start > last.end:
+                    last.text += "\n" + chunk.page_content
+                    last.end = end
+                elif end > last.end:
+                    last.text += chunk.page_content[last.end - start:]
+                    last.end = end
+                last.rank = min(last.rank, rank)
+            else:
+                segments.append(Segment(text=chunk.page_content, rank=rank, start=start, end=end))
+        return segments
+
+    def buildSegments(self, docs: list[Document]) -> list[Segment]:
+        """
+        Merge and deduplicate retrieved chunks into segments ordered by relevance.
+
+        Args:
+            docs (list[Document]): The retrieved chunks, most relevant first.
+
+        Returns:
+            list[Segment]: The segments, ordered by the best rank of the chunks they hold.
+        """
+        groups, segments = {}, []
+        for rank, doc in enumerate(docs):
+            if isinstance(doc.metadata.get("start_index"), int) and doc.metadata.get("source") is not None:
+                groups.setdefault((doc.metadata["source"], doc.metadata.get("page")), []).append((rank, doc))
+            else:
+                segments.append(Segment(text=doc.page_content, rank=rank))
+        for chunks in groups.values():
+            segments.extend(self.mergeSpans(chunks))
+        seen, unique = set(), []
+        for segment in sorted(segments, key=lambda segment: segment.rank):
+            key = " ".join(segment.text.split())
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(segment)
+        return unique
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """
+        Cut a text to about a number of tokens, at the last sentence or word boundary.
+
+        Args:
+            text (str): The text to cut.
+            tokens (int): The number of tokens to keep.
+
+        Returns:
+            str: The beginning of the text.
+        """
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.countTokens(text[:middle]) <= tokens:
+                low = middle
+            else:
+                high = middle - 1
+        cut = text[:low]
+        boundary = cut.rfind(". ")
+        if boundary < len(cut) // 2:
+            boundary = cut.rfind(" ")
+        return cut[:boundary + 1].rstrip() if boundary > 0 else cut
+
+    def pack(self, docs: list[Document]) -> str:
+        """
+        Assemble the context of a question from its retrieved chunks.
+
+        Args:
+            docs (list[Document]): The retrieved chunks, most relevant first.
+
+        Returns:
+            str: The packed context, or an empty string when there are no chunks.
+        """
+        parts, used = [], 0
+        separatorTokens = self.countTokens(self.separator)
+        for segment in self.buildSegments(docs):
+            tokens = self.countTokens(segment.text) + (separatorTokens if parts else 0)
+            if used + tokens <= self.maxTokens:
+                parts.append(segment.text)
+                used += tokens
+                continue
+            remaining = self.maxTokens - used - (separatorTokens if parts else 0)
+            if remaining >= self.minPartialTokens or not parts:
+                partial = self.truncate(segment.text, remaining)
+                if partial:
+                    parts.append(partial)
+            break
+        context = self.separator.join(parts)
+        metrics.increment("conversai_context_tokens_total", {"stage": "retrieved"}, sum(self.countTokens(doc.page_content) for doc in docs), help="Context tokens retrieved and sent to the LLM.")
+        metrics.increment("conversai_context_tokens_total", {"stage": "packed"}, self.countTokens(context) if context else 0)
+        return context
@@ -0,0 +1,161 @@
+from src.utils.exceptions import CustomException
+from src.utils.tracing import metrics, tracer
+from src.utils.logging import logger
+from dataclasses import dataclass
+from typing import Callable
+import threading
+import time
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+
+class Conversation:
+    def __init__(self, maxTokens: int, keepTurns: int, countTokens: Callable[[str], int]) -> None:
+        """
+        Initialize the memory of one conversation: a summary of its older turns and its latest turns verbatim.
+
+        Once the history outgrows its token budget, the turns before the keepTurns latest ones are
+        folded into the summary, which is then reused as is by every later turn until the next
+        compaction. The history given to the LLM therefore stays within the budget however long
+        the conversation gets.
+
+        Args:
+            maxTokens (int): The token budget of the history.
+            keepTurns (int): The latest turns kept verbatim when compacting.
+            countTokens (Callable[[str], int]): A function counting the tokens of a text.
+        """
+        self.maxTokens = maxTokens
+        self.keepTurns = keepTurns
+        self.countTokens = countTokens
+        self.summary = ""
+        self.turns: list[Turn] = []
+        self.lastAccess = time.time()
+        self.compacting = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def formatTurns(turns: list[Turn]) -> str:
+        """Format turns as a transcript."""
+        return "\n".join(f"User: {turn.question}\nAssistant: {turn.answer}" for turn in turns)
+
+    def getHistory(self) -> str:
+        """
+        Return the history of the conversation as given to the LLM.
+
+        Returns:
+            str: The summary of the older turns followed by the latest turns, empty before the first turn.
+        """
+        with self.lock:
+            self.lastAccess = time.time()
+            parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+            if self.turns:
+                parts.append(self.formatTurns(self.turns))
+            return "\n".join(parts)
+
+    def addTurn(self, question: str, answer: str) -> bool:
+        """
+        Record a turn.
+
+        Args:
+            question (str): The question as asked.
+            answer (str): The answer given.
+
+        Returns:
+            bool: True when the history exceeds its budget and no compaction is running, so it should be compacted.
+        """
+        with self.lock:
+            self.lastAccess = time.time()
+            self.turns.append(Turn(question=question, answer=answer))
+            tokens = self.countTokens(self.summary + self.formatTurns(self.turns))
+            metrics.observe("conversai_history_tokens", tokens, help="Tokens of the conversation history given to the LLM.",
+                            buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+            return tokens > self.maxTokens and not self.compacting
+
+    def compact(self, summarize: Callable[[str, str], str]) -> None:
+        """
+        Fold the turns before the keepTurns latest ones into the summary, if the history exceeds its budget.
+
+        The LLM summarizes outside the lock, so the conversation goes on meanwhile: the turns added in
+        the meantime are kept verbatim. When summarizing fails the turns are kept verbatim, and
+        compaction is tried again after the next turn.
+
+        Args:
+            summarize (Callable[[str, str], str]): A function returning a new summary from the current one
+                and the transcript of the turns to fold into it.
+        """
+        with self.lock:
+            if self.compacting or self.countTokens(self.summary + self.formatTurns(self.turns)) <= self.maxTokens:
+                return
+            self.compacting = True
+            summary = self.summary
+            folded = self.turns[:len(self.turns) - min(self.keepTurns, len(self.turns) - 1)]
+        try:
+            with tracer.span("memory.summarize", turns=len(folded)):
+                summary = summarize(summary, self.formatTurns(folded)).strip()
+        except Exception as e:
+            logger.error(CustomException(e))
+            with self.lock:
+                self.compacting = False
+            return
+        with self.lock:
+            self.summary = summary
+            self.turns = self.turns[len(folded):]  # Turns are only appended while compacting
+            self.compacting = False
+            tokens = self.countTokens(self.summary + self.formatTurns(self.turns))
+        metrics.increment("conversai_history_summaries_total", help="Compactions of conversation histories into their summary.")
+        metrics.observe("conversai_history_tokens", tokens)
+
+class ConversationStore:
+    def __init__(self, ttlMinutes: float, create: Callable[[], Conversation]) -> None:
+        """
+        Initialize a session-scoped store of conversations, evicting those idle for longer than a TTL.
+
+        Args:
+            ttlMinutes (float): The idle time after which a conversation is forgotten, in minutes.
+            create (Callable[[], Conversation]): A function creating an empty conversation.
+        """
+        self.ttl = ttlMinutes * 60
+        self.create = create
+        self.conversations: dict[tuple[str, str], tuple[Conversation, str]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, sessionId: str, source: str, fingerprint: str) -> Conversation:
+        """
+        Return the conversation of a session about a source, starting a new one when the source input changed.
+
+        Args:
+            sessionId (str): The Gradio session hash.
+            source (str): The source the conversation is about, e.g. "text" or "website".
+            fingerprint (str): A fingerprint of the source input.
+
+        Returns:
+            Conversation: The conversation.
+        """
+        key = (sessionId, source)
+        with self.lock:
+            self.expire()
+            entry = self.conversations.get(key)
+            if entry is None or entry[1] != fingerprint:
+                entry = (self.create(), fingerprint)
+                self.conversations[key] = entry
+            return entry[0]
+
+    def drop(self, sessionId: str, source: str = None) -> None:
+        """
+        Forget the conversations of a session.
+
+        Args:
+            sessionId (str): The Gradio session hash.
+            source (str, optional): The source whose conversation is forgotten. Every source of the session if None.
+        """
+        with self.lock:
+            for key in [key for key in self.conversations if key[0] == sessionId and source in (None, key[1])]:
+                del self.conversations[key]
+
+    def expire(self) -> None:
+        """Forget the conversations idle for longer than the TTL. Expects the lock to be held."""
+        now = time.time()
+        for key in [key for key, (conversation, _) in self.conversations.items() if now - conversation.lastAccess > self.ttl]:
+            del self.conversations[key]
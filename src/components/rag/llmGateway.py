@@ -0,0 +1,352 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from src.utils.rateLimiter import TokenBucket, parseDuration
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from src.utils.tracing import metrics, tracer
+from src.utils.logging import logger
+from typing import Any, Callable, Iterator
+from langchain_groq import ChatGroq
+import configparser
+import random
+import httpx
+import groq
+import time
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+class ModelLane:
+    def __init__(self, modelName: str, temperature: float, maxTokens: int, tokensPerMinute: float,
+                 requestsPerMinute: float, maxConnections: int, baseUrl: str = None) -> None:
+        """
+        Initialize the route to one model: its rate limits and a client over a pool of kept-alive connections.
+
+        Every response updates the token and request buckets from its x-ratelimit-* headers, and a 429
+        response pauses them for its Retry-After time.
+
+        Args:
+            modelName (str): The model.
+            temperature (float): The sampling temperature.
+            maxTokens (int): The maximum tokens of an answer.
+            tokensPerMinute (float): The tokens allowed per minute, lowered by the headers if needed.
+            requestsPerMinute (float): The requests allowed per minute, lowered by the headers if needed.
+            maxConnections (int): The size of the connection pool.
+            baseUrl (str, optional): The URL of the Groq-compatible API, the Groq API when None.
+        """
+        self.modelName = modelName
+        self.maxTokens = maxTokens
+        self.tokens = TokenBucket(tokensPerMinute=tokensPerMinute)
+        self.requests = TokenBucket(tokensPerMinute=requestsPerMinute)
+        self.httpClient = httpx.Client(
+            limits=httpx.Limits(max_connections=maxConnections, max_keepalive_connections=maxConnections),
+            event_hooks={"response": [self.onResponse]}
+        )
+        self.model = ChatGroq(model_name=modelName, temperature=temperature, max_tokens=maxTokens, max_retries=0,
+                              http_client=self.httpClient, groq_api_base=baseUrl or None)
+
+    @staticmethod
+    def readNumber(headers: httpx.Headers, name: str) -> float:
+        """Return the numeric value of a header, or None if it is missing or malformed."""
+        try:
+            return float(headers[name])
+        except (KeyError, ValueError):
+            return None
+
+    def onResponse(self, response: httpx.Response) -> None:
+        """Align the buckets with the rate limit state reported in the headers of a response."""
+        headers = response.headers
+        for bucket, kind in ((self.tokens, "tokens"), (self.requests, "requests")):
+            remaining = self.readNumber(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            bucket.update(
+                remaining=remaining,
+                limit=self.readNumber(headers, f"x-ratelimit-limit-{kind}"),
+                resetSeconds=parseDuration(headers.get(f"x-ratelimit-reset-{kind}"))
+            )
+            metrics.setGauge(f"conversai_llm_{kind}_remaining", remaining, {"model": self.modelName},
+                             f"LLM {kind} left in the provider's rate limit window.")
+        if response.status_code == 429:
+            retryAfter = parseDuration(headers.get("retry-after"))
+            if retryAfter:
+                self.tokens.pause(retryAfter)
+            metrics.increment("conversai_llm_rate_limited_total", {"model": self.modelName},
+                              help="LLM requests refused by the provider's rate limit.")
+
+    def estimateTokens(self, messages: list[BaseMessage]) -> int:
+        """Estimate the prompt and completion tokens of a call, at four characters per prompt token."""
+        return sum(len(str(message.content)) for message in messages) // 4 + 1 + self.maxTokens
+
+    def estimateWait(self, tokens: int) -> float:
+        """Estimate the time before a call of some tokens may be sent."""
+        return max(self.tokens.estimateWait(tokens), self.requests.estimateWait(1))
+
+    def acquire(self, tokens: int, timeout: float) -> float:
+        """
+        Wait until a call of some tokens may be sent.
+
+        Args:
+            tokens (int): The estimated tokens of the call.
+            timeout (float): The longest time to wait, in seconds.
+
+        Returns:
+            float: The time spent waiting, in seconds.
+
+        Raises:
+            TimeoutError: If the call could not be sent within the timeout. Nothing is taken from the buckets.
+        """
+        waited = self.requests.acquire(1, timeout=timeout)
+        try:
+            return waited + self.tokens.acquire(tokens, timeout=timeout - waited)
+        except TimeoutError:
+            self.requests.release(1)
+            raise
+
+    def close(self) -> None:
+        """Close the connection pool."""
+        self.httpClient.close()
+
+class LLMGateway:
+    def __init__(self, primary: ModelLane, fallback: ModelLane = None, maxRetries: int = 4, retryBaseSeconds: float = 0.5,
+                 retryMaxSeconds: float = 20.0, timeoutSeconds: float = 60.0, fallbackWaitSeconds: float = 2.0,
+                 hedgeAfterSeconds: float = 0.0) -> None:
+        """
+        Initialize a gateway scheduling the LLM calls of every chain of the process.
+
+        Each call waits for the rate limit of its model, then is retried with jittered exponential
+        backoff on rate limiting, server and connection errors until its deadline. A call is sent to
+        the fallback model when the primary one is saturated, i.e. would make it wait longer than
+        fallbackWaitSeconds and longer than the fallback model would.
+
+        Args:
+            primary (ModelLane): The model answering by default.
+            fallback (ModelLane, optional): The smaller model answering when the primary one is saturated.
+            maxRetries (int): The retries of a failed call.
+            retryBaseSeconds (float): The largest backoff before the first retry, doubled on every retry.
+            retryMaxSeconds (float): The cap of the backoff.
+            timeoutSeconds (float): The deadline of a call, rate limit waits included. For streams it
+                bounds the time to the first token.
+            fallbackWaitSeconds (float): The rate limit wait on the primary model above which the fallback
+                model is considered.
+            hedgeAfterSeconds (float): The time after which a call still unanswered is duplicated on the
+                fallback model, or on the primary one without a fallback, the first answer winning.
+                Streams are not hedged. 0 disables hedging.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.maxRetries = maxRetries
+        self.retryBaseSeconds = retryBaseSeconds
+        self.retryMaxSeconds = retryMaxSeconds
+        self.timeoutSeconds = timeoutSeconds
+        self.fallbackWaitSeconds = fallbackWaitSeconds
+        self.hedgeAfterSeconds = hedgeAfterSeconds
+        self.executor = ThreadPoolExecutor(thread_name_prefix="llmHedge") if hedgeAfterSeconds > 0 else None
+
+    @classmethod
+    def fromConfig(cls, config: configparser.ConfigParser) -> "LLMGateway":
+        """
+        Build the gateway configured under [LLM] and [LLMGATEWAY].
+
+        Args:
+            config (configparser.ConfigParser): The configuration.
+
+        Returns:
+            LLMGateway: The gateway.
+        """
+        section = config["LLMGATEWAY"]
+
+        def createLane(modelName: str, prefix: str) -> ModelLane:
+            return ModelLane(
+                modelName=modelName,
+                temperature=config.getfloat("LLM", "temperature"),
+                maxTokens=config.getint("LLM", "maxTokens"),
+                tokensPerMinute=section.getfloat(f"{prefix}TokensPerMinute"),
+                requestsPerMinute=section.getfloat(f"{prefix}RequestsPerMinute"),
+                maxConnections=section.getint("maxConnections"),
+                baseUrl=section.get("baseUrl")
+            )
+
+        return cls(
+            primary=createLane(config.get("LLM", "llmModel"), "primary"),
+            fallback=createLane(section.get("fallbackModel"), "fallback") if section.get("fallbackModel") else None,
+            maxRetries=section.getint("maxRetries"),
+            retryBaseSeconds=section.getfloat("retryBaseSeconds"),
+            retryMaxSeconds=section.getfloat("retryMaxSeconds"),
+            timeoutSeconds=section.getfloat("timeoutSeconds"),
+            fallbackWaitSeconds=section.getfloat("fallbackWaitSeconds"),
+            hedgeAfterSeconds=section.getfloat("hedgeAfterSeconds")
+        )
+
+    def chooseLane(self, messages: list[BaseMessage]) -> ModelLane:
+        """Return the lane of a call: the primary one unless it is saturated and the fallback one is not as much."""
+        wait = self.primary.estimateWait(self.primary.estimateTokens(messages))
+        if self.fallback is None or wait <= self.fallbackWaitSeconds:
+            return self.primary
+        if self.fallback.estimateWait(self.fallback.estimateTokens(messages)) >= wait:
+            return self.primary
+        metrics.increment("conversai_llm_fallbacks_total", {"model": self.fallback.modelName},
+                          help="LLM calls sent to the fallback model while the primary one was saturated.")
+        return self.fallback
+
+    @staticmethod
+    def isRetryable(error: Exception) -> bool:
+        """Check whether a failed call may succeed when sent again."""
+        if isinstance(error, groq.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS
+        return isinstance(error, (groq.APIConnectionError, httpx.TransportError))
+
+    @staticmethod
+    def getRemaining(deadline: float) -> float:
+        """
+        Return the time left until a deadline.
+
+        Raises:
+            TimeoutError: If the deadline has passed.
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("The LLM call deadline was exceeded")
+        return remaining
+
+    def call(self, messages: list[BaseMessage], attempt: Callable[[ModelLane, float], Any]) -> Any:
+        """
+        Make a call within the rate limits, retrying it until it succeeds or its deadline passes.
+
+        Args:
+            messages (list[BaseMessage]): The prompt of the call.
+            attempt (Callable[[ModelLane, float], Any]): Sends the call to a lane with a timeout in seconds.
+
+        Returns:
+            Any: The result of the first successful attempt.
+
+        Raises:
+            TimeoutError: If the deadline passed, waiting for the rate limit or for an answer.
+            Exception: The error of the last attempt when it cannot be retried or retries are exhausted.
+        """
+        deadline = time.monotonic() + self.timeoutSeconds
+        for retry in range(self.maxRetries + 1):
+            lane = self.chooseLane(messages)
+            with tracer.span("llm.rateLimit", model=lane.modelName):
+                waited = lane.acquire(lane.estimateTokens(messages), timeout=self.getRemaining(deadline))
+            metrics.observe("conversai_llm_rate_limit_wait_seconds", waited, {"model": lane.modelName},
+                            "Time LLM calls waited for the rate limit in seconds.")
+            try:
+                result = attempt(lane, self.getRemaining(deadline))
+            except Exception as e:
+                retryable = self.isRetryable(e) and retry < self.maxRetries
+                metrics.increment("conversai_llm_requests_total", {"model": lane.modelName, "outcome": "retried" if retryable else "failed"},
+                                  help="LLM calls by model and outcome.")
+                if not retryable:
+                    raise
+                delay = random.uniform(0, min(self.retryMaxSeconds, self.retryBaseSeconds * 2 ** retry))
+                if delay >= self.getRemaining(deadline):
+                    raise
+                logger.warning(f"LLM call to '{lane.modelName}' failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            metrics.increment("conversai_llm_requests_total", {"model": lane.modelName, "outcome": "succeeded"},
+                              help="LLM calls by model and outcome.")
+            return result
+
+    def hedge(self, lane: ModelLane, messages: list[BaseMessage], stop: list[str], timeout: float) -> ChatResult:
+        """
+        Generate an answer, duplicating the call on the hedge lane when no answer came within hedgeAfterSeconds.
+
+        The call is only duplicated when the hedge lane's rate limit allows it at once. The slower call is
+        left to finish in the background.
+
+        Args:
+            lane (ModelLane): The lane of the call.
+            messages (list[BaseMessage]): The prompt.
+            stop (list[str]): The stop sequences.
+            timeout (float): The timeout of the call, in seconds.
+
+        Returns:
+            ChatResult: The first answer.
+        """
+        first = self.executor.submit(tracer.bind(lane.model._generate), messages, stop=stop, timeout=timeout)
+        if wait([first], timeout=self.hedgeAfterSeconds).done or timeout <= self.hedgeAfterSeconds:
+            return first.result()
+        hedgeLane = self.fallback if lane is self.primary and self.fallback is not None else lane
+        try:
+            hedgeLane.acquire(hedgeLane.estimateTokens(messages), timeout=0)
+        except TimeoutError:
+            return first.result()
+        second = self.executor.submit(tracer.bind(hedgeLane.model._generate), messages, stop=stop, timeout=timeout - self.hedgeAfterSeconds)
+        names = {first: "original", second: "hedge"}
+        pending, error = set(names), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    metrics.increment("conversai_llm_hedges_total", {"winner": names[future]},
+                                      help="Hedged LLM calls by the call answering first.")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def generate(self, messages: list[BaseMessage], stop: list[str] = None) -> ChatResult:
+        """
+        Generate an answer.
+
+        Args:
+            messages (list[BaseMessage]): The prompt.
+            stop (list[str], optional): The stop sequences.
+
+        Returns:
+            ChatResult: The answer.
+        """
+        def attempt(lane: ModelLane, timeout: float) -> ChatResult:
+            if self.executor is None:
+                return lane.model._generate(messages, stop=stop, timeout=timeout)
+            return self.hedge(lane, messages, stop, timeout)
+
+        return self.call(messages, attempt)
+
+    def stream(self, messages: list[BaseMessage], stop: list[str] = None, runManager: Any = None) -> Iterator[ChatGenerationChunk]:
+        """
+        Stream an answer. The call is retried until its first chunk arrives; a stream failing later raises.
+
+        Args:
+            messages (list[BaseMessage]): The prompt.
+            stop (list[str], optional): The stop sequences.
+            runManager (Any, optional): The callback manager notified of every new token.
+
+        Yields:
+            ChatGenerationChunk: The chunks of the answer.
+        """
+        def attempt(lane: ModelLane, timeout: float) -> tuple:
+            chunks = lane.model._stream(messages, stop=stop, run_manager=runManager, timeout=timeout)
+            return next(chunks, None), chunks
+
+        first, chunks = self.call(messages, attempt)
+        if first is None:
+            return
+        yield first
+        yield from chunks
+
+    def close(self) -> None:
+        """Close the connection pools and stop the hedging threads."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        for lane in (self.primary, self.fallback):
+            if lane is not None:
+                lane.close()
+
+class GatewayChatModel(BaseChatModel):
+    """A chat model sending its calls through an LLMGateway."""
+
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        """Return the type of the model."""
+        return "llm-gateway"
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        """Generate an answer through the gateway."""
+        return self.gateway.generate(messages, stop=stop)
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        """Stream an answer through the gateway."""
+        yield from self.gateway.stream(messages, stop=stop, runManager=run_manager)
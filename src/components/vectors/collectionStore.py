@@ -0,0 +1,161 @@
+from src.components.vectors.numpyIndex import NumpyVectorIndex
+from langchain_core.embeddings import Embeddings
+from contextlib import contextmanager
+from src.utils.logging import logger
+from collections import Counter
+from typing import Iterator
+import threading
+import shutil
+import json
+import re
+import os
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+class CollectionStore:
+    def __init__(self, path: str, embeddings: Embeddings, fingerprint: str, dtype: str = "float32", lexical: bool = False) -> None:
+        """
+        Initialize a store of named, persistent indexes holding the chunks of any number of sources.
+
+        An open collection is kept in memory and shared by all the chains over it. A collection saved
+        by another process since it was opened is reopened on next access, unless this process is
+        writing to it.
+
+        Args:
+            path (str): The directory holding one subdirectory per collection.
+            embeddings (Embeddings): The embedding model of the collections.
+            fingerprint (str): The fingerprint of the embedding and chunking configuration. Collections
+                saved with another fingerprint cannot be opened until their sources are ingested again.
+            dtype (str): The storage type of the vectors of new collections.
+            lexical (bool): Whether new collections maintain a BM25 index as chunks are added.
+        """
+        self.path = path
+        self.embeddings = embeddings
+        self.fingerprint = fingerprint
+        self.dtype = dtype
+        self.lexical = lexical
+        self.collections: dict[str, tuple[NumpyVectorIndex, float]] = {}  # Open indexes and the version they were loaded at
+        self.writers: Counter = Counter()
+        self.lock = threading.RLock()
+
+    def getPath(self, name: str) -> str:
+        """
+        Return the directory of a collection.
+
+        Raises:
+            ValueError: If the name is not 1 to 64 letters, digits, underscores or hyphens.
+        """
+        if not isinstance(name, str) or not NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name '{name}': use up to 64 letters, digits, underscores or hyphens")
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def getVersion(directory: str) -> float:
+        """Return the modification time of the manifest of a saved index, or None if it was never saved."""
+        try:
+            return os.path.getmtime(os.path.join(directory, "manifest.json"))
+        except OSError:
+            return None
+
+    def open(self, name: str, create: bool = False) -> NumpyVectorIndex:
+        """
+        Return the index of a collection, loading it with its vectors memory-mapped.
+
+        Args:
+            name (str): The collection name.
+            create (bool): Whether to create an empty collection when it does not exist or cannot be loaded.
+
+        Returns:
+            NumpyVectorIndex: The index, or None if the collection does not exist and create is False.
+        """
+        directory = self.getPath(name)
+        with self.lock:
+            version = self.getVersion(directory)
+            cached = self.collections.get(name)
+            if cached is not None and (cached[1] == version or self.writers[name]):
+                return cached[0]
+            index = None
+            if version is not None:
+                index = NumpyVectorIndex.load(directory=directory, embedding=self.embeddings, fingerprint=self.fingerprint, discard=False)
+                if index is None:
+                    logger.warning(f"Collection '{name}' was built with another embedding or chunking configuration, ingest its sources again")
+            if index is None:
+                if not create:
+                    return None
+                index = NumpyVectorIndex(embedding=self.embeddings, dtype=self.dtype, lexical=self.lexical)
+                version = None
+            else:
+                logger.info(f"Opened collection '{name}' with {index.count} chunks")
+            self.collections[name] = (index, version)
+            return index
+
+    @contextmanager
+    def writing(self, name: str) -> Iterator[NumpyVectorIndex]:
+        """
+        Open a collection for writing, creating it when missing, and save it once done.
+
+        The collection is saved even when the writes fail or are cancelled, so that the saved index
+        matches the one served from memory.
+
+        Args:
+            name (str): The collection name.
+
+        Yields:
+            NumpyVectorIndex: The index of the collection.
+        """
+        with self.lock:
+            index = self.open(name, create=True)
+            self.writers[name] += 1
+        try:
+            yield index
+        finally:
+            try:
+                self.save(name, index)
+            finally:
+                with self.lock:
+                    self.writers[name] -= 1
+
+    def save(self, name: str, index: NumpyVectorIndex) -> None:
+        """Persist the index of a collection."""
+        directory = self.getPath(name)
+        os.makedirs(self.path, exist_ok=True)
+        index.save(directory=directory, fingerprint=self.fingerprint)
+        with self.lock:
+            self.collections[name] = (index, self.getVersion(directory))
+        logger.info(f"Saved collection '{name}' with {index.count} chunks")
+
+    def list(self) -> list[dict]:
+        """
+        Describe the saved collections.
+
+        Returns:
+            list[dict]: The "name", number of "chunks" and "updatedAt" timestamp of each collection, by name.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        collections = []
+        for name in sorted(os.listdir(self.path)):
+            manifestPath = os.path.join(self.path, name, "manifest.json")
+            if NAME_PATTERN.match(name) and os.path.isfile(manifestPath):
+                with open(manifestPath) as file:
+                    manifest = json.load(file)
+                collections.append({"name": name, "chunks": manifest["count"], "updatedAt": manifest["createdAt"]})
+        return collections
+
+    def delete(self, name: str) -> bool:
+        """
+        Delete a collection from memory and disk.
+
+        Args:
+            name (str): The collection name.
+
+        Returns:
+            bool: True if the collection existed.
+        """
+        directory = self.getPath(name)
+        with self.lock:
+            existed = self.collections.pop(name, None) is not None or os.path.isdir(directory)
+            shutil.rmtree(directory, ignore_errors=True)
+        if existed:
+            logger.info(f"Deleted collection '{name}'")
+        return existed
@@ -0,0 +1,169 @@
+from langchain_core.embeddings import Embeddings
+from src.utils.tracing import metrics
+from src.utils.logging import logger
+import numpy as np
+import threading
+import hashlib
+import sqlite3
+import time
+import os
+
+class EmbeddingCache:
+    def __init__(self, path: str, maxSizeMB: float) -> None:
+        """
+        Initialize an on-disk, size-bounded embedding cache backed by SQLite.
+
+        Args:
+            path (str): The file path of the SQLite database holding the cache.
+            maxSizeMB (float): The size budget of the stored vectors in megabytes.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.maxBytes = int(maxSizeMB * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, nbytes INTEGER NOT NULL, lastAccess REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idxLastAccess ON embeddings (lastAccess)")
+        self.connection.commit()
+        self.totalBytes = self.connection.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def makeKey(modelName: str, normalize: bool, text: str) -> str:
+        """
+        Build the content address of a chunk embedding.
+
+        Args:
+            modelName (str): The name of the embedding model.
+            normalize (bool): Whether the embeddings are normalized.
+            text (str): The chunk text.
+
+        Returns:
+            str: The hex digest identifying the embedding.
+        """
+        return hashlib.sha256(f"{modelName}\x00{int(normalize)}\x00{text}".encode("utf-8")).hexdigest()
+
+    def getMany(self, keys: list[str]) -> dict[str, list[float]]:
+        """
+        Look up several embeddings and mark the found ones as recently used.
+
+        Args:
+            keys (list[str]): The keys to look up.
+
+        Returns:
+            dict[str, list[float]]: The cached vectors of the keys that were found.
+        """
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET lastAccess = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self.connection.commit()
+        return found
+
+    def putMany(self, items: dict[str, list[float]]) -> None:
+        """
+        Store several embeddings and evict the least recently used ones beyond the size budget.
+
+        Args:
+            items (dict[str, list[float]]): The vectors to store, by key.
+        """
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self.lock:
+            for key, blob, nbytes, _ in rows:
+                previous = self.connection.execute("SELECT nbytes FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self.totalBytes += nbytes - (previous[0] if previous else 0)
+            self.connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.evict()
+            self.connection.commit()
+
+    def evict(self) -> None:
+        """Delete the least recently used embeddings until the cache fits its budget. Expects the lock to be held."""
+        while self.totalBytes > self.maxBytes:
+            rows = self.connection.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY lastAccess LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.totalBytes = 0
+                break
+            evicted = []
+            for key, nbytes in rows:
+                if self.totalBytes <= self.maxBytes:
+                    break
+                evicted.append((key,))
+                self.totalBytes -= nbytes
+            self.connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            logger.info(f"Evicted {len(evicted)} embeddings from the embedding cache")
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, modelName: str, normalize: bool) -> None:
+        """
+        Wrap an embedding model so that document embeddings are served from an EmbeddingCache when known.
+
+        Args:
+            embeddings (Embeddings): The underlying embedding model.
+            cache (EmbeddingCache): The cache to read from and write to.
+            modelName (str): The name of the embedding model, part of the cache key.
+            normalize (bool): Whether the embeddings are normalized, part of the cache key.
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.modelName = modelName
+        self.normalize = normalize
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed documents, calling the underlying model only for texts missing from the cache.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: The embeddings, in the order of the texts.
+        """
+        keys = [EmbeddingCache.makeKey(self.modelName, self.normalize, text) for text in texts]
+        vectors = self.cache.getMany(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            newVectors = dict(zip(missing.keys(), computed))
+            self.cache.putMany(newVectors)
+            vectors.update(newVectors)
+        hits = sum(1 for key in keys if key not in missing)
+        metrics.increment("conversai_embedding_cache_total", {"outcome": "hit"}, hits, help="Embedding cache lookups by outcome.")
+        metrics.increment("conversai_embedding_cache_total", {"outcome": "miss"}, len(texts) - hits)
+        logger.info(f"Embedding cache: {hits} hits, {len(texts) - hits} misses")
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Embed a query through the underlying model, bypassing the cache.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list[float]: The query embedding.
+        """
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,199 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from dataclasses import dataclass, field
+from src.utils.tracing import metrics
+import threading
+import queue
+import time
+
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+@dataclass
+class EmbeddingRequest:
+    texts: list[str]
+    query: bool = False
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+class EmbeddingService:
+    def __init__(self, embeddings: Embeddings, maxBatchSize: int = 64, maxWaitMs: float = 5.0, workers: int = 2, batchQueries: bool = True) -> None:
+        """
+        Initialize an in-process service embedding the requests of all sessions in micro-batches.
+
+        Requests are queued and grouped into batches of up to maxBatchSize texts, waiting at most
+        maxWaitMs after the oldest request of a batch. A batch is only formed once one of the workers
+        is free, so batches grow under load instead of many small forward passes competing for the
+        same cores. A single request larger than maxBatchSize forms a batch of its own.
+
+        Args:
+            embeddings (Embeddings): The embedding model.
+            maxBatchSize (int): The number of texts beyond which a batch is dispatched without waiting.
+            maxWaitMs (float): The longest time a request waits for others to join its batch, in milliseconds.
+            workers (int): The number of batches embedded concurrently.
+            batchQueries (bool): Whether queries are batched through embed_documents, which is only valid
+                for models embedding queries and documents alike. Otherwise each query of a batch is
+                embedded with embed_query.
+        """
+        self.embeddings = embeddings
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWaitMs / 1000
+        self.batchQueries = batchQueries
+        self.requests = queue.Queue()
+        self.pending = {True: [], False: []}  # Requests waiting for a batch, queries first
+        self.slots = threading.Semaphore(workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embeddingWorker")
+        self.depthLock = threading.Lock()
+        self.queuedTexts = 0
+        self.stopping = False
+        self.dispatcher = threading.Thread(target=self.dispatch, name="embeddingDispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, texts: list[str], query: bool = False) -> Future:
+        """
+        Queue texts for embedding.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            query (bool): Whether the texts are search queries rather than documents.
+
+        Returns:
+            Future: A future resolving to the embeddings, in the order of the texts.
+        """
+        request = EmbeddingRequest(texts=list(texts), query=query)
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        if self.stopping:
+            raise RuntimeError("The embedding service is closed")
+        self.updateDepth(len(request.texts))
+        self.requests.put(request)
+        return request.future
+
+    def updateDepth(self, change: int) -> None:
+        """Track the number of texts waiting to be dispatched."""
+        with self.depthLock:
+            self.queuedTexts += change
+            metrics.setGauge("conversai_embedding_queue_depth", self.queuedTexts, help="Texts waiting to be embedded.")
+
+    def pendingSize(self, query: bool) -> int:
+        """Return the number of texts waiting in a lane."""
+        return sum(len(request.texts) for request in self.pending[query])
+
+    def isDue(self, query: bool, now: float) -> bool:
+        """Check whether a lane holds a full batch or a request that waited long enough."""
+        lane = self.pending[query]
+        return bool(lane) and (self.pendingSize(query) >= self.maxBatchSize or now >= lane[0].enqueued + self.maxWait)
+
+    def drain(self) -> None:
+        """Move every queued request to its lane without blocking."""
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is None:
+                self.stopping = True
+            else:
+                self.pending[request.query].append(request)
+
+    def dispatch(self) -> None:
+        """Form batches from the queued requests and hand them to the workers, until closed."""
+        while True:
+            lanes = [lane[0].enqueued + self.maxWait for lane in self.pending.values() if lane]
+            timeout = max(min(lanes) - time.perf_counter(), 0) if lanes else None
+            if not self.stopping:
+                try:
+                    request = self.requests.get(timeout=timeout)
+                    if request is None:
+                        self.stopping = True
+                    else:
+                        self.pending[request.query].append(request)
+                except queue.Empty:
+                    pass
+            now = time.perf_counter()
+            for query in (True, False):
+                if self.stopping or self.isDue(query, now):
+                    self.flush(query)
+            if self.stopping and not any(self.pending.values()):
+                self.drain()
+                if not any(self.pending.values()):
+                    return
+
+    def flush(self, query: bool) -> None:
+        """
+        Dispatch a batch from a lane once a worker is free.
+
+        Requests queued while waiting for the worker join the lane, so the batch takes them along.
+
+        Args:
+            query (bool): The lane to dispatch from.
+        """
+        if not self.pending[query]:
+            return
+        self.slots.acquire()
+        self.drain()
+        lane, batch, size = self.pending[query], [], 0
+        while lane and (not batch or size + len(lane[0].texts) <= self.maxBatchSize):
+            request = lane.pop(0)
+            self.updateDepth(-len(request.texts))
+            if request.future.set_running_or_notify_cancel():
+                batch.append(request)
+                size += len(request.texts)
+        if not batch:
+            self.slots.release()
+            return
+        self.executor.submit(self.runBatch, query, batch)
+
+    def runBatch(self, query: bool, batch: list[EmbeddingRequest]) -> None:
+        """
+        Embed a batch in one call and resolve the futures of its requests.
+
+        Args:
+            query (bool): Whether the batch holds queries.
+            batch (list[EmbeddingRequest]): The requests of the batch.
+        """
+        try:
+            dispatched = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            for request in batch:
+                metrics.observe("conversai_embedding_wait_seconds", dispatched - request.enqueued, help="Time requests waited for an embedding batch in seconds.")
+            metrics.observe("conversai_embedding_batch_size", len(texts), {"kind": "query" if query else "document"}, help="Texts per embedding batch.", buckets=SIZE_BUCKETS)
+            if query and not self.batchQueries:
+                vectors = [self.embeddings.embed_query(text) for text in texts]
+            else:
+                vectors = self.embeddings.embed_documents(texts)
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self.slots.release()
+
+    def close(self) -> None:
+        """Embed the queued requests, then stop the dispatcher and the workers."""
+        if not self.stopping:
+            self.requests.put(None)
+            self.dispatcher.join()
+            self.executor.shutdown(wait=True)
+
+class BatchedEmbeddings(Embeddings):
+    def __init__(self, service: EmbeddingService) -> None:
+        """
+        Initialize embeddings served by an EmbeddingService.
+
+        Args:
+            service (EmbeddingService): The service batching the requests.
+        """
+        self.service = service
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents in the service's next batch."""
+        return self.service.submit(texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query in the service's next batch of queries."""
+        return self.service.submit([text], query=True).result()[0]
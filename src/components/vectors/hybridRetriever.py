@@ -0,0 +1,98 @@
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from src.components.vectors.numpyIndex import NumpyVectorIndex
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+from pydantic import ConfigDict
+from typing import Optional
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieve chunks from a NumpyVectorIndex by fusing its dense and BM25 rankings.
+
+    In "hybrid" mode the fetchK best chunks of the BM25 ranking are merged by reciprocal rank fusion
+    with the dense ranking, the fetchK most similar chunks or, with searchType "mmr", the k chunks
+    selected among them by maximal marginal relevance, unless the query matches lexically so
+    strongly that the dense ranking, and the embedding of the query, can be skipped. In "lexical"
+    mode only the BM25 ranking is used. Both rankings only score the chunks matching the metadata
+    filter, when one is set.
+    """
+
+    vectorstore: NumpyVectorIndex
+    mode: str = "hybrid"
+    k: int = 5
+    fetchK: int = 10
+    rrfK: int = 60
+    searchType: str = "similarity"
+    lambdaMult: float = 0.5
+    lexicalFastPath: bool = True
+    lexicalMargin: float = 2.0
+    lexicalCoverage: float = 0.9
+    filter: Optional[dict] = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def isStrongMatch(self, hits: list[tuple[Document, float, float]]) -> bool:
+        """
+        Decide whether lexical hits are conclusive on their own.
+
+        Args:
+            hits (list[tuple[Document, float, float]]): The BM25 hits of the query, best first.
+
+        Returns:
+            bool: True if the best hit covers at least lexicalCoverage of the inverse document frequency
+                of the indexed query terms and outscores the next hit by lexicalMargin.
+        """
+        if not hits or hits[0][2] < self.lexicalCoverage:
+            return False
+        return len(hits) == 1 or hits[0][1] >= self.lexicalMargin * hits[1][1]
+
+    def skipsEmbedding(self, query: str) -> bool:
+        """
+        Check whether retrieving for a query needs no query embedding.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            bool: True in "lexical" mode or when the query matches lexically strongly enough to skip the dense ranking.
+        """
+        if self.mode == "lexical":
+            return True
+        return self.lexicalFastPath and self.isStrongMatch(self.vectorstore.lexicalSearchWithScore(query, k=self.fetchK, filter=self.filter))
+
+    def fuse(self, rankings: list[list[Document]]) -> list[Document]:
+        """
+        Merge rankings by reciprocal rank fusion.
+
+        Args:
+            rankings (list[list[Document]]): The rankings to merge, best first.
+
+        Returns:
+            list[Document]: The chunks of all rankings ordered by their summed 1 / (rrfK + rank) scores.
+        """
+        scores, documents = {}, {}
+        for ranking in rankings:
+            for rank, document in enumerate(ranking, start=1):
+                scores[document.id] = scores.get(document.id, 0.0) + 1 / (self.rrfK + rank)
+                documents.setdefault(document.id, document)
+        return [documents[chunkId] for chunkId in sorted(scores, key=scores.get, reverse=True)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        """
+        Return the k chunks most relevant to a query.
+
+        Args:
+            query (str): The query text.
+            run_manager (CallbackManagerForRetrieverRun): The callback manager of the run.
+
+        Returns:
+            list[Document]: The retrieved chunks, best first.
+        """
+        hits = self.vectorstore.lexicalSearchWithScore(query, k=self.fetchK, filter=self.filter)
+        if self.mode == "lexical" or (self.lexicalFastPath and self.isStrongMatch(hits)):
+            return [document for document, _, _ in hits[:self.k]]
+        if self.searchType == "mmr":
+            dense = self.vectorstore.max_marginal_relevance_search(query, k=self.k, fetch_k=self.fetchK, lambda_mult=self.lambdaMult, filter=self.filter)
+        else:
+            dense = self.vectorstore.similarity_search(query, k=self.fetchK, filter=self.filter)
+        return self.fuse([dense, [document for document, _, _ in hits]])[:self.k]
@@ -0,0 +1,152 @@
+from collections import Counter
+import numpy as np
+import threading
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-]\w+)*")
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        Initialize an in-process BM25 inverted index over chunk texts.
+
+        Postings are kept per term as growable lists and frozen into NumPy arrays on first use,
+        so that a query costs one vectorized accumulation per query term.
+
+        Args:
+            k1 (float): The term frequency saturation parameter.
+            b (float): The document length normalization parameter.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, tuple[list[int], list[int]]] = {}
+        self.frozen: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.documentFrequency: Counter = Counter()
+        self.ids: list[str] = []
+        self.rowTerms: list[tuple[str, ...]] = []
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.idToRow: dict[str, int] = {}
+        self.totalLength = 0.0
+        self.liveCount = 0
+        self.norms = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        """
+        Split text into lowercase terms, keeping dotted and hyphenated identifiers whole.
+
+        Args:
+            text (str): The text to tokenize.
+
+        Returns:
+            list[str]: The terms of the text.
+        """
+        return TOKEN_PATTERN.findall(text.lower())
+
+    def add(self, ids: list[str], texts: list[str]) -> None:
+        """
+        Index chunk texts.
+
+        Args:
+            ids (list[str]): The ID of each chunk.
+            texts (list[str]): The chunk texts.
+        """
+        counts = [Counter(self.tokenize(text)) for text in texts]
+        with self.lock:
+            start = len(self.ids)
+            lengths = np.array([sum(count.values()) for count in counts], dtype=np.float32)
+            self.lengths = np.concatenate([self.lengths, lengths])
+            self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+            for offset, (chunkId, count) in enumerate(zip(ids, counts)):
+                row = start + offset
+                self.idToRow[chunkId] = row
+                self.ids.append(chunkId)
+                self.rowTerms.append(tuple(count))
+                for term, frequency in count.items():
+                    rows, frequencies = self.postings.setdefault(term, ([], []))
+                    rows.append(row)
+                    frequencies.append(frequency)
+                    self.documentFrequency[term] += 1
+                    self.frozen.pop(term, None)
+            self.totalLength += float(lengths.sum())
+            self.liveCount += len(ids)
+            self.norms = None
+
+    def delete(self, ids: list[str]) -> None:
+        """
+        Remove chunks from the index. Their postings are masked out rather than rewritten.
+
+        Args:
+            ids (list[str]): The IDs of the chunks to remove.
+        """
+        with self.lock:
+            for chunkId in ids:
+                row = self.idToRow.pop(chunkId, None)
+                if row is None or not self.alive[row]:
+                    continue
+                self.alive[row] = False
+                self.totalLength -= float(self.lengths[row])
+                self.liveCount -= 1
+                for term in self.rowTerms[row]:
+                    self.documentFrequency[term] -= 1
+                self.norms = None
+
+    def getPostings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows and term frequencies of a term as arrays. Expects the lock to be held."""
+        if term not in self.frozen:
+            rows, frequencies = self.postings.get(term, ([], []))
+            self.frozen[term] = (np.array(rows, dtype=np.int64), np.array(frequencies, dtype=np.float32))
+        return self.frozen[term]
+
+    def idf(self, term: str) -> float:
+        """Return the BM25 inverse document frequency of a term. Expects the lock to be held."""
+        frequency = self.documentFrequency.get(term, 0)
+        return math.log(1 + (self.liveCount - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query: str, k: int, ids: list[str] = None) -> list[tuple[str, float, float]]:
+        """
+        Return the k chunks with the highest BM25 scores for a query.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of chunks to return.
+            ids (list[str], optional): The chunks to search. Postings of other chunks are skipped before scoring.
+
+        Returns:
+            list[tuple[str, float, float]]: The chunk ID, its score and the share of the inverse document
+                frequency of the indexed query terms it contains, best first.
+        """
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        with self.lock:
+            if self.liveCount == 0 or not terms:
+                return []
+            if self.norms is None:
+                averageLength = self.totalLength / self.liveCount
+                self.norms = self.k1 * (1 - self.b + self.b * self.lengths / averageLength)
+            allowed = None
+            if ids is not None:
+                allowed = np.zeros(len(self.ids), dtype=bool)
+                allowed[[self.idToRow[chunkId] for chunkId in ids if chunkId in self.idToRow]] = True
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            covered = np.zeros(len(self.ids), dtype=np.float32)
+            totalIdf = 0.0
+            for term in terms:
+                if self.documentFrequency.get(term, 0) <= 0:
+                    continue
+                rows, frequencies = self.getPostings(term)
+                if allowed is not None:
+                    keep = allowed[rows]
+                    rows, frequencies = rows[keep], frequencies[keep]
+                idf = self.idf(term)
+                scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + self.norms[rows])
+                covered[rows] += idf
+                totalIdf += idf
+            scores[~self.alive] = 0
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [(self.ids[row], float(scores[row]), float(covered[row] / totalIdf)) for row in candidates]
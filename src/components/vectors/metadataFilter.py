@@ -0,0 +1,92 @@
+from typing import Any
+
+OPERATORS = ("$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte")
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+def normalizeCondition(condition: Any) -> dict:
+    """
+    Turn the condition of a metadata filter on one field into a dict of operators.
+
+    Args:
+        condition (Any): A value the field must equal, a list of values it must be one of, or a dict
+            of operators: "$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt" and "$lte".
+
+    Returns:
+        dict: The operators and their operands.
+
+    Raises:
+        ValueError: If the condition uses an unknown operator.
+    """
+    if isinstance(condition, dict):
+        unknown = set(condition) - set(OPERATORS)
+        if unknown:
+            raise ValueError(f"Unsupported filter operators: {sorted(unknown)}")
+        return condition
+    if isinstance(condition, (list, tuple, set)):
+        return {"$in": list(condition)}
+    return {"$eq": condition}
+
+def validateFilter(filter: dict) -> None:
+    """
+    Check that a metadata filter is well formed before it is used.
+
+    Args:
+        filter (dict): The conditions of each field, as accepted by normalizeCondition.
+
+    Raises:
+        ValueError: If the filter is not a dict of conditions, uses an unknown operator, or gives a range
+            operator a non-numeric operand or "$in" or "$nin" a non-list operand.
+    """
+    if not isinstance(filter, dict):
+        raise ValueError("A metadata filter must map fields to conditions")
+    for field, condition in filter.items():
+        for operator, operand in normalizeCondition(condition).items():
+            if operator in RANGE_OPERATORS and not isNumber(operand):
+                raise ValueError(f"Operator {operator} on '{field}' needs a number")
+            if operator in ("$in", "$nin") and not isinstance(operand, (list, tuple, set)):
+                raise ValueError(f"Operator {operator} on '{field}' needs a list")
+
+def isNumber(value: Any) -> bool:
+    """Check whether a metadata value can be compared by a range operator."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def matchesOperator(value: Any, operator: str, operand: Any) -> bool:
+    """
+    Check a metadata value against one operator.
+
+    Args:
+        value (Any): The value of the field, None when missing.
+        operator (str): The operator.
+        operand (Any): The operand of the operator.
+
+    Returns:
+        bool: Whether the value satisfies the operator. Range operators never match non-numeric values.
+    """
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if not isNumber(value):
+        return False
+    return {"$gt": value > operand, "$gte": value >= operand, "$lt": value < operand, "$lte": value <= operand}[operator]
+
+def matchesFilter(metadata: dict, filter: dict) -> bool:
+    """
+    Check the metadata of a chunk against a filter, all of whose field conditions must hold.
+
+    Args:
+        metadata (dict): The metadata of the chunk.
+        filter (dict): The conditions of each field, as accepted by normalizeCondition.
+
+    Returns:
+        bool: Whether the chunk matches.
+    """
+    return all(
+        matchesOperator(metadata.get(field), operator, operand)
+        for field, condition in filter.items()
+        for operator, operand in normalizeCondition(condition).items()
+    )
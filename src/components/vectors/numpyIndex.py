@@ -0,0 +1,689 @@
+from langchain_core.vectorstores import VectorStore as BaseVectorStore
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+from src.components.vectors.metadataFilter import RANGE_OPERATORS, isNumber, normalizeCondition
+from src.components.vectors.lexicalIndex import BM25Index
+from src.utils.functions import getFingerprint
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Iterable, Iterator, Optional
+import numpy as np
+import threading
+import shutil
+import glob
+import json
+import time
+import uuid
+import os
+try:
+    import fcntl
+except ImportError:  # Windows: saves are only serialized within the process
+    fcntl = None
+
+LOAD_ATTEMPTS = 5
+QUERY_MEMO_SIZE = 64
+SAVE_LOCKS: dict[str, threading.Lock] = {}
+SAVE_LOCKS_LOCK = threading.Lock()
+
+@contextmanager
+def lockDirectory(directory: str) -> Iterator[None]:
+    """
+    Hold the save lock of an index directory, across threads and processes.
+
+    Args:
+        directory (str): The directory of the index.
+    """
+    path = os.path.abspath(directory)
+    with SAVE_LOCKS_LOCK:
+        lock = SAVE_LOCKS.setdefault(path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+COMPARISONS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+class NumpyVectorIndex(BaseVectorStore):
+    blockSize = 65536  # Rows decoded to float32 at a time when scoring compressed vectors
+    scoreBudget = 64 * 1024 * 1024  # Bytes of query scores computed at a time when searching in batch
+
+    def __init__(self, embedding: Embeddings, dtype: str = "float32", lexical: bool = False) -> None:
+        """
+        Initialize an in-memory vector index holding all chunk vectors in one contiguous matrix.
+
+        Vectors are L2-normalized on insertion, so that inner products are cosine similarities.
+
+        Args:
+            embedding (Embeddings): The embedding model used for texts and queries.
+            dtype (str): The storage type of the vectors, one of "float32", "float16" or "int8".
+            lexical (bool): Whether to maintain a BM25 index of the chunk texts as chunks are added.
+        """
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype '{dtype}'")
+        self.embedding = embedding
+        self.dtype = dtype
+        self.vectors = None
+        self.scales = np.ones(0, dtype=np.float32)
+        self.count = 0
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.metadatas: list[dict] = []
+        self.idToRow: dict[str, int] = {}
+        self.lexicalIndex = BM25Index() if lexical else None
+        self.sourceCounts: Counter = Counter()
+        self.valueRows: dict[str, dict[Any, list[int]]] = {}  # Rows of each value of the fields filtered on
+        self.numericColumns: dict[str, np.ndarray] = {}  # Values of the fields filtered by range, NaN when missing
+        self.fingerprint = None
+        self.queryVectors: OrderedDict[str, list[float]] = OrderedDict()  # Embeddings handed over by rememberQuery
+        self.lock = threading.RLock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Return the embedding model of the index."""
+        return self.embedding
+
+    @property
+    def nbytes(self) -> int:
+        """Return the approximate memory held by the vectors and texts of the index, in bytes."""
+        vectorBytes = self.vectors[:self.count].nbytes + self.scales[:self.count].nbytes if self.vectors is not None else 0
+        return vectorBytes + sum(len(text.encode("utf-8")) for text in self.texts)
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Normalize float32 vectors and convert them to the storage type.
+
+        Args:
+            vectors (np.ndarray): The vectors, one per row.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The stored rows and their per-row dequantization scales.
+        """
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales = np.maximum(scales, 1e-12).astype(np.float32)
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales
+        return vectors.astype(self.dtype), np.ones(len(vectors), dtype=np.float32)
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Convert stored rows back to float32 vectors.
+
+        Args:
+            rows (np.ndarray): Row indices into the index.
+
+        Returns:
+            np.ndarray: The float32 vectors of the rows.
+        """
+        vectors = self.vectors[rows].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def addVectors(self, vectors: list[list[float]], texts: list[str], metadatas: list[dict], ids: list[str]) -> list[str]:
+        """
+        Append precomputed vectors with their texts to the index.
+
+        Args:
+            vectors (list[list[float]]): The embeddings of the texts.
+            texts (list[str]): The chunk texts.
+            metadatas (list[dict]): The metadata of each chunk.
+            ids (list[str]): The ID of each chunk.
+
+        Returns:
+            list[str]: The IDs of the added chunks.
+        """
+        if not texts:
+            return []
+        rows, scales = self.encode(np.asarray(vectors, dtype=np.float32))
+        with self.lock:
+            needed = self.count + len(rows)
+            if self.vectors is None or needed > len(self.vectors):
+                capacity = max(needed, 2 * (len(self.vectors) if self.vectors is not None else 0), 1024)
+                grown = np.zeros((capacity, rows.shape[1]), dtype=rows.dtype)
+                grownScales = np.ones(capacity, dtype=np.float32)
+                if self.vectors is not None:
+                    grown[:self.count] = self.vectors[:self.count]
+                    grownScales[:self.count] = self.scales[:self.count]
+                self.vectors, self.scales = grown, grownScales
+            self.vectors[self.count:needed] = rows
+            self.scales[self.count:needed] = scales
+            for offset, chunkId in enumerate(ids):
+                self.idToRow[chunkId] = self.count + offset
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self.indexMetadata(self.count, metadatas)
+            self.count = needed
+            self.sourceCounts.update(metadata.get("source") or chunkId for chunkId, metadata in zip(ids, metadatas))
+            self.fingerprint = None
+            if self.lexicalIndex is not None:
+                self.lexicalIndex.add(ids, texts)
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, *, ids: Optional[list[str]] = None, **kwargs: Any) -> list[str]:
+        """
+        Embed texts and add them to the index.
+
+        Args:
+            texts (Iterable[str]): The texts to add.
+            metadatas (Optional[list[dict]]): The metadata of each text.
+            ids (Optional[list[str]]): The ID of each text. Random IDs are generated when missing.
+
+        Returns:
+            list[str]: The IDs of the added texts.
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [chunkId or str(uuid.uuid4()) for chunkId in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = self.embedding.embed_documents(texts) if texts else []
+        return self.addVectors(vectors=vectors, texts=texts, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Remove chunks from the index, compacting the vector matrix.
+
+        Args:
+            ids (Optional[list[str]]): The IDs of the chunks to remove.
+
+        Returns:
+            Optional[bool]: True if the deletion completed.
+        """
+        with self.lock:
+            removed = {self.idToRow[chunkId] for chunkId in ids or [] if chunkId in self.idToRow}
+            if not removed:
+                return True
+            keep = np.array([row for row in range(self.count) if row not in removed], dtype=np.int64)
+            self.sourceCounts.subtract(self.metadatas[row].get("source") or self.ids[row] for row in removed)
+            self.sourceCounts = +self.sourceCounts
+            self.fingerprint = None
+            self.vectors = self.vectors[keep].copy()
+            self.scales = self.scales[keep].copy()
+            self.ids = [self.ids[row] for row in keep]
+            self.texts = [self.texts[row] for row in keep]
+            self.metadatas = [self.metadatas[row] for row in keep]
+            self.idToRow = {chunkId: row for row, chunkId in enumerate(self.ids)}
+            self.count = len(keep)
+            self.valueRows, self.numericColumns = {}, {}  # Rebuilt for the compacted rows on the next filter
+            if self.lexicalIndex is not None:
+                self.lexicalIndex.delete(ids)
+        return True
+
+    def getContentFingerprint(self) -> str:
+        """
+        Return a fingerprint of the sources held by the index and of their number of chunks.
+
+        Chunks without a "source" metadata count as sources of their own, so that indexes built from
+        untagged text never share a fingerprint. The chunk counts change the fingerprint while a
+        source is still being ingested, so that answers from a partial index are never taken for
+        answers from the complete one.
+
+        Returns:
+            str: The hex digest of the sorted sources and their chunk counts.
+        """
+        with self.lock:
+            if self.fingerprint is None:
+                self.fingerprint = getFingerprint(*(f"{source}:{count}" for source, count in sorted(self.sourceCounts.items())))
+            return self.fingerprint
+
+    def get_by_ids(self, ids: list[str], /) -> list[Document]:
+        """
+        Return the chunks with the given IDs.
+
+        Args:
+            ids (list[str]): The IDs to look up.
+
+        Returns:
+            list[Document]: The chunks found.
+        """
+        with self.lock:
+            return [self.getDocument(self.idToRow[chunkId]) for chunkId in ids if chunkId in self.idToRow]
+
+    def getDocument(self, row: int) -> Document:
+        """Build the Document of a row."""
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=self.metadatas[row])
+
+    @staticmethod
+    def numbers(field: str, metadatas: list[dict]) -> np.ndarray:
+        """Return the numeric values of a metadata field, NaN where missing or not numeric."""
+        return np.array([value if isNumber(value) else np.nan for value in (metadata.get(field) for metadata in metadatas)], dtype=np.float64)
+
+    @staticmethod
+    def indexField(field: str, postings: dict[Any, list[int]], start: int, metadatas: list[dict]) -> None:
+        """Add the rows of the metadatas starting at a row to the rows of each value of a field."""
+        for offset, metadata in enumerate(metadatas):
+            value = metadata.get(field)
+            if isinstance(value, (str, int, float)):
+                postings.setdefault(value, []).append(start + offset)
+
+    def indexMetadata(self, start: int, metadatas: list[dict]) -> None:
+        """Add rows to the indexes of the metadata fields already filtered on. Expects the lock to be held."""
+        for field, postings in self.valueRows.items():
+            self.indexField(field, postings, start, metadatas)
+        for field, column in self.numericColumns.items():
+            self.numericColumns[field] = np.concatenate([column, self.numbers(field, metadatas)])
+
+    def matchOperator(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        """
+        Select the rows whose metadata field satisfies one operator. Expects the lock to be held.
+
+        Equality operators read the rows of each value from an index of the field, built on first
+        use. Range operators compare a numeric column of the field.
+
+        Args:
+            field (str): The metadata field.
+            operator (str): The operator, see metadataFilter.normalizeCondition.
+            operand (Any): The operand of the operator.
+
+        Returns:
+            np.ndarray: The matching rows, in ascending order.
+        """
+        if operator in RANGE_OPERATORS:
+            if not isNumber(operand):
+                raise ValueError(f"Operator {operator} on '{field}' needs a number")
+            if field not in self.numericColumns:
+                self.numericColumns[field] = self.numbers(field, self.metadatas)
+            return np.flatnonzero(COMPARISONS[operator](self.numericColumns[field], operand))
+        if field not in self.valueRows:
+            self.valueRows[field] = {}
+            self.indexField(field, self.valueRows[field], 0, self.metadatas)
+        values = [operand] if operator in ("$eq", "$ne") else list(dict.fromkeys(operand))
+        postings = [np.asarray(self.valueRows[field].get(value, []), dtype=np.int64) for value in values if isinstance(value, (str, int, float))]
+        if len(postings) == 1:
+            rows = postings[0]  # Rows are appended in ascending order
+        else:
+            rows = np.unique(np.concatenate(postings)) if postings else np.zeros(0, dtype=np.int64)
+        if operator in ("$ne", "$nin"):
+            rows = np.setdiff1d(np.arange(self.count), rows, assume_unique=True)
+        return rows
+
+    def filterRows(self, filter: dict) -> np.ndarray:
+        """
+        Select the rows whose metadata match a filter, before any scoring. Expects the lock to be held.
+
+        Args:
+            filter (dict): The conditions each field must satisfy, see metadataFilter.normalizeCondition.
+
+        Returns:
+            np.ndarray: The matching rows, in ascending order.
+        """
+        rows = None
+        for field, condition in filter.items():
+            for operator, operand in normalizeCondition(condition).items():
+                matched = self.matchOperator(field, operator, operand)
+                rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows if rows is not None else np.arange(self.count)
+
+    def scoreRows(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Compute the cosine similarities of normalized queries against selected rows of the index.
+
+        When more than a fifth of the rows are selected, scoring the whole index is cheaper than gathering them.
+
+        Args:
+            queries (np.ndarray): The normalized float32 queries, one per row.
+            rows (np.ndarray, optional): The rows to score. Every row is scored when None.
+
+        Returns:
+            np.ndarray: The similarities, one row per query and one column per selected row.
+        """
+        if rows is None:
+            return self.scoreVectors(queries, self.count)
+        if 5 * len(rows) > self.count:
+            return self.scoreVectors(queries, self.count)[:, rows]
+        if self.dtype == "float32":
+            return queries @ self.vectors[rows].T
+        scores = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self.blockSize):
+            block = rows[start:start + self.blockSize]
+            scores[:, start:start + len(block)] = queries @ self.decode(block).T
+        return scores
+
+    def scoreVectors(self, queries: np.ndarray, count: int) -> np.ndarray:
+        """
+        Compute the cosine similarities of normalized queries against the first rows of the index.
+
+        Args:
+            queries (np.ndarray): The normalized float32 queries, one per row.
+            count (int): The number of rows to score.
+
+        Returns:
+            np.ndarray: The similarities, one row per query and one column per chunk.
+        """
+        if self.dtype == "float32":
+            return queries @ self.vectors[:count].T
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, self.blockSize):
+            end = min(start + self.blockSize, count)
+            scores[:, start:end] = queries @ self.decode(np.arange(start, end)).T
+        return scores
+
+    def normalizeQueries(self, embeddings: list[list[float]]) -> np.ndarray:
+        """Convert query embeddings to normalized float32 rows."""
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        return queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    def topRows(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Select the indices of the k highest scores, best first.
+
+        Args:
+            scores (np.ndarray): The scores of one query.
+            k (int): The number of rows to select.
+
+        Returns:
+            np.ndarray: The selected indices.
+        """
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def topCandidates(self, scores: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Select the k best scored rows, best first.
+
+        Args:
+            scores (np.ndarray): The scores of one query against the scored rows.
+            rows (np.ndarray): The scored rows, or None when every row was scored.
+            k (int): The number of rows to select.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The selected rows and their scores.
+        """
+        positions = self.topRows(scores, k)
+        return (positions if rows is None else rows[positions]), scores[positions]
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4, filter: dict = None, **kwargs: Any) -> list[tuple[Document, float]]:
+        """
+        Return the k chunks most similar to an embedding, with their cosine similarities.
+
+        Args:
+            embedding (list[float]): The query embedding.
+            k (int): The number of chunks to return.
+            filter (dict, optional): The metadata conditions of the chunks to search, applied before scoring.
+
+        Returns:
+            list[tuple[Document, float]]: The chunks and their similarities, best first.
+        """
+        with self.lock:
+            rows = self.filterRows(filter) if filter else None
+            if self.count == 0 or (rows is not None and len(rows) == 0):
+                return []
+            rows, scores = self.topCandidates(self.scoreRows(self.normalizeQueries(embedding), rows)[0], rows, k)
+            return [(self.getDocument(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        """Return the k chunks most similar to an embedding."""
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def rememberQuery(self, query: str, embedding: list[float]) -> None:
+        """
+        Hand over the embedding of a query about to be searched, so that the search does not embed it again.
+
+        The embedding is used by the next search of the query only, and the QUERY_MEMO_SIZE latest
+        ones are kept.
+
+        Args:
+            query (str): The query text.
+            embedding (list[float]): Its embedding by the embedding model of the index.
+        """
+        with self.lock:
+            self.queryVectors[query] = embedding
+            self.queryVectors.move_to_end(query)
+            while len(self.queryVectors) > QUERY_MEMO_SIZE:
+                self.queryVectors.popitem(last=False)
+
+    def embedQuery(self, query: str) -> list[float]:
+        """Embed a query, taking the embedding handed over by rememberQuery when there is one."""
+        with self.lock:
+            embedding = self.queryVectors.pop(query, None)
+        return embedding if embedding is not None else self.embedding.embed_query(query)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        """Return the k chunks most similar to a query, with their cosine similarities."""
+        return self.similarity_search_with_score_by_vector(self.embedQuery(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        """Return the k chunks most similar to a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        """Map cosine similarities to relevance scores in [0, 1]."""
+        return lambda score: (score + 1) / 2
+
+    def selectMmrRows(self, candidates: np.ndarray, relevance: np.ndarray, k: int, lambdaMult: float) -> list[int]:
+        """
+        Greedily pick k rows among candidates by maximal marginal relevance, as matrix operations.
+
+        Args:
+            candidates (np.ndarray): The candidate rows, best first.
+            relevance (np.ndarray): The similarity of each candidate to the query.
+            k (int): The number of rows to pick.
+            lambdaMult (float): The trade-off between relevance (1) and diversity (0).
+
+        Returns:
+            list[int]: The picked rows, in selection order.
+        """
+        if len(candidates) == 0:
+            return []
+        candidateVectors = self.decode(candidates)
+        redundancy = candidateVectors @ candidateVectors.T
+        selected = [0]
+        maxRedundancy = redundancy[:, 0].copy()
+        available = np.ones(len(candidates), dtype=bool)
+        available[0] = False
+        while len(selected) < min(k, len(candidates)):
+            mmrScores = lambdaMult * relevance - (1 - lambdaMult) * maxRedundancy
+            mmrScores[~available] = -np.inf
+            best = int(np.argmax(mmrScores))
+            selected.append(best)
+            available[best] = False
+            np.maximum(maxRedundancy, redundancy[:, best], out=maxRedundancy)
+        return [int(candidates[index]) for index in selected]
+
+    def getLexicalIndex(self) -> BM25Index:
+        """Return the BM25 index of the chunk texts, building it on first use for indexes created without one."""
+        with self.lock:
+            if self.lexicalIndex is None:
+                self.lexicalIndex = BM25Index()
+                self.lexicalIndex.add(self.ids, self.texts)
+            return self.lexicalIndex
+
+    def lexicalSearchWithScore(self, query: str, k: int = 4, filter: dict = None) -> list[tuple[Document, float, float]]:
+        """
+        Return the k chunks with the highest BM25 scores for a query, without embedding it.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of chunks to return.
+            filter (dict, optional): The metadata conditions of the chunks to search, applied before scoring.
+
+        Returns:
+            list[tuple[Document, float, float]]: The chunks, their BM25 scores and the share of the
+                inverse document frequency of the indexed query terms they contain, best first.
+        """
+        with self.lock:
+            ids = [self.ids[row] for row in self.filterRows(filter)] if filter else None
+            hits = self.getLexicalIndex().search(query, k, ids=ids)
+            return [(self.getDocument(self.idToRow[chunkId]), score, coverage) for chunkId, score, coverage in hits]
+
+    def max_marginal_relevance_search_by_vector(self, embedding: list[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, filter: dict = None, **kwargs: Any) -> list[Document]:
+        """
+        Return k chunks selected by maximal marginal relevance among the fetch_k most similar to an embedding.
+
+        Args:
+            embedding (list[float]): The query embedding.
+            k (int): The number of chunks to return.
+            fetch_k (int): The number of candidates to select from.
+            lambda_mult (float): The trade-off between relevance (1) and diversity (0).
+            filter (dict, optional): The metadata conditions of the chunks to search, applied before scoring.
+
+        Returns:
+            list[Document]: The selected chunks.
+        """
+        with self.lock:
+            rows = self.filterRows(filter) if filter else None
+            if self.count == 0 or (rows is not None and len(rows) == 0):
+                return []
+            candidates, relevance = self.topCandidates(self.scoreRows(self.normalizeQueries(embedding), rows)[0], rows, fetch_k)
+            return [self.getDocument(row) for row in self.selectMmrRows(candidates, relevance, k, lambda_mult)]
+
+    def searchBatchByVectors(self, embeddings: list[list[float]], k: int = 4, fetchK: int = 20, lambdaMult: float = None, filter: dict = None) -> list[list[Document]]:
+        """
+        Search the index for many query embeddings at once.
+
+        Queries are scored against the index as matrix products over blocks of queries sized to keep
+        each score matrix within scoreBudget bytes.
+
+        Args:
+            embeddings (list[list[float]]): The query embeddings.
+            k (int): The number of chunks to return per query.
+            fetchK (int): The number of candidates to select from by maximal marginal relevance.
+            lambdaMult (float, optional): The MMR trade-off between relevance (1) and diversity (0).
+                The k most similar chunks are returned when None.
+            filter (dict, optional): The metadata conditions of the chunks to search, applied before scoring.
+
+        Returns:
+            list[list[Document]]: The chunks of each query, in query order.
+        """
+        queries = self.normalizeQueries(embeddings)
+        results = []
+        with self.lock:
+            selected = self.filterRows(filter) if filter else None
+            scored = self.count if selected is None else len(selected)
+            if scored == 0:
+                return [[] for _ in queries]
+            block = max(1, self.scoreBudget // (4 * scored))
+            for start in range(0, len(queries), block):
+                for scores in self.scoreRows(queries[start:start + block], selected):
+                    if lambdaMult is None:
+                        rows, _ = self.topCandidates(scores, selected, k)
+                    else:
+                        candidates, relevance = self.topCandidates(scores, selected, fetchK)
+                        rows = self.selectMmrRows(candidates, relevance, k, lambdaMult)
+                    results.append([self.getDocument(row) for row in rows])
+        return results
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any) -> list[Document]:
+        """Return k chunks selected by maximal marginal relevance for a query."""
+        return self.max_marginal_relevance_search_by_vector(self.embedQuery(query), k, fetch_k, lambda_mult, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None, *, ids: Optional[list[str]] = None, **kwargs: Any) -> "NumpyVectorIndex":
+        """
+        Build an index from texts.
+
+        Args:
+            texts (list[str]): The texts to index.
+            embedding (Embeddings): The embedding model.
+            metadatas (Optional[list[dict]]): The metadata of each text.
+            ids (Optional[list[str]]): The ID of each text.
+
+        Returns:
+            NumpyVectorIndex: The populated index.
+        """
+        index = cls(embedding=embedding, **kwargs)
+        index.add_texts(texts, metadatas, ids=ids)
+        return index
+
+    def save(self, directory: str, fingerprint: str) -> None:
+        """
+        Persist the index to a directory, replacing any previous version.
+
+        Vectors and scales are written as .npy files so that load can memory-map them. The new version
+        is written aside and swapped in by renaming the previous one out of the way, so the directory
+        is only missing between two renames, which load waits out. Saves to the same directory are
+        serialized across threads and processes, and clear the leftovers of interrupted saves.
+
+        Args:
+            directory (str): The directory to write the index to.
+            fingerprint (str): The fingerprint of the embedding and chunking configuration.
+        """
+        with self.lock:
+            temporary = f"{directory}.tmp-{uuid.uuid4().hex}"
+            os.makedirs(temporary)
+            vectors = self.vectors[:self.count] if self.vectors is not None else np.zeros((0, 0), dtype=self.dtype)
+            np.save(os.path.join(temporary, "vectors.npy"), vectors)
+            np.save(os.path.join(temporary, "scales.npy"), self.scales[:self.count])
+            with open(os.path.join(temporary, "chunks.json"), "w") as file:
+                json.dump({"ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}, file)
+            with open(os.path.join(temporary, "manifest.json"), "w") as file:
+                json.dump({"fingerprint": fingerprint, "dtype": self.dtype, "count": self.count, "createdAt": time.time()}, file)
+        try:
+            with lockDirectory(directory):
+                for leftover in glob.glob(f"{glob.escape(directory)}.old-*"):
+                    shutil.rmtree(leftover, ignore_errors=True)
+                previous = f"{directory}.old-{uuid.uuid4().hex}"
+                try:
+                    os.replace(directory, previous)
+                except FileNotFoundError:
+                    previous = None
+                os.replace(temporary, directory)
+                if previous is not None:
+                    shutil.rmtree(previous, ignore_errors=True)
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)  # Only left when the swap failed
+
+    @classmethod
+    def load(cls, directory: str, embedding: Embeddings, fingerprint: str, maxAge: float = None, discard: bool = True) -> "NumpyVectorIndex":
+        """
+        Open a persisted index with its vectors memory-mapped read-only.
+
+        The mapped pages are loaded lazily and shared by the OS between processes opening the same
+        index. Adding or deleting chunks copies the vectors into memory first.
+
+        Args:
+            directory (str): The directory the index was saved to.
+            embedding (Embeddings): The embedding model used for texts and queries.
+            fingerprint (str): The fingerprint the index must have been saved with.
+            maxAge (float, optional): The age in seconds beyond which the index is considered stale.
+            discard (bool): Whether a stale index or one built with another configuration is deleted.
+
+        Returns:
+            NumpyVectorIndex: The index, or None if it is missing, stale or was built with another configuration.
+        """
+        for attempt in range(LOAD_ATTEMPTS):
+            try:
+                return cls.read(directory, embedding, fingerprint, maxAge, discard)
+            except FileNotFoundError:
+                swapping = glob.glob(f"{glob.escape(directory)}.old-*")
+                if not swapping and not os.path.isfile(os.path.join(directory, "manifest.json")):
+                    return None
+                time.sleep(0.01 * (attempt + 1))  # A save is swapping versions in
+        return None
+
+    @classmethod
+    def read(cls, directory: str, embedding: Embeddings, fingerprint: str, maxAge: float, discard: bool) -> "NumpyVectorIndex":
+        """
+        Open a persisted index as described in load.
+
+        Raises:
+            FileNotFoundError: If the files of the index disappear while they are read.
+        """
+        manifestPath = os.path.join(directory, "manifest.json")
+        with open(manifestPath) as file:
+            manifest = json.load(file)
+        if manifest["fingerprint"] != fingerprint or (maxAge is not None and time.time() - manifest["createdAt"] > maxAge):
+            if discard:
+                shutil.rmtree(directory, ignore_errors=True)
+            return None
+        index = cls(embedding=embedding, dtype=manifest["dtype"])
+        with open(os.path.join(directory, "chunks.json")) as file:
+            chunks = json.load(file)
+        if manifest["count"] > 0:
+            index.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            index.scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode="r")
+        index.count = manifest["count"]
+        index.ids, index.texts, index.metadatas = chunks["ids"], chunks["texts"], chunks["metadatas"]
+        index.idToRow = {chunkId: row for row, chunkId in enumerate(index.ids)}
+        index.sourceCounts = Counter(metadata.get("source") or chunkId for chunkId, metadata in zip(index.ids, index.metadatas))
+        return index
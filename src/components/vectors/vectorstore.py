@@ -1,48 +1,463 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_community.docstore.document import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from src.components.vectors.embeddingService import EmbeddingService, BatchedEmbeddings
+from src.components.vectors.embeddingCache import EmbeddingCache, CachedEmbeddings
+from src.components.vectors.collectionStore import CollectionStore
+from src.components.vectors.metadataFilter import matchesFilter
+from src.components.vectors.hybridRetriever import HybridRetriever
+from src.components.vectors.numpyIndex import NumpyVectorIndex
 from src.utils.exceptions import CustomException
-from src.utils.functions import getConfig
+from src.utils.functions import getConfig, getFingerprint
+from src.utils.models import LazyEmbeddings, embeddingModel
+from src.utils.tracing import tracer
 from src.utils.logging import logger
+from typing import Callable, Iterable
+import threading
+import queue
+import json
+import time
+import uuid
+import os
 
 class VectorStore:
-    def __init__(self):
-        """Initialize the VectorStore with configuration, embeddings, and text splitter."""
+    def __init__(self, embeddings: Embeddings = None):
+        """
+        Initialize the VectorStore with configuration, embeddings, and text splitter.
+
+        Args:
+            embeddings (Embeddings, optional): The embedding model to use instead of the shared [EMBEDDINGS]
+                model, which is loaded on first use.
+        """
         self.config = getConfig(path="config.ini")
-        self.vectorEmbeddings = HuggingFaceEmbeddings(
-            model_name=self.config.get("EMBEDDINGS", "embeddingModel"),
-            model_kwargs={"device": self.config.get("EMBEDDINGS", "device")},
-            encode_kwargs={"normalize_embeddings": self.config.getboolean("EMBEDDINGS", "normalize_embeddings")}
-        )
+        self.vectorEmbeddings = embeddings or LazyEmbeddings(model=embeddingModel)
+        if self.config.getboolean("EMBEDDINGSERVICE", "enabled"):
+            self.vectorEmbeddings = BatchedEmbeddings(
+                service=EmbeddingService(
+                    embeddings=self.vectorEmbeddings,
+                    maxBatchSize=self.config.getint("EMBEDDINGSERVICE", "maxBatchSize"),
+                    maxWaitMs=self.config.getfloat("EMBEDDINGSERVICE", "maxWaitMs"),
+                    workers=self.config.getint("EMBEDDINGSERVICE", "workers"),
+                    batchQueries=self.config.getboolean("EMBEDDINGSERVICE", "batchQueries")
+                )
+            )  # Embeddings of all sessions share micro-batches
+        if self.config.getboolean("EMBEDDINGCACHE", "enabled"):
+            self.vectorEmbeddings = CachedEmbeddings(
+                embeddings=self.vectorEmbeddings,
+                cache=EmbeddingCache(
+                    path=self.config.get("EMBEDDINGCACHE", "path"),
+                    maxSizeMB=self.config.getfloat("EMBEDDINGCACHE", "maxSizeMB")
+                ),
+                modelName=self.config.get("EMBEDDINGS", "embeddingModel"),
+                normalize=self.config.getboolean("EMBEDDINGS", "normalize_embeddings")
+            )
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config.getint("VECTORSTORE", "chunkSize"),
             chunk_overlap=self.config.getint("VECTORSTORE", "chunkOverlap"),
             add_start_index=self.config.getboolean("VECTORSTORE", "addStartIndex")
         )
+        self.configFingerprint = getFingerprint(
+            self.config.get("EMBEDDINGS", "embeddingModel"),
+            self.config.get("EMBEDDINGS", "normalize_embeddings"),
+            self.config.get("VECTORSTORE", "chunkSize"),
+            self.config.get("VECTORSTORE", "chunkOverlap"),
+            self.config.get("VECTORSTORE", "addStartIndex"),
+            self.config.get("VECTORSTORE", "dtype")
+        )
+        self.collections = CollectionStore(
+            path=self.config.get("COLLECTIONS", "path"),
+            embeddings=self.vectorEmbeddings,
+            fingerprint=self.configFingerprint,
+            dtype=self.config.get("VECTORSTORE", "dtype"),
+            lexical=self.config.get("RETRIEVER", "mode") != "dense"
+        )
+
+    def createIndex(self):
+        """
+        Create an empty index of the type set by [RETRIEVER] indexType.
+
+        Returns:
+            VectorStore: A NumpyVectorIndex, or LangChain's InMemoryVectorStore when indexType is "inmemory".
+        """
+        if self.config.get("RETRIEVER", "indexType") == "inmemory":
+            return InMemoryVectorStore(self.vectorEmbeddings)
+        return NumpyVectorIndex(
+            embedding=self.vectorEmbeddings,
+            dtype=self.config.get("VECTORSTORE", "dtype"),
+            lexical=self.config.get("RETRIEVER", "mode") != "dense"
+        )
 
-    def setupStore(self, text: str):
+    def createRetriever(self, store, filter: dict = None):
         """
-        Set up the vector store with the provided text.
+        Wrap an index in a retriever configured by the [RETRIEVER] section.
+
+        With mode "hybrid" or "lexical", a NumpyVectorIndex is wrapped in a HybridRetriever using its
+        BM25 index. Other indexes only support the dense mode.
 
         Args:
-            text (str): The text to store and process.
+            store: The index to retrieve from.
+            filter (dict, optional): The metadata conditions of the chunks to retrieve, see
+                metadataFilter.normalizeCondition. A NumpyVectorIndex applies them before scoring.
 
         Returns:
-            Retriever: A retriever for querying the vector store.
+            Retriever: A retriever for querying the index.
+        """
+        mode = self.config.get("RETRIEVER", "mode")
+        if mode != "dense" and isinstance(store, NumpyVectorIndex):
+            return HybridRetriever(
+                vectorstore=store,
+                mode=mode,
+                k=self.config.getint("RETRIEVER", "k"),
+                fetchK=self.config.getint("RETRIEVER", "fetchK"),
+                rrfK=self.config.getint("RETRIEVER", "rrfK"),
+                searchType=self.config.get("RETRIEVER", "searchType"),
+                lexicalFastPath=self.config.getboolean("RETRIEVER", "lexicalFastPath"),
+                lexicalMargin=self.config.getfloat("RETRIEVER", "lexicalMargin"),
+                lexicalCoverage=self.config.getfloat("RETRIEVER", "lexicalCoverage"),
+                filter=filter
+            )
+        if mode != "dense":
+            logger.warning(f"Retriever mode '{mode}' needs the numpy index, falling back to dense retrieval")
+        searchKwargs = {"k": self.config.getint("RETRIEVER", "k"), "fetch_k": self.config.getint("RETRIEVER", "fetchK")}
+        if filter:
+            searchKwargs["filter"] = filter if isinstance(store, NumpyVectorIndex) else lambda document: matchesFilter(document.metadata, filter)
+        return store.as_retriever(
+            search_type=self.config.get("RETRIEVER", "searchType"),
+            search_kwargs=searchKwargs,
+            metadata={"filter": filter} if filter else None
+        )
+
+    @staticmethod
+    def getFilter(retriever) -> dict:
+        """Return the metadata filter of a retriever built by createRetriever, or None."""
+        if isinstance(retriever, HybridRetriever):
+            return retriever.filter
+        return (retriever.metadata or {}).get("filter")
+
+    def getIndexPath(self, sourceKey: str) -> str:
+        """
+        Return the directory a persisted index is stored in.
+
+        Args:
+            sourceKey (str): The fingerprint of the indexed source.
+
+        Returns:
+            str: The index directory, specific to the source and the embedding and chunking configuration.
+        """
+        return os.path.join(self.config.get("INDEXSTORE", "path"), getFingerprint(sourceKey, self.configFingerprint))
+
+    def persistenceEnabled(self) -> bool:
+        """Return whether built indexes are saved to and loaded from disk."""
+        return self.config.getboolean("INDEXSTORE", "enabled") and self.config.get("RETRIEVER", "indexType") != "inmemory"
+
+    @tracer.traced("vectorstore.load")
+    def loadStore(self, sourceKey: str):
         """
+        Reopen the persisted index of a source, memory-mapping its vectors.
+
+        Args:
+            sourceKey (str): The fingerprint of the indexed source.
+
+        Returns:
+            Retriever: A retriever over the persisted index, or None if the source was not indexed
+                with the current embedding and chunking configuration within [INDEXSTORE] maxAgeHours.
+        """
+        if not self.persistenceEnabled():
+            return None
         try:
-            store = InMemoryVectorStore(self.vectorEmbeddings)
-            textDocument = Document(page_content=text)
-            documents = self.splitter.split_documents([textDocument])
-            store.add_documents(documents=documents)
-            return store.as_retriever(
-                search_type=self.config.get("RETRIEVER", "searchType"),
-                search_kwargs={
-                    "k": self.config.getint("RETRIEVER", "k"),
-                    "fetch_k": self.config.getint("RETRIEVER", "fetchK")
-                }
+            store = NumpyVectorIndex.load(
+                directory=self.getIndexPath(sourceKey),
+                embedding=self.vectorEmbeddings,
+                fingerprint=self.configFingerprint,
+                maxAge=self.config.getfloat("INDEXSTORE", "maxAgeHours") * 3600
             )
+            if store is None:
+                return None
+            logger.info(f"Loaded persisted index with {store.count} chunks")
+            return self.createRetriever(store)
+        except Exception as e:
+            logger.error(CustomException(e))
+
+    @tracer.traced("vectorstore.ingest")
+    def ingest(self, store, documents: Iterable[Document], onBatch: Callable[[int], None] = None, cancel: threading.Event = None) -> int:
+        """
+        Split and embed documents into an index as a bounded producer-consumer pipeline.
+
+        A background thread pulls documents from the iterable, which may be a lazy loader still
+        fetching or OCR'ing, splits them and queues batches of [VECTORSTORE] embedBatchSize chunks.
+        While the calling thread is waiting for chunks, a partial batch is handed over after each
+        document instead, so slow loaders do not hold back chunks that could already be embedded.
+        The calling thread embeds and indexes each batch as it arrives, so the index is queryable
+        after the first batch and at most queueSize batches are held in memory.
+
+        Args:
+            store: The index to add the chunks to.
+            documents (Iterable[Document]): The documents to ingest.
+            onBatch (Callable[[int], None], optional): Called with the number of chunks of each batch once indexed.
+            cancel (threading.Event, optional): Stops the ingestion after the current batch when set.
+
+        Returns:
+            int: The number of chunks added.
+        """
+        batchSize = self.config.getint("VECTORSTORE", "embedBatchSize")
+        batches = queue.Queue(maxsize=self.config.getint("VECTORSTORE", "queueSize"))
+        stop = threading.Event()
+        idle = threading.Event()
+        errors = []
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce() -> None:
+            try:
+                batch = []
+                for document in documents:
+                    if stop.is_set():
+                        return
+                    with tracer.span("vectorstore.split"):
+                        chunks = self.splitter.split_documents([document])
+                    for chunk in chunks:
+                        batch.append(chunk)
+                        if len(batch) >= batchSize:
+                            if not put(batch):
+                                return
+                            batch = []
+                    if batch and idle.is_set() and batches.empty():
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch:
+                    put(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(None)
+
+        start = time.time()
+        producer = threading.Thread(target=tracer.bind(produce), daemon=True)
+        producer.start()
+        count = 0
+        try:
+            while True:
+                idle.set()
+                batch = batches.get()
+                idle.clear()
+                if batch is None:
+                    break
+                self.addBatch(store, batch)
+                if count == 0:
+                    logger.info(f"First chunks queryable after {time.time() - start:.2f}s")
+                count += len(batch)
+                if onBatch is not None:
+                    onBatch(len(batch))
+                if cancel is not None and cancel.is_set():
+                    logger.info(f"Ingestion cancelled after {count} chunks")
+                    break
+        finally:
+            stop.set()
+            producer.join()
+        if errors:
+            raise errors[0]
+        logger.info(f"Ingested {count} chunks in {time.time() - start:.2f}s")
+        return count
+
+    def addBatch(self, store, batch: list[Document]) -> None:
+        """
+        Embed a batch of chunks and add them to an index, tracing both steps.
+
+        Args:
+            store: The index to add the chunks to.
+            batch (list[Document]): The chunks.
+        """
+        if not isinstance(store, NumpyVectorIndex):
+            with tracer.span("vectorstore.index"):
+                store.add_documents(documents=batch)
+            return
+        texts = [chunk.page_content for chunk in batch]
+        with tracer.span("vectorstore.embed", chunks=len(batch)):
+            vectors = store.embeddings.embed_documents(texts)
+        with tracer.span("vectorstore.index", chunks=len(batch)):
+            store.addVectors(vectors=vectors, texts=texts, metadatas=[chunk.metadata for chunk in batch],
+                             ids=[chunk.id or str(uuid.uuid4()) for chunk in batch])
+
+    def setupStore(self, text: str = None, sourceKey: str = None, documents: Iterable[Document] = None,
+                   onRetriever: Callable = None, onBatch: Callable[[int], None] = None, cancel: threading.Event = None):
+        """
+        Set up the vector store with the provided text or documents.
+
+        Args:
+            text (str, optional): The text to store and process.
+            sourceKey (str, optional): The fingerprint of the source of the text. When given, the built
+                index is persisted so that loadStore can reopen it.
+            documents (Iterable[Document], optional): Documents to store instead of the text, each tagged
+                with its source in the "source" metadata. May be a lazy loader, consumed as it yields.
+            onRetriever (Callable, optional): Called with a retriever over the index before it is filled, so
+                that it can be queried while the documents are ingested.
+            onBatch (Callable[[int], None], optional): Called with the number of chunks of each batch once indexed.
+            cancel (threading.Event, optional): Stops the ingestion when set. A cancelled index is not persisted.
+
+        Returns:
+            Retriever: A retriever for querying the vector store.
+        """
+        try:
+            store = self.createIndex()
+            if documents is None:
+                documents = [Document(page_content=text)]
+            if onRetriever is not None:
+                onRetriever(self.createRetriever(store))
+            self.ingest(store, documents, onBatch=onBatch, cancel=cancel)
+            if cancel is not None and cancel.is_set():
+                return self.createRetriever(store)
+            if sourceKey is not None and self.persistenceEnabled():
+                store.save(directory=self.getIndexPath(sourceKey), fingerprint=self.configFingerprint)
+            return self.createRetriever(store)
         except Exception as e:
             logger.error(CustomException(e))
-            print(CustomException(e))
\ No newline at end of file
+            print(CustomException(e))
+
+    def getChunkSources(self, retriever) -> dict[str, list[str]]:
+        """
+        Group the chunk IDs of an index by the source they were split from.
+
+        Args:
+            retriever: A retriever returned by setupStore or loadStore.
+
+        Returns:
+            dict[str, list[str]]: The chunk IDs of each source.
+        """
+        store = retriever.vectorstore
+        if isinstance(store, NumpyVectorIndex):
+            with store.lock:
+                records = list(zip(store.ids, store.metadatas))
+        else:
+            records = [(chunkId, record["metadata"]) for chunkId, record in store.store.items()]
+        sources = {}
+        for chunkId, metadata in records:
+            sources.setdefault(metadata.get("source"), []).append(chunkId)
+        return sources
+
+    def embedQueries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed many queries in one batch, bypassing the persistent embedding cache kept for documents.
+
+        Args:
+            texts (list[str]): The queries.
+
+        Returns:
+            list[list[float]]: The embeddings, in the order of the queries.
+        """
+        embeddings = self.vectorEmbeddings.embeddings if isinstance(self.vectorEmbeddings, CachedEmbeddings) else self.vectorEmbeddings
+        return embeddings.embed_documents(texts)
+
+    def retrieveBatch(self, retriever, questions: list[str], vectors: list[list[float]]) -> list[list[Document]]:
+        """
+        Retrieve the context of many questions at once with the settings of a retriever.
+
+        Over a NumpyVectorIndex, all questions are scored with batched matrix products, and the BM25
+        rankings of a HybridRetriever are fused per question. Other indexes are queried one question
+        at a time.
+
+        Args:
+            retriever: A retriever returned by setupStore or loadStore.
+            questions (list[str]): The questions.
+            vectors (list[list[float]]): The embeddings of the questions.
+
+        Returns:
+            list[list[Document]]: The chunks retrieved for each question, in question order.
+        """
+        store = retriever.vectorstore
+        if not isinstance(store, NumpyVectorIndex):
+            return retriever.batch(questions)
+        filter = self.getFilter(retriever)
+        if isinstance(retriever, HybridRetriever):
+            k, fetchK = retriever.k, retriever.fetchK
+            lexical = [store.lexicalSearchWithScore(question, k=fetchK, filter=filter) for question in questions]
+            if retriever.mode == "lexical":
+                return [[document for document, _, _ in hits[:k]] for hits in lexical]
+            if retriever.searchType == "mmr":
+                dense = store.searchBatchByVectors(vectors, k=k, fetchK=fetchK, lambdaMult=retriever.lambdaMult, filter=filter)
+            else:
+                dense = store.searchBatchByVectors(vectors, k=fetchK, filter=filter)
+            return [
+                [document for document, _, _ in hits[:k]] if retriever.lexicalFastPath and retriever.isStrongMatch(hits)
+                else retriever.fuse([denseHits, [document for document, _, _ in hits]])[:k]
+                for hits, denseHits in zip(lexical, dense)
+            ]
+        searchKwargs = retriever.search_kwargs
+        lambdaMult = searchKwargs.get("lambda_mult", 0.5) if retriever.search_type == "mmr" else None
+        return store.searchBatchByVectors(vectors, k=searchKwargs.get("k", 4), fetchK=searchKwargs.get("fetch_k", 20), lambdaMult=lambdaMult, filter=filter)
+
+    def getIndexFingerprint(self, retriever) -> str:
+        """
+        Fingerprint the content of the index behind a retriever.
+
+        Args:
+            retriever: A retriever returned by setupStore or loadStore.
+
+        Returns:
+            str: A fingerprint of the sources held by the index and their chunk counts, of the metadata
+                filter of the retriever and of the embedding and chunking configuration.
+        """
+        store = retriever.vectorstore
+        filter = self.getFilter(retriever)
+        scope = (json.dumps(filter, sort_keys=True, default=str),) if filter else ()
+        if isinstance(store, NumpyVectorIndex):
+            return getFingerprint(store.getContentFingerprint(), *scope, self.configFingerprint)
+        sources = []
+        for source, chunkIds in self.getChunkSources(retriever).items():
+            sources.extend([f"{source}:{len(chunkIds)}"] if source else chunkIds)
+        return getFingerprint(*sorted(sources), *scope, self.configFingerprint)
+
+    def addDocuments(self, retriever, documents: Iterable[Document]) -> int:
+        """
+        Split, embed and add documents to the live index behind a retriever.
+
+        Args:
+            retriever: A retriever returned by setupStore or loadStore.
+            documents (Iterable[Document]): The documents to add, tagged with their "source" metadata.
+
+        Returns:
+            int: The number of chunks added.
+        """
+        return self.ingest(retriever.vectorstore, documents)
+
+    def removeSources(self, retriever, sources: list[str]) -> int:
+        """
+        Drop every chunk of the given sources from the live index behind a retriever.
+
+        Args:
+            retriever: A retriever returned by setupStore or loadStore.
+            sources (list[str]): The sources to remove.
+
+        Returns:
+            int: The number of chunks removed.
+        """
+        chunkSources = self.getChunkSources(retriever)
+        ids = [chunkId for source in sources for chunkId in chunkSources.get(source, [])]
+        if ids:
+            retriever.vectorstore.delete(ids=ids)
+        return len(ids)
+
+    def getIndexBytes(self, retriever) -> int:
+        """
+        Estimate the memory held by the index behind a retriever.
+
+        Args:
+            retriever: A retriever returned by setupStore.
+
+        Returns:
+            int: The estimated size of the index in bytes.
+        """
+        if isinstance(retriever.vectorstore, NumpyVectorIndex):
+            return retriever.vectorstore.nbytes
+        nbytes = 0
+        for record in retriever.vectorstore.store.values():
+            nbytes += 32 * len(record["vector"]) + len(record["text"].encode("utf-8"))
+        return nbytes
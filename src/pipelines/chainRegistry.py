@@ -0,0 +1,158 @@
+from src.utils.tracing import metrics
+from src.utils.logging import logger
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+import threading
+import time
+
+@dataclass
+class RegistryEntry:
+    chain: Any
+    fingerprint: str
+    nbytes: int
+    lastAccess: float
+
+class ChainRegistry:
+    def __init__(self, maxIndexMB: float, ttlMinutes: float, sizeOf: Callable[[Any], int]) -> None:
+        """
+        Initialize a session-scoped registry of built chains with LRU and TTL eviction.
+
+        Args:
+            maxIndexMB (float): The cap on the total memory of the indexes held, in megabytes.
+            ttlMinutes (float): The idle time after which an entry is evicted, in minutes.
+            sizeOf (Callable[[Any], int]): A function returning the index size of a chain in bytes.
+        """
+        self.maxBytes = int(maxIndexMB * 1024 * 1024)
+        self.ttl = ttlMinutes * 60
+        self.sizeOf = sizeOf
+        self.entries: OrderedDict[tuple[str, str], RegistryEntry] = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytesHeld = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getChain(self, sessionId: str, source: str, fingerprint: str, builder: Callable[[], Any], updater: Callable[[Any], None] = None):
+        """
+        Return the chain of a session and source, building it when missing or when its input changed.
+
+        Args:
+            sessionId (str): The Gradio session hash.
+            source (str): The source the chain was built from, e.g. "text" or "website".
+            fingerprint (str): A fingerprint of the source input the chain must match.
+            builder (Callable[[], Any]): A function building the chain on a miss.
+            updater (Callable[[Any], None], optional): A function bringing an existing chain up to date
+                with the changed input in place. The chain is rebuilt when None.
+
+        Returns:
+            Chain: The registered chain, or None if building it failed.
+        """
+        key = (sessionId, source)
+        with self.lock:
+            self.expire()
+            entry = self.entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self.hits += 1
+                entry.lastAccess = time.time()
+                self.entries.move_to_end(key)
+                return entry.chain
+            self.misses += 1
+            if entry is not None and updater is None:
+                self.remove(key)
+        if entry is not None and updater is not None:
+            updater(entry.chain)
+            chain = entry.chain
+        else:
+            chain = builder()
+        if chain is None:
+            return None
+        nbytes = self.sizeOf(chain)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = RegistryEntry(chain=chain, fingerprint=fingerprint, nbytes=nbytes, lastAccess=time.time())
+            self.bytesHeld += nbytes
+            self.evict()
+        self.report()
+        return chain
+
+    def refresh(self, sessionId: str, source: str, chain: Any = None) -> None:
+        """
+        Measure the index of a registered chain again, evicting entries if it outgrew the cap.
+
+        Chains are registered as soon as their first chunks are indexed, so their size is measured
+        again once their ingestion job ends.
+
+        Args:
+            sessionId (str): The Gradio session hash.
+            source (str): The source of the chain.
+            chain (Any, optional): The chain expected in the entry. Nothing is done if another chain replaced it.
+        """
+        key = (sessionId, source)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or (chain is not None and entry.chain is not chain):
+            return
+        nbytes = self.sizeOf(entry.chain)
+        with self.lock:
+            if self.entries.get(key) is not entry:
+                return
+            self.bytesHeld += nbytes - entry.nbytes
+            entry.nbytes = nbytes
+            self.evict()
+        self.report()
+
+    def evict(self) -> None:
+        """Evict the least recently used entries while the indexes held exceed the cap. Expects the lock to be held."""
+        while self.bytesHeld > self.maxBytes and len(self.entries) > 1:
+            oldestKey = next(iter(self.entries))
+            self.remove(oldestKey)
+            self.evictions += 1
+            logger.info(f"Evicted chain for source '{oldestKey[1]}' from the chain registry")
+
+    def report(self) -> None:
+        """Export and log the registry statistics."""
+        stats = self.stats()
+        metrics.setGauge("conversai_registry_bytes", stats["bytesHeld"], help="Memory held by the indexes of registered chains.")
+        metrics.setGauge("conversai_registry_entries", stats["entries"], help="Chains held by the registry.")
+        logger.info(f"Chain registry: {stats}")
+
+    def drop(self, sessionId: str, source: str = None) -> None:
+        """
+        Release the chains of a session.
+
+        Args:
+            sessionId (str): The Gradio session hash.
+            source (str, optional): The source to release. Releases every source of the session if None.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == sessionId and source in (None, key[1])]:
+                self.remove(key)
+
+    def stats(self) -> dict:
+        """
+        Return the registry statistics.
+
+        Returns:
+            dict: Hits, misses, evictions, number of entries and bytes held.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytesHeld": self.bytesHeld
+        }
+
+    def expire(self) -> None:
+        """Evict the entries idle for longer than the TTL. Expects the lock to be held."""
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if now - entry.lastAccess > self.ttl]:
+            self.remove(key)
+            self.evictions += 1
+
+    def remove(self, key: tuple[str, str]) -> None:
+        """Remove an entry and release its bytes. Expects the lock to be held."""
+        entry = self.entries.pop(key)
+        self.bytesHeld -= entry.nbytes
@@ -1,81 +1,471 @@
 from src.components.loaders.websiteCrawler import WebsiteCrawler
 from src.components.loaders.youtubeLoader import YoutubeTranscriptLoader
 from src.components.loaders.pdfLoader import PdfLoader
-from src.components.rag.RAG import Chain
+from src.components.vectors.metadataFilter import validateFilter
+from src.components.vectors.numpyIndex import NumpyVectorIndex
+from src.utils.functions import getFingerprint, getFileFingerprint
+from langchain_community.docstore.document import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.embeddings import Embeddings
+from src.components.rag.RAG import BatchAnswer, Chain
+from src.pipelines.ingestionJobs import IngestionJob
+from src.utils.logging import logger
+from typing import Callable, Iterable, Iterator
+import time
 
 class Pipeline:
-    def __init__(self):
-        """Initialize the Pipeline with loaders and the RAG chain."""
-        self.pdfLoader = PdfLoader()
+    def __init__(self, embeddings: Embeddings = None, llm: BaseChatModel = None, ocrReader=None):
+        """
+        Initialize the Pipeline with loaders and the RAG chain.
+
+        The models are built from the configuration unless given, e.g. by the offline benchmarks.
+
+        Args:
+            embeddings (Embeddings, optional): The embedding model to use instead of the [EMBEDDINGS] model.
+            llm (BaseChatModel, optional): The chat model to use instead of the [LLM] Groq model.
+            ocrReader (optional): An object with EasyOCR's readtext method to use instead of an EasyOCR reader.
+        """
+        self.pdfLoader = PdfLoader(reader=ocrReader)
         self.webCrawler = WebsiteCrawler()
         self.youtubeLoader = YoutubeTranscriptLoader()
-        self.ragChain = Chain()
+        self.ragChain = Chain(embeddings=embeddings, llm=llm)
+
+    def getChain(self, sourceKey: str, extract: Callable[[], Iterable[Document]], job: IngestionJob = None, stage: str = "documents"):
+        """
+        Return a chain over the persisted index of a source, extracting and indexing it when missing.
+
+        Args:
+            sourceKey (str): The fingerprint of the source.
+            extract (Callable[[], Iterable[Document]]): A function returning the documents of the source,
+                possibly as a lazy loader consumed while embedding.
+            job (IngestionJob, optional): The background job building the chain. It receives the chain as
+                soon as its index exists, counts the documents loaded under the stage name and the chunks
+                embedded, and can cancel the ingestion.
+            stage (str): The progress stage counting the documents loaded, e.g. "pages" or "urls".
+
+        Returns:
+            Chain: The processed chain for the source.
+        """
+        chain = self.ragChain.loadChain(sourceKey=sourceKey)
+        if chain is not None:
+            if job is not None:
+                job.setChain(chain)
+            return chain
+        if job is None:
+            return self.ragChain.returnChain(documents=extract(), sourceKey=sourceKey)
+        return self.ragChain.returnChain(
+            documents=job.track(stage, extract()),
+            sourceKey=sourceKey,
+            onChain=job.setChain,
+            onBatch=job.onBatch,
+            cancel=job.cancelled
+        )
+
+    def textSourceKey(self, text: str) -> str:
+        """Return the key of the persisted index of a text."""
+        return getFingerprint("text", text)
+
+    def pdfSourceKey(self, paths: list[str], mode: str) -> str:
+        """Return the key of the persisted index of PDF files extracted with a mode."""
+        return getFingerprint(mode, *sorted(getFileFingerprint(path) for path in paths))
+
+    def webSourceKey(self, urls: list[str]) -> str:
+        """Return the key of the persisted index of web pages."""
+        return getFingerprint("web", *sorted(self.webCrawler.normalizeUrl(url) for url in urls))
+
+    def youtubeSourceKey(self, urls: list[str]) -> str:
+        """Return the key of the persisted index of YouTube videos."""
+        return getFingerprint("youtube", *sorted(set(self.youtubeLoader.getVideoId(url) or url for url in urls)))
+
+    def loadTextDocuments(self, text: str) -> list[Document]:
+        """
+        Wrap plain text into a document tagged with its fingerprint as source.
+
+        Args:
+            text (str): The input text.
+
+        Returns:
+            list[Document]: The text document, with its "sourceType" and "ingestedAt" metadata.
+        """
+        return [Document(page_content=text, metadata={"source": getFingerprint(text), "sourceType": "text", "ingestedAt": time.time()})]
+
+    def loadPdfDocuments(self, paths: list[str], mode: str) -> Iterator[Document]:
+        """
+        Load PDF files page by page into documents tagged with their content fingerprint as source.
+
+        Args:
+            paths (list[str]): The paths to the PDF files.
+            mode (str): The extraction mode: "searchablePdf", "scannablePdf" or "autoPdf".
+
+        Yields:
+            Document: One document per page, with its "path", "page", "sourceType" and "ingestedAt" metadata.
+        """
+        for path in paths:
+            source = getFileFingerprint(path)
+            for document in self.pdfLoader.loadPages(pdfPath=path, mode=mode):
+                document.metadata.update(source=source, sourceType="pdf", ingestedAt=time.time())
+                yield document
 
-    def plainText(self, text: str):
+    def loadUrlDocuments(self, urls: list[str]) -> Iterator[Document]:
+        """
+        Load web pages concurrently into documents tagged with their normalized URL as source.
+
+        Args:
+            urls (list[str]): The URLs of the pages.
+
+        Yields:
+            Document: One document per page loaded, with its "url", "sourceType" and "ingestedAt" metadata.
+        """
+        for document in self.webCrawler.loadUrls(urls=urls):
+            document.metadata.update(source=document.metadata["url"], sourceType="web", ingestedAt=time.time())
+            yield document
+
+    def loadYoutubeDocuments(self, urls: list[str]) -> Iterator[Document]:
+        """
+        Load YouTube transcripts concurrently into documents tagged with their video ID as source.
+
+        Args:
+            urls (list[str]): YouTube URLs in any form.
+
+        Yields:
+            Document: One document per transcript fetched, with its "videoId", "url", "sourceType" and "ingestedAt" metadata.
+        """
+        for document in self.youtubeLoader.loadTranscripts(urls=urls):
+            videoId = document.metadata["videoId"]
+            document.metadata.update(source=videoId, url=f"https://www.youtube.com/watch?v={videoId}", sourceType="youtube", ingestedAt=time.time())
+            yield document
+
+    def plainText(self, text: str, job: IngestionJob = None):
         """
         Process plain text through the RAG chain.
 
         Args:
             text (str): The input text to process.
+            job (IngestionJob, optional): The background job building the chain.
 
         Returns:
             Chain: The processed chain for the input text.
         """
-        chain = self.ragChain.returnChain(text=text)
-        return chain
+        return self.getChain(sourceKey=self.textSourceKey(text), extract=lambda: self.loadTextDocuments(text), job=job)
+
+    def pdfChain(self, paths: list[str], mode: str, job: IngestionJob = None):
+        """
+        Process PDF files with the given extraction mode.
 
-    def searchablePdf(self, path: str):
+        Args:
+            paths (list[str]): The paths to the PDF files.
+            mode (str): The PdfLoader method to extract with: "searchablePdf", "scannablePdf" or "autoPdf".
+            job (IngestionJob, optional): The background job building the chain.
+
+        Returns:
+            Chain: The processed chain from the extracted text.
+        """
+        if job is not None:
+            job.expect("pages", sum(self.pdfLoader.countPages(path) for path in paths))
+        return self.getChain(
+            sourceKey=self.pdfSourceKey(paths=paths, mode=mode),
+            extract=lambda: self.loadPdfDocuments(paths=paths, mode=mode),
+            job=job,
+            stage="pages"
+        )
+
+    def searchablePdf(self, path: str, job: IngestionJob = None):
         """
         Process a searchable PDF file.
 
         Args:
             path (str): The path to the PDF file.
+            job (IngestionJob, optional): The background job building the chain.
 
         Returns:
             Chain: The processed chain from the extracted text.
         """
-        extractedText = self.pdfLoader.searchablePdf(pdfPath=path)
-        chain = self.ragChain.returnChain(text=extractedText)
-        return chain
+        return self.pdfChain(paths=[path], mode="searchablePdf", job=job)
 
-    def scannablePdf(self, path: str):
+    def scannablePdf(self, path: str, job: IngestionJob = None):
         """
         Process a scannable PDF file.
 
         Args:
             path (str): The path to the PDF file.
+            job (IngestionJob, optional): The background job building the chain.
 
         Returns:
             Chain: The processed chain from the extracted text.
         """
-        extractedText = self.pdfLoader.scannablePdf(pdfPath=path)
-        chain = self.ragChain.returnChain(text=extractedText)
-        return chain
-    
-    def webCrawl(self, urls: list[str]):
+        return self.pdfChain(paths=[path], mode="scannablePdf", job=job)
+
+    def autoPdf(self, paths: list[str], job: IngestionJob = None):
+        """
+        Process PDF files, OCR'ing only the pages without a text layer.
+
+        Args:
+            paths (list[str]): The paths to the PDF files.
+            job (IngestionJob, optional): The background job building the chain.
+
+        Returns:
+            Chain: The processed chain from the extracted text.
+        """
+        return self.pdfChain(paths=paths, mode="autoPdf", job=job)
+
+    def webCrawl(self, urls: list[str], job: IngestionJob = None):
         """
         Crawl the web for text extraction from provided URLs.
 
         Args:
             urls (list[str]): A list of URLs to crawl.
+            job (IngestionJob, optional): The background job building the chain.
 
         Returns:
             Chain: The processed chain from the extracted text.
         """
-        extractedText = self.webCrawler.extractTextFromUrlList(urls=urls)
-        chain = self.ragChain.returnChain(text=extractedText)
-        return chain     
-    
-    def youtubeLinks(self, urls: list[str]):
+        if job is not None:
+            job.expect("urls", len(urls))
+        return self.getChain(
+            sourceKey=self.webSourceKey(urls=urls),
+            extract=lambda: self.loadUrlDocuments(urls=urls),
+            job=job,
+            stage="urls"
+        )
+
+    def youtubeLinks(self, urls: list[str], job: IngestionJob = None):
         """
         Extract transcripts from YouTube links.
 
         Args:
             urls (list[str]): A list of YouTube video URLs.
+            job (IngestionJob, optional): The background job building the chain.
 
         Returns:
             Chain: The processed chain from the extracted transcripts.
         """
-        extractedText = self.youtubeLoader.getTranscripts(urls=urls)
-        chain = self.ragChain.returnChain(text=extractedText)
-        return chain
\ No newline at end of file
+        if job is not None:
+            job.expect("videos", len(urls))
+        return self.getChain(
+            sourceKey=self.youtubeSourceKey(urls=urls),
+            extract=lambda: self.loadYoutubeDocuments(urls=urls),
+            job=job,
+            stage="videos"
+        )
+
+    def getSources(self, chain) -> list[str]:
+        """
+        List the sources indexed by a chain.
+
+        Args:
+            chain: A chain returned by one of the pipeline methods.
+
+        Returns:
+            list[str]: The source IDs: text fingerprints, PDF content fingerprints, normalized URLs or video IDs.
+        """
+        return list(self.ragChain.store.getChunkSources(retriever=self.ragChain.getRetriever(chain)))
+
+    def addDocuments(self, chain, documents: Iterable[Document]) -> int:
+        """
+        Embed documents and add them to the live index of a chain.
+
+        Args:
+            chain: A chain returned by one of the pipeline methods.
+            documents (Iterable[Document]): The documents to add, tagged with their "source" metadata.
+
+        Returns:
+            int: The number of chunks added.
+        """
+        return self.ragChain.store.addDocuments(retriever=self.ragChain.getRetriever(chain), documents=documents)
+
+    def removeSources(self, chain, sources: list[str]) -> int:
+        """
+        Drop sources from the live index of a chain.
+
+        Args:
+            chain: A chain returned by one of the pipeline methods.
+            sources (list[str]): The source IDs to remove.
+
+        Returns:
+            int: The number of chunks removed.
+        """
+        return self.ragChain.store.removeSources(retriever=self.ragChain.getRetriever(chain), sources=sources)
+
+    def syncSources(self, chain, sources: list[str], load: Callable[[list[str]], Iterable[Document]]) -> None:
+        """
+        Make the index of a chain hold exactly the given sources, loading only the new ones.
+
+        Args:
+            chain: A chain returned by one of the pipeline methods.
+            sources (list[str]): The source IDs the index must hold.
+            load (Callable[[list[str]], Iterable[Document]]): A function loading the documents of new source IDs.
+        """
+        current = set(self.getSources(chain))
+        removed = self.removeSources(chain, sources=[source for source in current if source not in sources])
+        newSources = [source for source in dict.fromkeys(sources) if source not in current]
+        added = self.addDocuments(chain, documents=load(newSources)) if newSources else 0
+        logger.info(f"Index updated: {added} chunks added from {len(newSources)} sources, {removed} chunks removed")
+
+    def updateText(self, chain, text: str) -> None:
+        """
+        Replace the text indexed by a chain, keeping the chain live.
+
+        Args:
+            chain: A chain returned by plainText.
+            text (str): The new input text.
+        """
+        self.syncSources(chain, sources=[getFingerprint(text)], load=lambda _: self.loadTextDocuments(text))
+
+    def updatePdfs(self, chain, paths: list[str], mode: str) -> None:
+        """
+        Make the index of a chain hold exactly the given PDF files, extracting only new ones.
+
+        Args:
+            chain: A chain returned by one of the PDF pipeline methods.
+            paths (list[str]): The paths to the PDF files.
+            mode (str): The PdfLoader method to extract with: "searchablePdf", "scannablePdf" or "autoPdf".
+        """
+        pathsBySource = {getFileFingerprint(path): path for path in paths}
+        self.syncSources(
+            chain,
+            sources=list(pathsBySource),
+            load=lambda sources: self.loadPdfDocuments(paths=[pathsBySource[source] for source in sources], mode=mode)
+        )
+
+    def updateUrls(self, chain, urls: list[str]) -> None:
+        """
+        Make the index of a chain hold exactly the given web pages, fetching only new ones.
+
+        Args:
+            chain: A chain returned by webCrawl.
+            urls (list[str]): The URLs of the pages.
+        """
+        self.syncSources(chain, sources=[self.webCrawler.normalizeUrl(url) for url in urls], load=lambda sources: self.loadUrlDocuments(urls=sources))
+
+    def updateYoutube(self, chain, urls: list[str]) -> None:
+        """
+        Make the index of a chain hold exactly the given YouTube videos, fetching only new ones.
+
+        Args:
+            chain: A chain returned by youtubeLinks.
+            urls (list[str]): YouTube URLs in any form.
+        """
+        self.syncSources(
+            chain,
+            sources=[self.youtubeLoader.getVideoId(url) or url for url in urls],
+            load=lambda sources: self.loadYoutubeDocuments(urls=sources)
+        )
+
+    @staticmethod
+    def replaceSources(index: NumpyVectorIndex, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Yield documents, first dropping the chunks an index already holds for the source of each.
+
+        Args:
+            index (NumpyVectorIndex): The index the documents are added to.
+            documents (Iterable[Document]): The documents, tagged with their "source" metadata.
+
+        Yields:
+            Document: The documents.
+        """
+        with index.lock:
+            held = set(index.sourceCounts)
+        for document in documents:
+            source = document.metadata.get("source")
+            if source in held:
+                held.discard(source)
+                with index.lock:
+                    ids = [chunkId for chunkId, metadata in zip(index.ids, index.metadatas) if metadata.get("source") == source]
+                index.delete(ids=ids)
+            yield document
+
+    def addToCollection(self, name: str, documents: Iterable[Document], job: IngestionJob = None, stage: str = "documents") -> int:
+        """
+        Ingest documents of any source type into a named collection and persist it.
+
+        A source ingested again replaces the chunks the collection held for it.
+
+        Args:
+            name (str): The collection name. The collection is created when missing.
+            documents (Iterable[Document]): The documents, e.g. from loadPdfDocuments, loadUrlDocuments,
+                loadYoutubeDocuments or loadTextDocuments, which tag them with their source metadata.
+            job (IngestionJob, optional): The background job ingesting the documents. It receives a chain
+                over the collection, counts the documents under the stage name and can cancel the ingestion.
+            stage (str): The progress stage counting the documents loaded, e.g. "pages" or "urls".
+
+        Returns:
+            int: The number of chunks added.
+        """
+        store = self.ragChain.store
+        with store.collections.writing(name) as index:
+            documents = self.replaceSources(index, documents)
+            if job is None:
+                return store.ingest(index, documents)
+            job.setChain(self.collectionChain(name))
+            return store.ingest(index, job.track(stage, documents), onBatch=job.onBatch, cancel=job.cancelled)
+
+    def collectionChain(self, name: str, filter: dict = None):
+        """
+        Return a chain answering from a collection, retrieving only the chunks matching a metadata filter.
+
+        Args:
+            name (str): The collection name.
+            filter (dict, optional): The conditions on the chunk metadata, e.g. {"sourceType": "pdf"},
+                {"source": [...]}, {"url": url} or {"ingestedAt": {"$gte": timestamp}}. They select the
+                chunks to score inside the index, so a narrow filter makes retrieval cheaper.
+
+        Returns:
+            Chain: The chain, or None if the collection does not exist.
+
+        Raises:
+            ValueError: If the name or the filter is invalid.
+        """
+        if filter:
+            validateFilter(filter)
+        index = self.ragChain.store.collections.open(name)
+        if index is None:
+            return None
+        return self.ragChain.buildChain(retriever=self.ragChain.store.createRetriever(index, filter=filter))
+
+    def removeFromCollection(self, name: str, sources: list[str]) -> int:
+        """
+        Drop sources from a collection and persist it.
+
+        Args:
+            name (str): The collection name.
+            sources (list[str]): The source IDs to remove.
+
+        Returns:
+            int: The number of chunks removed.
+        """
+        store = self.ragChain.store
+        with store.collections.writing(name) as index:
+            return store.removeSources(retriever=store.createRetriever(index), sources=sources)
+
+    def listCollections(self) -> list[dict]:
+        """List the saved collections with their number of chunks and last update time."""
+        return self.ragChain.store.collections.list()
+
+    def deleteCollection(self, name: str) -> bool:
+        """Delete a collection, returning whether it existed."""
+        return self.ragChain.store.collections.delete(name)
+
+    def indexBytes(self, chain) -> int:
+        """
+        Estimate the memory held by the index of a chain.
+
+        Args:
+            chain: A chain returned by one of the pipeline methods.
+
+        Returns:
+            int: The estimated size of the index in bytes.
+        """
+        return self.ragChain.store.getIndexBytes(retriever=self.ragChain.getRetriever(chain))
+
+    def answerQuestions(self, chain, questions: list[str]) -> list[BatchAnswer]:
+        """
+        Answer a batch of questions against the documents of a chain.
+
+        Args:
+            chain: A chain returned by one of the chain builders.
+            questions (list[str]): The questions to be answered.
+
+        Returns:
+            list[BatchAnswer]: The answer or the error of each question, in question order.
+        """
+        return self.ragChain.answerBatch(chain=chain, questions=questions)
@@ -0,0 +1,239 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.exceptions import CustomException
+from src.utils.tracing import metrics, tracer
+from dataclasses import dataclass, field
+from src.utils.logging import logger
+from typing import Any, Callable, Iterable, Iterator
+import threading
+import uuid
+import time
+
+class IngestionQueueFull(Exception):
+    """Raised when an ingestion job is submitted while the queue holds its maximum of waiting jobs."""
+
+@dataclass
+class IngestionJob:
+    jobId: str
+    name: str
+    key: tuple = None
+    fingerprint: str = None
+    status: str = "queued"
+    progress: dict = field(default_factory=dict)
+    totals: dict = field(default_factory=dict)
+    chain: Any = None
+    error: str = None
+    createdAt: float = field(default_factory=time.time)
+    startedAt: float = None
+    finishedAt: float = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    queryable: threading.Event = field(default_factory=threading.Event)
+    callbacks: list = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def active(self) -> bool:
+        """Return whether the job is queued or running."""
+        return self.status in ("queued", "running")
+
+    def expect(self, stage: str, total: int) -> None:
+        """Set the number of items a stage is expected to process."""
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0) + total
+
+    def advance(self, stage: str, count: int = 1) -> None:
+        """Count items processed by a stage."""
+        with self.lock:
+            self.progress[stage] = self.progress.get(stage, 0) + count
+
+    def track(self, stage: str, items: Iterable) -> Iterator:
+        """
+        Count the items of an iterable as a stage consumes them, stopping once the job is cancelled.
+
+        Args:
+            stage (str): The stage name, e.g. "pages" or "urls".
+            items (Iterable): The items.
+
+        Yields:
+            The items.
+        """
+        for item in items:
+            if self.cancelled.is_set():
+                return
+            self.advance(stage)
+            yield item
+
+    def setChain(self, chain) -> None:
+        """Keep the chain over the index being filled."""
+        self.chain = chain
+
+    def onBatch(self, count: int) -> None:
+        """Count embedded chunks, making the chain queryable after the first batch."""
+        self.advance("chunks", count)
+        self.queryable.set()
+
+    def cancel(self) -> None:
+        """Ask the job to stop at its next batch or document."""
+        self.cancelled.set()
+
+    def whenFinished(self, callback: Callable[["IngestionJob"], None]) -> None:
+        """
+        Call a function with the job once it ended, whatever its outcome, or at once if it already has.
+
+        Args:
+            callback (Callable[[IngestionJob], None]): The function.
+        """
+        with self.lock:
+            if self.finishedAt is None:
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self) -> None:
+        """Mark the job as ended and call the functions waiting for it."""
+        with self.lock:
+            self.finishedAt = time.time()
+            callbacks, self.callbacks = self.callbacks, []
+        self.queryable.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(CustomException(e))
+
+    def waitUntilQueryable(self, timeout: float = None):
+        """
+        Wait until the chain of the job holds its first chunks, or the job ended.
+
+        Args:
+            timeout (float, optional): The longest time to wait, in seconds.
+
+        Returns:
+            Chain: The chain of the job, or None if it has none yet or the job failed.
+        """
+        self.queryable.wait(timeout=timeout)
+        return self.chain
+
+    def describe(self) -> str:
+        """Summarize the progress of the job, e.g. "12/80 pages, 150 chunks"."""
+        with self.lock:
+            return ", ".join(
+                f"{count}/{self.totals[stage]} {stage}" if stage in self.totals else f"{count} {stage}"
+                for stage, count in self.progress.items()
+            ) or self.status
+
+class IngestionQueue:
+    def __init__(self, workers: int, maxQueued: int, keepFinishedMinutes: float) -> None:
+        """
+        Initialize a queue running ingestion jobs on a bounded pool of background workers.
+
+        Args:
+            workers (int): The number of jobs running at once.
+            maxQueued (int): The number of jobs allowed to wait for a worker before submissions are refused.
+            keepFinishedMinutes (float): How long finished jobs stay available for status queries, in minutes.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        self.maxQueued = maxQueued
+        self.keepFinished = keepFinishedMinutes * 60
+        self.jobs: dict[str, IngestionJob] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name: str, run: Callable[[IngestionJob], Any], key: tuple = None, fingerprint: str = None) -> IngestionJob:
+        """
+        Queue an ingestion job.
+
+        Args:
+            name (str): The kind of job, e.g. "autoPdf", used in logs and metrics.
+            run (Callable[[IngestionJob], Any]): A function ingesting the source and returning its chain.
+                It reports progress through the job and publishes the chain with setChain once queryable.
+            key (tuple, optional): The owner of the job, e.g. a session and source.
+            fingerprint (str, optional): A fingerprint of the input of the job.
+
+        Returns:
+            IngestionJob: The queued job.
+
+        Raises:
+            IngestionQueueFull: If maxQueued jobs are already waiting.
+        """
+        with self.lock:
+            self.prune()
+            waiting = sum(job.status == "queued" for job in self.jobs.values())
+            if waiting >= self.maxQueued:
+                metrics.increment("conversai_ingestion_jobs_total", {"status": "rejected"}, help="Ingestion jobs by outcome.")
+                raise IngestionQueueFull(f"{waiting} ingestion jobs are already waiting")
+            job = IngestionJob(jobId=uuid.uuid4().hex, name=name, key=key, fingerprint=fingerprint)
+            self.jobs[job.jobId] = job
+        self.executor.submit(self.runJob, job, run)
+        self.updateGauges()
+        logger.info(f"Queued ingestion job {job.jobId} ({name})")
+        return job
+
+    def runJob(self, job: IngestionJob, run: Callable[[IngestionJob], Any]) -> None:
+        """Run a job, recording its outcome."""
+        try:
+            if job.cancelled.is_set():
+                job.status = "cancelled"
+                return
+            job.status, job.startedAt = "running", time.time()
+            self.updateGauges()
+            with tracer.span(f"job.{job.name}"):
+                chain = run(job)
+            if job.cancelled.is_set():
+                job.status = "cancelled"
+            elif chain is None:
+                job.status, job.error, job.chain = "failed", "The source could not be ingested", None
+            else:
+                job.chain = job.chain or chain
+                job.status = "done"
+        except Exception as e:
+            logger.error(CustomException(e))
+            job.status, job.error, job.chain = "failed", str(e), None
+        finally:
+            job.finish()
+            metrics.increment("conversai_ingestion_jobs_total", {"status": job.status})
+            self.updateGauges()
+            logger.info(f"Ingestion job {job.jobId} ({job.name}) {job.status} after {job.finishedAt - job.createdAt:.2f}s: {job.describe()}")
+
+    def get(self, jobId: str) -> IngestionJob:
+        """Return a job by ID, or None if unknown or pruned."""
+        return self.jobs.get(jobId)
+
+    def activeJobs(self) -> list[IngestionJob]:
+        """Return the queued and running jobs."""
+        with self.lock:
+            return [job for job in self.jobs.values() if job.active]
+
+    def findByKey(self, key: tuple) -> IngestionJob:
+        """Return the latest job of an owner, or None."""
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job.key == key]
+        return max(jobs, key=lambda job: job.createdAt) if jobs else None
+
+    def cancel(self, jobId: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        Args:
+            jobId (str): The ID of the job.
+
+        Returns:
+            bool: True if the job was active and is now cancelling.
+        """
+        job = self.jobs.get(jobId)
+        if job is None or not job.active:
+            return False
+        job.cancel()
+        logger.info(f"Cancelling ingestion job {jobId}")
+        return True
+
+    def prune(self) -> None:
+        """Forget jobs finished more than keepFinishedMinutes ago. Called with the lock held."""
+        now = time.time()
+        for jobId in [jobId for jobId, job in self.jobs.items() if job.finishedAt and now - job.finishedAt > self.keepFinished]:
+            del self.jobs[jobId]
+
+    def updateGauges(self) -> None:
+        """Export the number of queued and running jobs."""
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        for status in ("queued", "running"):
+            metrics.setGauge("conversai_ingestion_jobs", statuses.count(status), {"status": status}, help="Ingestion jobs queued or running.")
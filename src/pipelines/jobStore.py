@@ -0,0 +1,130 @@
+from src.pipelines.ingestionJobs import IngestionJob
+import threading
+import sqlite3
+import json
+import time
+import os
+
+class JobStore:
+    def __init__(self, path: str, staleSeconds: float) -> None:
+        """
+        Initialize a store of ingestion job states shared by worker processes, backed by SQLite.
+
+        Each worker records the jobs it runs with the address it serves them on, so that any worker
+        can report their progress, ask for their cancellation and forward queries about the sources
+        they are ingesting.
+
+        Args:
+            path (str): The file path of the SQLite database holding the jobs.
+            staleSeconds (float): The time after which an active job not updated by its worker is
+                reported as failed, its worker having stopped.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.staleSeconds = staleSeconds
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "jobId TEXT PRIMARY KEY, sourceKey TEXT, owner TEXT NOT NULL, status TEXT NOT NULL, progress TEXT NOT NULL, "
+            "totals TEXT NOT NULL, error TEXT, cancelRequested INTEGER NOT NULL DEFAULT 0, updatedAt REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idxJobsSourceKey ON jobs (sourceKey)")
+        self.connection.commit()
+
+    def put(self, job: IngestionJob, owner: str) -> None:
+        """
+        Record the state of a job.
+
+        Args:
+            job (IngestionJob): The job.
+            owner (str): The address of the worker running the job, as "host:port".
+        """
+        with job.lock:
+            progress, totals = json.dumps(job.progress), json.dumps(job.totals)
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?) ON CONFLICT (jobId) DO UPDATE SET "
+                "status = excluded.status, progress = excluded.progress, totals = excluded.totals, "
+                "error = excluded.error, updatedAt = excluded.updatedAt",
+                (job.jobId, job.fingerprint, owner, job.status, progress, totals, job.error, time.time())
+            )
+            self.connection.commit()
+
+    def get(self, jobId: str) -> dict:
+        """
+        Describe a job recorded by any worker.
+
+        Args:
+            jobId (str): The ID of the job.
+
+        Returns:
+            dict: The "jobId", "sourceKey", "status", "progress", "totals" and "error" of the job, or None
+                if it is unknown or pruned.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT jobId, sourceKey, status, progress, totals, error, updatedAt FROM jobs WHERE jobId = ?", (jobId,)
+            ).fetchone()
+        if row is None:
+            return None
+        jobId, sourceKey, status, progress, totals, error, updatedAt = row
+        if status in ("queued", "running") and time.time() - updatedAt > self.staleSeconds:
+            status, error = "failed", "The worker running the job stopped"
+        return {"jobId": jobId, "sourceKey": sourceKey, "status": status, "progress": json.loads(progress),
+                "totals": json.loads(totals), "error": error}
+
+    def findOwner(self, sourceKey: str) -> str:
+        """
+        Return the worker ingesting a source.
+
+        Args:
+            sourceKey (str): The source key of the job.
+
+        Returns:
+            str: The address of the worker running the latest active job of the source, or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT owner FROM jobs WHERE sourceKey = ? AND status IN ('queued', 'running') AND updatedAt > ? "
+                "ORDER BY updatedAt DESC LIMIT 1", (sourceKey, time.time() - self.staleSeconds)
+            ).fetchone()
+        return row[0] if row else None
+
+    def requestCancel(self, jobId: str) -> None:
+        """Ask the worker running a job to cancel it."""
+        with self.lock:
+            self.connection.execute("UPDATE jobs SET cancelRequested = 1 WHERE jobId = ?", (jobId,))
+            self.connection.commit()
+
+    def getCancelled(self, jobIds: list[str]) -> list[str]:
+        """
+        Return the jobs whose cancellation was requested.
+
+        Args:
+            jobIds (list[str]): The IDs of the jobs to check.
+
+        Returns:
+            list[str]: The IDs of those to cancel.
+        """
+        if not jobIds:
+            return []
+        placeholders = ",".join("?" * len(jobIds))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT jobId FROM jobs WHERE cancelRequested = 1 AND jobId IN ({placeholders})", jobIds
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def prune(self, olderThan: float) -> None:
+        """
+        Forget the jobs not updated for a time: finished jobs, and jobs of workers that stopped.
+
+        Args:
+            olderThan (float): The time since the last update, in seconds.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM jobs WHERE updatedAt < ?", (time.time() - olderThan,))
+            self.connection.commit()
@@ -1,21 +1,41 @@
 import configparser
+import functools
+import hashlib
 import string
 import yaml
+import os
 
-def getConfig(path: str):
+@functools.lru_cache(maxsize=16)
+def readConfig(path: str, modified: float):
     """
-    Load configuration from a specified file.
+    Parse a configuration file once per path and modification time.
 
     Args:
-        path (str): The path to the configuration file.
+        path (str): The absolute path to the configuration file.
+        modified (float): The modification time of the file, so that edits are picked up.
 
     Returns:
-        ConfigParser: The loaded configuration object.
+        ConfigParser: The parsed configuration object.
     """
     config = configparser.ConfigParser()
     config.read(path)
     return config
 
+def getConfig(path: str):
+    """
+    Load configuration from a specified file, parsing it only once for all components.
+
+    The returned object is shared and must not be modified.
+
+    Args:
+        path (str): The path to the configuration file.
+
+    Returns:
+        ConfigParser: The loaded configuration object.
+    """
+    path = os.path.abspath(path)
+    return readConfig(path, os.path.getmtime(path) if os.path.exists(path) else None)
+
 def cleanText(text: str):
     """
     Clean the input text by removing newline characters and punctuation.
@@ -41,4 +61,37 @@ def loadYaml(path: str):
         dict: The parsed content of the YAML file.
     """
     with open(path) as file:
-        return yaml.safe_load(file)
\ No newline at end of file
+        return yaml.safe_load(file)
+
+def getFingerprint(*parts: str):
+    """
+    Compute a stable fingerprint of the given string parts.
+
+    Args:
+        *parts (str): The strings to fingerprint.
+
+    Returns:
+        str: The hex digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def getFileFingerprint(path: str):
+    """
+    Compute a fingerprint of the content of a file.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
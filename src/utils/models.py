@@ -0,0 +1,150 @@
+from langchain_core.embeddings import Embeddings
+from src.utils.exceptions import CustomException
+from src.utils.functions import getConfig
+from src.utils.tracing import metrics
+from src.utils.logging import logger
+from typing import Any, Callable
+import threading
+import time
+
+class LazyModel:
+    def __init__(self, name: str, factory: Callable[[], Any]) -> None:
+        """
+        Initialize a model shared by all components and built on first use.
+
+        Args:
+            name (str): The name of the model, used in logs and metrics.
+            factory (Callable[[], Any]): A function building the model.
+        """
+        self.name = name
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.instance = None
+
+    def get(self) -> Any:
+        """
+        Return the model, building it on the first call. Concurrent callers wait for the same build.
+
+        Returns:
+            Any: The model.
+        """
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    try:
+                        logger.info(f"Loading model '{self.name}'")
+                        start = time.perf_counter()
+                        self.instance = self.factory()
+                        seconds = time.perf_counter() - start
+                        metrics.setGauge("conversai_model_load_seconds", seconds, {"model": self.name}, "Time taken to load the models in seconds.")
+                        metrics.setGauge("conversai_model_ready", 1, {"model": self.name}, "Whether the models are loaded.")
+                        self.ready.set()
+                        logger.info(f"Model '{self.name}' loaded in {seconds:.2f}s")
+                    except Exception as e:
+                        logger.error(CustomException(e))
+                        raise CustomException(e)
+        return self.instance
+
+    @property
+    def loaded(self) -> bool:
+        """Return whether the model has been built."""
+        return self.ready.is_set()
+
+class LazyEmbeddings(Embeddings):
+    def __init__(self, model: LazyModel) -> None:
+        """
+        Initialize embeddings delegating to a lazily loaded embedding model.
+
+        Args:
+            model (LazyModel): The embedding model.
+        """
+        self.model = model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents with the model, loading it if needed."""
+        return self.model.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query with the model, loading it if needed."""
+        return self.model.get().embed_query(text)
+
+def loadEmbeddingModel():
+    """
+    Build the HuggingFace embedding model configured under [EMBEDDINGS].
+
+    Returns:
+        HuggingFaceEmbeddings: The embedding model.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    config = getConfig(path="config.ini")
+    return HuggingFaceEmbeddings(
+        model_name=config.get("EMBEDDINGS", "embeddingModel"),
+        model_kwargs={"device": config.get("EMBEDDINGS", "device")},
+        encode_kwargs={"normalize_embeddings": config.getboolean("EMBEDDINGS", "normalize_embeddings")}
+    )
+
+def loadOcrReader():
+    """
+    Build the EasyOCR reader configured under [EASYOCR].
+
+    Returns:
+        easyocr.Reader: The OCR reader.
+    """
+    import easyocr
+    return easyocr.Reader(['en'], gpu=getConfig(path="config.ini").getboolean("EASYOCR", "gpu"))
+
+def loadLlmGateway():
+    """
+    Build the LLM gateway configured under [LLM] and [LLMGATEWAY].
+
+    Returns:
+        LLMGateway: The gateway.
+    """
+    from src.components.rag.llmGateway import LLMGateway
+    return LLMGateway.fromConfig(getConfig(path="config.ini"))
+
+embeddingModel = LazyModel(name="embeddings", factory=loadEmbeddingModel)
+ocrReader = LazyModel(name="easyocr", factory=loadOcrReader)
+llmGateway = LazyModel(name="llmGateway", factory=loadLlmGateway)
+MODELS = (embeddingModel, ocrReader)
+READINESS = (embeddingModel,)  # OCR is only needed for scanned PDFs and loads on first use otherwise
+
+def warmUp(models: tuple[LazyModel, ...] = MODELS) -> threading.Thread:
+    """
+    Load models in a background thread so that the first requests do not pay for it.
+
+    Requests needing a model still being loaded wait for that load instead of starting another.
+
+    Args:
+        models (tuple[LazyModel, ...]): The models to load, in order.
+
+    Returns:
+        threading.Thread: The warm-up thread.
+    """
+    def run() -> None:
+        start = time.perf_counter()
+        for model in models:
+            try:
+                model.get()
+            except CustomException:
+                pass  # Logged by get; the model is retried on first use
+        logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+    thread = threading.Thread(target=run, name="warmUp", daemon=True)
+    thread.start()
+    return thread
+
+def isReady(models: tuple[LazyModel, ...] = READINESS) -> bool:
+    """
+    Check whether models are loaded.
+
+    Only the embedding model is required by default, so a deployment without EasyOCR still becomes ready.
+
+    Args:
+        models (tuple[LazyModel, ...]): The models to check.
+
+    Returns:
+        bool: True when every model is loaded.
+    """
+    return all(model.loaded for model in models)
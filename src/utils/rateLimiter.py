@@ -0,0 +1,141 @@
+import threading
+import time
+import re
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parseDuration(value: str) -> float:
+    """
+    Parse a duration as sent in rate limit headers, e.g. "7.66s", "2m59.56s", "120ms" or "30".
+
+    Args:
+        value (str): The duration, a bare number counting seconds.
+
+    Returns:
+        float: The duration in seconds, or None if it cannot be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+class TokenBucket:
+    def __init__(self, tokensPerMinute: float) -> None:
+        """
+        Initialize a thread-safe token bucket refilling continuously up to one minute of tokens.
+
+        The configured rate and capacity are initial estimates: the rate limit state reported by a
+        server replaces them, whether above or below, and can pause the bucket.
+
+        Args:
+            tokensPerMinute (float): The sustained rate of tokens allowed per minute.
+        """
+        self.rate = tokensPerMinute / 60
+        self.capacity = tokensPerMinute
+        self.tokens = tokensPerMinute
+        self.pausedUntil = 0.0
+        self.updatedAt = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        """Add the tokens accrued since the last refill. Expects the lock to be held."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    def getDelay(self, tokens: float) -> float:
+        """Return the time until tokens can be taken. Expects the lock to be held and the bucket refilled."""
+        return max(self.pausedUntil - self.updatedAt, (tokens - self.tokens) / self.rate, 0.0)
+
+    def estimateWait(self, tokens: float) -> float:
+        """
+        Estimate the time a caller taking tokens now would wait, without taking them.
+
+        Args:
+            tokens (float): The number of tokens.
+
+        Returns:
+            float: The wait in seconds, behind the callers waiting already.
+        """
+        with self.lock:
+            self.refill()
+            return self.getDelay(min(tokens, self.capacity))
+
+    def acquire(self, tokens: float, timeout: float = None) -> float:
+        """
+        Take tokens from the bucket, blocking until enough have accrued.
+
+        The tokens are reserved at once, leaving the bucket in debt, so that concurrent callers are
+        served in turn. Requests larger than the bucket capacity are capped at it, so they wait for a
+        full bucket rather than forever.
+
+        Args:
+            tokens (float): The number of tokens to take.
+            timeout (float, optional): The longest time to wait, in seconds.
+
+        Returns:
+            float: The time spent waiting, in seconds.
+
+        Raises:
+            TimeoutError: If the tokens would not accrue within the timeout. No tokens are taken.
+        """
+        with self.lock:
+            self.refill()
+            needed = min(tokens, self.capacity)
+            delay = self.getDelay(needed)
+            if timeout is not None and delay > timeout:
+                raise TimeoutError(f"Rate limit wait of {delay:.2f}s exceeds the {timeout:.2f}s allowed")
+            self.tokens -= needed
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def release(self, tokens: float) -> None:
+        """
+        Give back tokens taken for a call that was not sent.
+
+        Args:
+            tokens (float): The number of tokens taken.
+        """
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def update(self, remaining: float, limit: float = None, resetSeconds: float = None) -> None:
+        """
+        Align the bucket with the rate limit state reported by a server.
+
+        The tokens left are lowered to the remaining budget, the capacity is set to the limit, and the
+        rate to the one refilling the budget to the limit by the reset time, as servers running token
+        buckets report it. A full budget says nothing of the rate, which is then kept.
+
+        Args:
+            remaining (float): The budget left.
+            limit (float, optional): The size of the budget.
+            resetSeconds (float, optional): The time until the budget is back to its limit.
+        """
+        with self.lock:
+            self.refill()
+            if limit:
+                self.capacity = limit
+                if resetSeconds and limit > remaining:
+                    self.rate = (limit - remaining) / resetSeconds
+            self.tokens = min(self.tokens, self.capacity, remaining)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every caller for a time, as asked by a server refusing requests.
+
+        Args:
+            seconds (float): The time to pause for.
+        """
+        with self.lock:
+            self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
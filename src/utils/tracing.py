@@ -0,0 +1,376 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from langchain_core.callbacks import BaseCallbackHandler
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.utils.logging import logger
+from typing import Any, Callable, Iterator
+from collections import defaultdict
+from dataclasses import dataclass, field
+import functools
+import threading
+import inspect
+import bisect
+import time
+
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+@dataclass
+class Span:
+    name: str
+    parent: "Span" = None
+    attributes: dict = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+    end: float = None
+    error: bool = False
+    children: list = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        """Return the duration of the span in seconds, up to now if it is still open."""
+        return (self.end or time.perf_counter()) - self.start
+
+currentSpan: ContextVar[Span] = ContextVar("currentSpan", default=None)
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        """Initialize a thread-safe registry of counters, gauges and histograms exposed in Prometheus text format."""
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self.histograms: dict[str, dict[tuple, list]] = defaultdict(dict)
+        self.buckets: dict[str, tuple] = {}
+        self.help: dict[str, str] = {}
+
+    def increment(self, name: str, labels: dict = None, value: float = 1.0, help: str = "") -> None:
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The metric name.
+            labels (dict, optional): The labels of the series.
+            value (float): The amount to add.
+            help (str): The description of the metric.
+        """
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            self.counters[name][key] += value
+            self.help.setdefault(name, help)
+
+    def setGauge(self, name: str, value: float, labels: dict = None, help: str = "") -> None:
+        """Set a gauge to a value."""
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            self.gauges[name][key] = value
+            self.help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, labels: dict = None, help: str = "", buckets: tuple = HISTOGRAM_BUCKETS) -> None:
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name (str): The metric name.
+            value (float): The observed value, in seconds for durations.
+            labels (dict, optional): The labels of the series.
+            help (str): The description of the metric.
+            buckets (tuple): The upper bounds of the buckets, fixed by the first observation of the metric.
+        """
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            buckets = self.buckets.setdefault(name, buckets)
+            series = self.histograms[name].setdefault(key, [[0] * (len(buckets) + 1), 0.0, 0])
+            series[0][bisect.bisect_left(buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+            self.help.setdefault(name, help)
+
+    @staticmethod
+    def formatLabels(key: tuple, extra: tuple = ()) -> str:
+        """Format label pairs as a Prometheus label set."""
+        pairs = [*key, *extra]
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics text.
+        """
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} {kind}"]
+                    lines += [f"{name}{self.formatLabels(key)} {value}" for key, value in series.items()]
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {self.help.get(name, '')}", f"# TYPE {name} histogram"]
+                for key, (buckets, total, count) in series.items():
+                    cumulative = 0
+                    for bound, bucketCount in zip((*self.buckets[name], "+Inf"), buckets):
+                        cumulative += bucketCount
+                        lines.append(f"{name}_bucket{self.formatLabels(key, (('le', bound),))} {cumulative}")
+                    lines += [f"{name}_sum{self.formatLabels(key)} {total}", f"{name}_count{self.formatLabels(key)} {count}"]
+        return "\n".join(lines) + "\n"
+
+class Tracer:
+    def __init__(self, metrics: MetricsRegistry, slowRequestSeconds: float = 5.0) -> None:
+        """
+        Initialize a tracer recording nested spans per request.
+
+        The current span is held in a context variable, so spans opened while another is open become
+        its children. Every finished span is observed in the conversai_stage_seconds histogram, and
+        root spans, the requests, in conversai_request_seconds. Requests slower than
+        slowRequestSeconds are logged with the time spent in each stage.
+
+        Args:
+            metrics (MetricsRegistry): The registry the span durations are recorded in.
+            slowRequestSeconds (float): The duration beyond which a request is logged as slow.
+        """
+        self.metrics = metrics
+        self.slowRequestSeconds = slowRequestSeconds
+
+    def configure(self, slowRequestSeconds: float) -> None:
+        """Set the duration beyond which a request is logged as slow."""
+        self.slowRequestSeconds = slowRequestSeconds
+
+    def open(self, name: str, parent: Span = None, **attributes: Any) -> Span:
+        """Open a span as a child of the given span, or of the current one."""
+        span = Span(name=name, parent=parent or currentSpan.get(), attributes=attributes)
+        if span.parent is not None:
+            span.parent.children.append(span)
+        return span
+
+    def finish(self, span: Span) -> None:
+        """Close a span and record its duration."""
+        span.end = time.perf_counter()
+        labels = {"stage": span.name}
+        self.metrics.observe("conversai_stage_seconds", span.duration, labels, help="Duration of pipeline stages in seconds.")
+        if span.error:
+            self.metrics.increment("conversai_stage_errors_total", labels, help="Pipeline stages that raised.")
+        if span.parent is not None:
+            return
+        status = "error" if span.error else "ok"
+        self.metrics.observe("conversai_request_seconds", span.duration, {"request": span.name}, help="Duration of requests in seconds.")
+        self.metrics.increment("conversai_requests_total", {"request": span.name, "status": status}, help="Requests handled.")
+        if span.duration >= self.slowRequestSeconds:
+            logger.warning(f"Slow request '{span.name}' took {span.duration:.2f}s: {self.formatBreakdown(span)}")
+
+    def formatBreakdown(self, root: Span) -> str:
+        """
+        Summarize the stages of a request.
+
+        Args:
+            root (Span): The span of the request.
+
+        Returns:
+            str: The summed duration and the number of spans of each stage, slowest first. Stages run
+                concurrently may sum to more than the request duration.
+        """
+        totals, counts = defaultdict(float), defaultdict(int)
+        pending = list(root.children)
+        while pending:
+            span = pending.pop()
+            totals[span.name] += span.duration
+            counts[span.name] += 1
+            pending.extend(span.children)
+        if not totals:
+            return "no stages recorded"
+        return ", ".join(f"{name} {totals[name]:.2f}s ({counts[name]})" for name in sorted(totals, key=totals.get, reverse=True))
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Time a block as a span nested in the current one.
+
+        Args:
+            name (str): The stage name, e.g. "pdf.ocr".
+            **attributes: Attributes of the span.
+
+        Yields:
+            Span: The open span.
+        """
+        span = self.open(name, **attributes)
+        token = currentSpan.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            currentSpan.reset(token)
+            self.finish(span)
+
+    def traceGenerator(self, name: str, generator: Iterator, **attributes: Any) -> Iterator:
+        """
+        Trace a generator as one span, entering the span around each step.
+
+        Unlike a span held open across yields, this stays correct when each step of the generator
+        runs in a different thread or context, as with Gradio's streaming handlers.
+
+        Args:
+            name (str): The stage name.
+            generator (Iterator): The generator to trace.
+            **attributes: Attributes of the span.
+
+        Yields:
+            The items of the generator.
+        """
+        span = self.open(name, **attributes)
+        try:
+            while True:
+                token = currentSpan.set(span)
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                except BaseException:
+                    span.error = True
+                    raise
+                finally:
+                    currentSpan.reset(token)
+                yield item
+        finally:
+            generator.close()
+            self.finish(span)
+
+    def traced(self, name: str) -> Callable:
+        """
+        Decorate a function or generator function so that each call is traced as a span.
+
+        Args:
+            name (str): The stage name.
+
+        Returns:
+            Callable: The decorator.
+        """
+        def decorator(function: Callable) -> Callable:
+            if inspect.isgeneratorfunction(function):
+                @functools.wraps(function)
+                def generatorWrapper(*args, **kwargs):
+                    yield from self.traceGenerator(name, function(*args, **kwargs))
+                return generatorWrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, function: Callable) -> Callable:
+        """
+        Bind a function to the current span, so that spans it opens in a worker thread nest under it.
+
+        Args:
+            function (Callable): The function to run in a thread pool.
+
+        Returns:
+            Callable: The function, entering the current span around each call.
+        """
+        parent = currentSpan.get()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            token = currentSpan.set(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                currentSpan.reset(token)
+        return wrapper
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, tracer: "Tracer") -> None:
+        """
+        Initialize a LangChain callback handler recording the retriever and LLM runs of a chain as spans.
+
+        The spans are nested under the span current when the handler is created, since LangChain may
+        run the steps of a chain in other threads.
+
+        Args:
+            tracer (Tracer): The tracer to record the spans with.
+        """
+        self.tracer = tracer
+        self.parent = currentSpan.get()
+        self.spans: dict = {}
+
+    def startSpan(self, runId, name: str) -> None:
+        """Open the span of a run."""
+        self.spans[runId] = self.tracer.open(name, parent=self.parent)
+
+    def endSpan(self, runId, error: bool = False) -> None:
+        """Close the span of a run."""
+        span = self.spans.pop(runId, None)
+        if span is not None:
+            span.error = error
+            self.tracer.finish(span)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs) -> None:
+        self.startSpan(run_id, "retrieve")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        self.endSpan(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self.endSpan(run_id, error=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self.startSpan(run_id, "llm")
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs) -> None:
+        span = self.spans.get(run_id)
+        if span is not None and "firstTokenSeconds" not in span.attributes:
+            span.attributes["firstTokenSeconds"] = time.perf_counter() - span.start
+            self.tracer.metrics.observe("conversai_llm_first_token_seconds", span.attributes["firstTokenSeconds"],
+                                        help="Time to the first LLM token in seconds.")
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self.endSpan(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self.endSpan(run_id, error=True)
+
+def startMetricsServer(host: str, port: int, readiness: Callable[[], bool] = None) -> ThreadingHTTPServer:
+    """
+    Serve the metrics in Prometheus text format at /metrics from a background thread.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        readiness (Callable[[], bool], optional): A check served at /ready, answering 200 when it
+            returns True and 503 otherwise, e.g. for load balancer readiness probes.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                status, contentType, body = 200, "text/plain; version=0.0.4; charset=utf-8", metrics.render()
+            elif path == "/ready" and readiness is not None:
+                ready = readiness()
+                status, contentType, body = (200 if ready else 503), "text/plain; charset=utf-8", ("ready" if ready else "loading")
+            else:
+                self.send_error(404)
+                return
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+    return server
+
+metrics = MetricsRegistry()
+tracer = Tracer(metrics=metrics)